@@ -3,4 +3,24 @@
 from ToolsNLP.mecab_wrapper import MecabWrapper
 from ToolsNLP.mecab_wrapper import TokenizerSentiment
 from ToolsNLP.mecab_wrapper import Tokenizer
-from ToolsNLP.topic_model import TopicModelWrapper
+from ToolsNLP.sentiment_lexicon import compile_sentiment_lexicon
+
+
+def __getattr__(name):
+    # topic_model imports gensim / pandas, so it is loaded on first access
+    if name in ('topic_model', 'TopicModelWrapper'):
+        import ToolsNLP.topic_model
+        return getattr(ToolsNLP.topic_model, name) if name == 'TopicModelWrapper' else ToolsNLP.topic_model
+    # token_store imports numpy
+    if name in ('TokenStore', 'Vocabulary'):
+        import ToolsNLP.token_store
+        return getattr(ToolsNLP.token_store, name)
+    # shard_corpus imports gensim / numpy
+    if name == 'Shards':
+        from ToolsNLP.shard_corpus import Shards
+        return Shards
+    # asyncio is only needed by the async front-end
+    if name == 'AsyncMecabWrapper':
+        from ToolsNLP.async_mecab import AsyncMecabWrapper
+        return AsyncMecabWrapper
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,228 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import asyncio
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ToolsNLP.mecab_wrapper import MecabWrapper
+
+
+class AsyncMecabWrapper:
+    '''
+    Description::
+        asyncio（aiohttpなど）のイベントループからMecabWrapperのtokenize, tokenize_sentimentを呼び出す
+        形態素解析（neologdnの正規化とMeCabの解析）はワーカー（起動時にMecabWrapperを生成済み）で実行し、イベントループをブロックしない
+        同時に届いたリクエストはまとめて（マイクロバッチ）1回でワーカーに渡す
+        全ワーカーが処理中の間に届いたリクエストは次のバッチにまとめる（負荷が低いときは待たずに1件で渡す）
+        処理中・待機中のリクエスト数がmax_pendingに達した場合は、空くまで呼び出し側を待たせる（バックプレッシャー）
+
+    :param workers:
+        ワーカー数
+        デフォルト：None（CPUコア数）
+    :param executor:
+        'process'：プロセスプール（MeCabの解析を複数コアで並列に実行する）
+        'thread'：スレッドプール（MecabWrapperを1つ共有し、Taggerはスレッドごと）
+        デフォルト：'process'
+    :param max_batch_size:
+        1回でワーカーに渡すリクエスト数の上限
+        デフォルト：32
+    :param max_batch_delay:
+        バッチの最初のリクエストが届いてから、後続のリクエストを待つ秒数
+        デフォルト：0（待たない。全ワーカーが処理中の間に届いたリクエストだけをまとめる）
+    :param max_pending:
+        処理中・待機中のリクエスト数の上限
+        デフォルト：1024
+    :param timeout:
+        リクエストごとのタイムアウト（秒）。待機中の時間も含む。超えた場合はasyncio.TimeoutErrorになる
+        ワーカーに渡す前にタイムアウトしたリクエストは処理しない
+        デフォルト：None（タイムアウトしない）
+    :param kwargs:
+        MecabWrapperのパラメータ（dicttype, userdict, stopwordなど）
+
+    Usage::
+        >>> import asyncio
+        >>> import ToolsNLP
+        >>> async def main():
+        ...     async with ToolsNLP.AsyncMecabWrapper(workers=4, dicttype='neologd', timeout=1.0) as m:
+        ...         tokens = await m.tokenize_async('稲垣吾郎さんのレギュラー番組', pos_filter=[['名詞', '固有名詞', '一般']], is_list=True)
+        ...         scores = await m.tokenize_sentiment_async('この2人のやりとりはやっぱり面白い！')
+        ...         return tokens, scores
+        >>> asyncio.run(main())
+        (['稲垣吾郎', 'レギュラー番組'], [1.0])
+        >>>
+    '''
+    def __init__(self, workers=None, executor='process', max_batch_size=32, max_batch_delay=0, max_pending=1024, timeout=None, **kwargs):
+        if executor not in ('process', 'thread'):
+            raise ValueError("executor must be 'process' or 'thread': {}".format(executor))
+        self._workers = workers or os.cpu_count() or 1
+        self._executor_type = executor
+        self._max_batch_size = max_batch_size
+        self._max_batch_delay = max_batch_delay
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._config = kwargs
+        self._started = None
+        self._counts = {'requests': 0, 'batches': 0, 'dispatched': 0, 'timeouts': 0, 'skipped': 0}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        '''
+        Description::
+            ワーカーを起動し、各ワーカーでMecabWrapperを生成する（最初のリクエストでも自動で起動する）
+        '''
+        if self._started is None:
+            self._started = asyncio.ensure_future(self.__start())
+        await asyncio.shield(self._started)
+
+    async def __start(self):
+        # asyncioのオブジェクトは実行中のイベントループで生成する
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._pending = asyncio.Semaphore(self._max_pending)
+        self._inflight = asyncio.Semaphore(self._workers)
+        if self._executor_type == 'process':
+            self._executor = ProcessPoolExecutor(self._workers, initializer=_init_worker, initargs=(self._config,))
+            self._call = _call_batch
+            # ワーカー数だけ同時に投げて全プロセスを起動する（初期化の時間をリクエストに含めない）
+            await asyncio.gather(*[loop.run_in_executor(self._executor, _call_batch, []) for _ in range(self._workers)])
+        else:
+            self._executor = ThreadPoolExecutor(self._workers)
+            self._call = partial(_run_calls, await loop.run_in_executor(self._executor, partial(MecabWrapper, **self._config)))
+        self._batcher = loop.create_task(self.__batch_loop())
+
+    async def close(self):
+        '''
+        Description::
+            受け付け済みのリクエストを処理してからワーカーを終了する
+        '''
+        if self._started is None:
+            return
+        await self._started
+        self._queue.put_nowait(None)
+        await self._batcher
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._started = None
+
+    def stats(self):
+        '''
+        Description::
+            リクエスト数、バッチ数、ワーカーに渡したリクエスト数、タイムアウト数、タイムアウトで処理しなかったリクエスト数を返す
+        '''
+        return dict(self._counts)
+
+    async def tokenize_async(self, sentence, timeout=None, **kwargs):
+        '''
+        Description::
+            MecabWrapper.tokenizeをワーカーで実行する
+
+        :param sentence:
+            入力テキスト
+        :param timeout:
+            タイムアウト（秒）
+            デフォルト：None（AsyncMecabWrapperのtimeout）
+        :param kwargs:
+            tokenizeのパラメータ（pos_filter, is_normalized, is_org, is_pos, is_list）
+        '''
+        return await self.__submit('tokenize', sentence, kwargs, timeout)
+
+    async def tokenize_sentiment_async(self, text, is_term=False, timeout=None):
+        '''
+        Description::
+            MecabWrapper.tokenize_sentimentをワーカーで実行する
+
+        :param text:
+            入力テキスト
+        :param is_term:
+            ポジネガ単語別の評価値を表示するかどうか
+        :param timeout:
+            タイムアウト（秒）
+            デフォルト：None（AsyncMecabWrapperのtimeout）
+        '''
+        return await self.__submit('tokenize_sentiment', text, {'is_term': is_term}, timeout)
+
+    async def __submit(self, method, item, kwargs, timeout):
+        timeout = self._timeout if timeout is None else timeout
+        self._counts['requests'] += 1
+        if timeout is None:
+            return await self.__request(method, item, kwargs)
+        try:
+            return await asyncio.wait_for(self.__request(method, item, kwargs), timeout)
+        except asyncio.TimeoutError:
+            self._counts['timeouts'] += 1
+            raise
+
+    async def __request(self, method, item, kwargs):
+        await self.start()
+        async with self._pending:
+            future = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait((method, item, kwargs, future))
+            # タイムアウトでキャンセルされるとfutureもキャンセルされ、バッチから除かれる
+            return await future
+
+    async def __batch_loop(self):
+        loop = asyncio.get_running_loop()
+        is_closed = False
+        while not is_closed:
+            # 空いているワーカーができるまで待つ間に、キューにリクエストがたまる
+            await self._inflight.acquire()
+            batch = [await self._queue.get()]
+            if self._max_batch_delay > 0 and self._queue.qsize() < self._max_batch_size - 1:
+                await asyncio.sleep(self._max_batch_delay)
+            while len(batch) < self._max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            is_closed = None in batch
+            calls = [call for call in batch if call is not None and not call[3].done()]
+            self._counts['skipped'] += len(batch) - len(calls) - is_closed
+            if calls:
+                loop.create_task(self.__dispatch(calls))
+            else:
+                self._inflight.release()
+        # 処理中のバッチが終わるのを待つ
+        for _ in range(self._workers):
+            await self._inflight.acquire()
+
+    async def __dispatch(self, calls):
+        self._counts['batches'] += 1
+        self._counts['dispatched'] += len(calls)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._executor, self._call, [call[:3] for call in calls])
+        except Exception as e:
+            # ワーカーのプロセスが落ちた場合など
+            results = [(False, e)] * len(calls)
+        finally:
+            self._inflight.release()
+        for (_, _, _, future), (is_ok, value) in zip(calls, results):
+            if future.done():
+                continue
+            if is_ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def _run_calls(mecab, calls):
+    # 例外はリクエストごとに返す（1件の失敗でバッチ全体を失敗させない）
+    results = []
+    for method, item, kwargs in calls:
+        try:
+            results.append((True, getattr(mecab, method)(item, **kwargs)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+# worker process state for AsyncMecabWrapper
+_worker_mecab = None
+
+def _init_worker(config):
+    global _worker_mecab
+    _worker_mecab = MecabWrapper(**config)
+
+def _call_batch(calls):
+    return _run_calls(_worker_mecab, calls)
@@ -0,0 +1,294 @@
+#! -*- coding: utf-8 -*-
+
+import re
+from array import array
+from collections import Counter
+import gensim
+import numpy as np
+from ToolsNLP.token_store import TokenStore
+
+
+# is_1lenで除外する1文字のひらがな・カタカナ・英数字
+SHORT_TERM = re.compile('^[ぁ-んァ-ン0-9a-zA-Z]$')
+
+def read_tsv(path):
+    '''
+    Description::
+        TSVファイル（entry_id<TAB>sentence）を1行ずつ[entry_id, sentence]で返す
+        sentenceがない行は空文字にする
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = line.rstrip('\n').split('\t', 1)
+            yield [record[0], record[1] if len(record) > 1 else '']
+
+
+class TokenFile:
+    '''
+    Description::
+        形態素解析結果を1行1ドキュメント（termを半角スペース区切り）で保存したファイル
+        何度でもイテレートでき、ドキュメントごとにtermの配列を返す
+        termは半角スペースを'-'に置き換えているので、区切り文字と衝突しない
+
+    :param path:
+        ファイルのパス
+    :param vocabulary:
+        指定した場合は含まれるtermだけを返す（ストップタームの除外）
+    :param mask:
+        指定した場合はTrueのドキュメントだけを返す（重複ドキュメントの除外）
+    '''
+    def __init__(self, path, vocabulary=None, mask=None):
+        self.path = path
+        self._vocabulary = vocabulary
+        self._mask = mask
+        self._len = None if mask is None else int(np.count_nonzero(mask))
+        # writeで書き込んだトークン数
+        self.n_tokens = None
+
+    @classmethod
+    def write(cls, path, docs):
+        '''
+        Description::
+            termの配列のイテラブルを書き込み、TokenFileを返す
+        '''
+        token_file = cls(path)
+        token_file._len = token_file.n_tokens = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for doc in docs:
+                f.write(' '.join(doc) + '\n')
+                token_file._len += 1
+                token_file.n_tokens += len(doc)
+        return token_file
+
+    def filter(self, vocabulary):
+        '''
+        Description::
+            vocabularyに含まれるtermだけを返すTokenFileを返す（ファイルは共有）
+        '''
+        token_file = TokenFile(self.path, vocabulary, self._mask)
+        token_file._len = self._len
+        return token_file
+
+    def subset(self, mask):
+        '''
+        Description::
+            mask（長さがファイルのドキュメント数のbool配列）がTrueのドキュメントだけを返すTokenFileを返す（ファイルは共有）
+        '''
+        return TokenFile(self.path, self._vocabulary, mask)
+
+    def __iter__(self):
+        vocabulary = self._vocabulary
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = f if self._mask is None else (line for line, is_selected in zip(f, self._mask) if is_selected)
+            for line in lines:
+                doc = line.rstrip('\n').split(' ') if line != '\n' else []
+                yield doc if vocabulary is None else [w for w in doc if w in vocabulary]
+
+    def __len__(self):
+        if self._len is None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._len = sum(1 for _ in f)
+        return self._len
+
+    def append(self, docs):
+        '''
+        Description::
+            termの配列のイテラブルをファイルの末尾に追加する
+        '''
+        n, n_tokens = len(self), 0
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for doc in docs:
+                f.write(' '.join(doc) + '\n')
+                n += 1
+                n_tokens += len(doc)
+        self._len = n
+        if self.n_tokens is not None:
+            self.n_tokens += n_tokens
+
+
+class ConcatCorpus:
+    '''
+    Description::
+        複数のコーパス（BoWのイテラブル）を連結して1つのコーパスとして扱う
+        何度でもイテレートできる（gensimのコーパスとして利用できる）
+    '''
+    def __init__(self, corpora):
+        self._corpora = []
+        for c in corpora:
+            self._corpora.extend(c._corpora if isinstance(c, ConcatCorpus) else [c])
+
+    def __iter__(self):
+        for c in self._corpora:
+            yield from c
+
+    def __len__(self):
+        return sum(len(c) for c in self._corpora)
+
+    def subset(self, mask):
+        '''
+        Description::
+            mask（長さがドキュメント数のbool配列）がTrueのドキュメントだけを返すコーパスを返す
+            連結したコーパスはそれぞれsubset（TokenFile, TokenStoreなど）に対応していること
+        '''
+        offsets = np.cumsum([len(c) for c in self._corpora])[:-1]
+        return ConcatCorpus([c.subset(m) for c, m in zip(self._corpora, np.split(np.asarray(mask, dtype=bool), offsets))])
+
+
+def encode_terms(texts, is_keep_ids=True, chunk_size=1 << 20):
+    '''
+    Description::
+        termの配列のイテラブルを1パスで整数IDに変換し、語彙ごとの出現頻度を数える
+        IDは初出順に振る
+
+    :param texts:
+        termの配列のイテラブル
+    :param is_keep_ids:
+        Trueの場合は全トークンのID列を返す（Falseの場合はchunk_sizeごとに頻度を集計して破棄する）
+
+    :return:
+        (term_list（ID順）, 出現頻度の配列, 全トークンのID列（is_keep_ids=Falseの場合はNone）, ドキュメントごとのトークン数の配列)
+    '''
+    token2id = {}
+    setdefault = token2id.setdefault
+    cfs = np.zeros(0, dtype=np.int64)
+    chunks = []
+    buf = array('i')
+    lengths = array('q')
+    for doc in texts:
+        buf.extend([setdefault(w, len(token2id)) for w in doc])
+        lengths.append(len(doc))
+        if len(buf) >= chunk_size:
+            cfs = _add_counts(cfs, buf, len(token2id))
+            if is_keep_ids:
+                chunks.append(np.frombuffer(buf, dtype=np.int32))
+            buf = array('i')
+    cfs = _add_counts(cfs, buf, len(token2id))
+    if is_keep_ids:
+        chunks.append(np.frombuffer(buf, dtype=np.int32))
+    ids = np.concatenate(chunks) if is_keep_ids else None
+    return list(token2id), cfs, ids, np.frombuffer(lengths, dtype=np.int64)
+
+
+def _add_counts(cfs, buf, n_terms):
+    counts = np.bincount(np.frombuffer(buf, dtype=np.int32), minlength=n_terms)
+    counts[:len(cfs)] += cfs
+    return counts
+
+
+def stop_term_mask(terms, cfs, is_1len, is_term_fq, limitcnt, toprate):
+    '''
+    Description::
+        語彙ごとに残す単語のマスクを返す（正規表現の判定は語彙ごとに1回だけ）
+        is_1len: 1文字のひらがな・カタカナ・英数字を除外する
+        is_term_fq: 出現頻度がlimitcnt未満の単語と、出現頻度の上位toprateの割合の単語を除外する
+    '''
+    keep = np.ones(len(terms), dtype=bool)
+    if is_1len:
+        keep &= np.fromiter((SHORT_TERM.match(w) is None for w in terms), dtype=bool, count=len(terms))
+    if is_term_fq:
+        keep &= cfs >= limitcnt
+        n_top = int(len(terms) * toprate)
+        if n_top > 0:
+            keep[np.argsort(-cfs, kind='stable')[:n_top]] = False
+    return keep
+
+
+def _make_dictionary(terms, cfs, dfs, num_docs, num_pos, num_nnz):
+    dictionary = gensim.corpora.Dictionary()
+    dictionary.token2id = {w: i for i, w in enumerate(terms)}
+    dictionary.cfs = dict(enumerate(cfs.tolist()))
+    dictionary.dfs = dict(enumerate(dfs.tolist()))
+    dictionary.num_docs = num_docs
+    dictionary.num_pos = num_pos
+    dictionary.num_nnz = num_nnz
+    return dictionary
+
+
+def build_corpus(texts, is_1len=True, is_term_fq=True, limitcnt=3, toprate=0.05):
+    '''
+    Description::
+        termの配列のリスト（またはTokenStore）からストップタームを除外し、辞書とBoWのコーパスを作成する
+        単語を整数IDにしてから、除外とBoWの集計を全トークンの配列に対してまとめて行う
+        TokenStoreの場合は文字列を作らずにIDの配列から集計し、除外後のtermもTokenStore（語彙は共有）で返す
+
+    :return:
+        (gensim.corpora.Dictionary, BoWのリスト, 除外後のtermの配列のリスト（またはTokenStore）)
+    '''
+    is_store = isinstance(texts, TokenStore)
+    terms, cfs, ids, lengths = texts.encode_terms() if is_store else encode_terms(texts)
+    keep = stop_term_mask(terms, cfs, is_1len, is_term_fq, limitcnt, toprate)
+    n_docs = len(lengths)
+    n_keep = int(keep.sum())
+    kept_terms = np.array(terms, dtype=object)[keep]
+    if n_docs == 0:
+        return (_make_dictionary(kept_terms.tolist(), cfs[keep], np.zeros(n_keep, dtype=np.int64), 0, 0, 0), []
+                ,texts.empty_like() if is_store else [])
+
+    remap = np.full(len(terms), -1, dtype=np.int64)
+    remap[keep] = np.arange(n_keep)
+    new_ids = remap[ids]
+    is_kept = new_ids >= 0
+    new_ids = new_ids[is_kept]
+    doc_index = np.repeat(np.arange(n_docs), lengths)[is_kept]
+    if is_store:
+        texts_cleansing = texts.select(is_kept)
+    else:
+        offsets = np.cumsum(np.bincount(doc_index, minlength=n_docs))[:-1]
+        texts_cleansing = [doc.tolist() for doc in np.split(kept_terms[new_ids], offsets)]
+
+    # (ドキュメント, 単語)の組で集計すると、ドキュメント順・ID順に並んだBoWになる
+    pairs, counts = np.unique(doc_index * max(n_keep, 1) + new_ids, return_counts=True)
+    bow_doc, bow_ids = np.divmod(pairs, max(n_keep, 1))
+    offsets = np.searchsorted(bow_doc, np.arange(1, n_docs))
+    bows = [list(zip(i.tolist(), c.tolist())) for i, c in zip(np.split(bow_ids, offsets), np.split(counts, offsets))]
+    dictionary = _make_dictionary(kept_terms.tolist(), cfs[keep], np.bincount(bow_ids, minlength=n_keep)
+                                ,n_docs, len(new_ids), len(pairs))
+    return dictionary, bows, texts_cleansing
+
+
+def build_corpus_stream(token_file, path, is_1len=True, is_term_fq=True, limitcnt=3, toprate=0.05):
+    '''
+    Description::
+        TokenFileからストップタームを除外し、辞書とMatrix Market形式のコーパス（path）を作成する
+        1パス目で語彙と出現頻度を数え、2パス目でBoWを書き出す（全トークンをメモリ上に保持しない）
+
+    :return:
+        (gensim.corpora.Dictionary, gensim.corpora.MmCorpus, 除外後のTokenFile)
+    '''
+    terms, cfs, _, lengths = encode_terms(token_file, is_keep_ids=False)
+    keep = stop_term_mask(terms, cfs, is_1len, is_term_fq, limitcnt, toprate)
+    kept_terms = [w for w, k in zip(terms, keep) if k]
+    dfs = np.zeros(len(kept_terms), dtype=np.int64)
+    dictionary = _make_dictionary(kept_terms, cfs[keep], dfs, len(lengths), int(cfs[keep].sum()), 0)
+    texts = token_file.filter(dictionary.token2id)
+
+    def bows():
+        token2id = dictionary.token2id
+        for doc in texts:
+            bow = sorted(Counter(token2id[w] for w in doc).items())
+            for i, _ in bow:
+                dfs[i] += 1
+            dictionary.num_nnz += len(bow)
+            yield bow
+    gensim.corpora.MmCorpus.serialize(path, bows(), id2word=dictionary)
+    dictionary.dfs = dict(enumerate(dfs.tolist()))
+    return dictionary, gensim.corpora.MmCorpus(path), texts
+
+
+class SubsetCorpus:
+    '''
+    Description::
+        コーパスのうちmaskがTrueのドキュメントだけを返すコーパス（ホールドアウトの分割など）
+        何度でもイテレートできる
+    '''
+    def __init__(self, corpus, mask):
+        self._corpus = corpus
+        self._mask = mask
+
+    def __iter__(self):
+        for doc, is_selected in zip(self._corpus, self._mask):
+            if is_selected:
+                yield doc
+
+    def __len__(self):
+        return int(self._mask.sum())
@@ -0,0 +1,148 @@
+#! -*- coding: utf-8 -*-
+
+import itertools
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from ToolsNLP.token_store import TokenStore
+
+
+# 64bitの乗算ハッシュの定数（オーバーフローはmod 2^64として扱う）
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def lsh_params(threshold, num_perm):
+    '''
+    Description::
+        Jaccard係数の閾値に対して、偽陽性と偽陰性の確率の和が最小になるLSHのバンド数・行数（bands * rows = num_perm）を返す
+    '''
+    x = np.linspace(0, 1, 1001)
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # 類似度xの組がいずれかのバンドで同じバケットになる確率
+        p = 1 - (1 - x ** rows) ** bands
+        error = p[x < threshold].sum() / len(x) + (1 - p[x >= threshold]).sum() / len(x)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _batches(texts, batch_size):
+    # (ID列, ドキュメントごとのトークン数)をbatch_sizeドキュメントずつ返す
+    if isinstance(texts, TokenStore):
+        offsets = texts.offsets
+        for start in range(0, len(texts), batch_size):
+            end = min(start + batch_size, len(texts))
+            yield texts.ids[offsets[start]:offsets[end]], np.diff(offsets[start:end + 1])
+        return
+    token2id = {}
+    setdefault = token2id.setdefault
+    texts = iter(texts)
+    for batch in iter(lambda: list(itertools.islice(texts, batch_size)), []):
+        ids = np.fromiter((setdefault(w, len(token2id)) for doc in batch for w in doc), dtype=np.int64)
+        yield ids, np.fromiter((len(doc) for doc in batch), dtype=np.int64, count=len(batch))
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=2, seed=0, batch_size=10000):
+    '''
+    Description::
+        ドキュメントごとに、各トークンから始まるshingle_size個の連続するtermの組（シングル）の集合のMinHashを計算する
+        全トークンをまとめて配列で計算し、処理時間はトークン数に比例する
+        末尾のshingle_size-1個のトークンから始まる組は、足りない分を埋めた短い組としてシングルに含める
+        （長さによらず全ドキュメントで同じ。shingle_sizeより短いドキュメントも比較できる）
+
+    :param texts:
+        termの配列のイテラブル、またはTokenStore
+    :return:
+        (MinHash（ドキュメント数×num_perm, uint32）, ドキュメントごとのトークン数の配列)
+    '''
+    rnd = np.random.RandomState(seed)
+    a = rnd.randint(0, 1 << 63, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rnd.randint(0, 1 << 63, size=num_perm, dtype=np.int64).astype(np.uint64)
+    signatures, all_lengths = [], []
+    for ids, lengths in _batches(texts, batch_size):
+        signature = np.full((len(lengths), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        if len(ids):
+            ids = ids.astype(np.uint64) + np.uint64(1)
+            ends = np.repeat(np.cumsum(lengths), lengths)
+            position = np.arange(len(ids))
+            shingles = ids.copy()
+            for j in range(1, shingle_size):
+                # ドキュメントの末尾を超える位置は0（IDは1以上にしてある）
+                shingles = shingles * _MULTIPLIER + np.where(position + j < ends, ids[np.minimum(position + j, len(ids) - 1)], np.uint64(0))
+            is_nonempty = lengths > 0
+            starts = np.cumsum(lengths)[is_nonempty] - lengths[is_nonempty]
+            for p in range(num_perm):
+                h = ((shingles * a[p] + b[p]) >> np.uint64(32)).astype(np.uint32)
+                signature[is_nonempty, p] = np.minimum.reduceat(h, starts)
+        signatures.append(signature)
+        all_lengths.append(lengths)
+    if not signatures:
+        return np.zeros((0, num_perm), dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    return np.vstack(signatures), np.concatenate(all_lengths)
+
+
+def find_duplicates(texts, threshold=0.9, num_perm=64, shingle_size=2, seed=0, batch_size=10000):
+    '''
+    Description::
+        MinHashとLSHで類似度（シングルの集合のJaccard係数の推定値）がthreshold以上のドキュメントの組を探し、重複グループにまとめる
+        LSHで同じバケットになった組のうち、MinHashの一致率がthreshold以上のものだけを重複とする
+        重複の組を辺とするグラフの連結成分をグループにするため、推移的につながる（A~B, B~Cの場合は、
+        AとCの類似度がthreshold未満でもA, B, Cを1つのグループにする）
+        グループの代表は最初に出現したドキュメント。空のドキュメントは重複としない
+
+    :param texts:
+        termの配列のイテラブル、またはTokenStore
+    :param threshold:
+        重複とする類似度
+        デフォルト：0.9
+    :param num_perm:
+        MinHashのハッシュ関数の数（多いほど類似度の推定が正確になり、処理時間は増える）
+        デフォルト：64
+    :param shingle_size:
+        シングルのterm数
+        デフォルト：2
+
+    :return:
+        ドキュメントごとの代表のドキュメントの番号の配列（重複していないドキュメントは自分の番号）
+
+    Usage::
+        >>> from ToolsNLP import dedup
+        >>> texts = [['東京', 'の', '天気', 'は', '晴れ'], ['大阪', 'の', '株価'], ['東京', 'の', '天気', 'は', '晴れ']]
+        >>> dedup.find_duplicates(texts)
+        array([0, 1, 0])
+        >>>
+    '''
+    signatures, lengths = minhash_signatures(texts, num_perm, shingle_size, seed, batch_size)
+    n_docs = len(lengths)
+    bands, rows = lsh_params(threshold, num_perm)
+    valid = np.flatnonzero(lengths > 0)
+    edges = []
+    for band in range(bands):
+        # バンドのrows個のMinHashを1つのキーにし、ソートして同じキーの先頭のドキュメントと組にする
+        key = np.zeros(len(valid), dtype=np.uint64)
+        for col in signatures[valid, band * rows:(band + 1) * rows].T:
+            key = key * _MULTIPLIER + col.astype(np.uint64)
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        is_first = np.ones(len(key), dtype=bool)
+        is_first[1:] = key[1:] != key[:-1]
+        leader = order[np.maximum.accumulate(np.where(is_first, np.arange(len(key)), 0))]
+        u, v = valid[order[~is_first]], valid[leader[~is_first]]
+        for start in range(0, len(u), 100000):
+            uu, vv = u[start:start + 100000], v[start:start + 100000]
+            is_similar = (signatures[uu] == signatures[vv]).mean(axis=1) >= threshold
+            edges.append((uu[is_similar], vv[is_similar]))
+    representative = np.arange(n_docs)
+    if not edges or not sum(len(u) for u, _ in edges):
+        return representative
+    u = np.concatenate([e[0] for e in edges])
+    v = np.concatenate([e[1] for e in edges])
+    graph = scipy.sparse.coo_matrix((np.ones(len(u), dtype=np.int8), (u, v)), shape=(n_docs, n_docs))
+    n_groups, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+    first = np.full(n_groups, n_docs, dtype=np.int64)
+    np.minimum.at(first, labels, representative)
+    return first[labels]
@@ -0,0 +1,124 @@
+#! -*- coding: utf-8 -*-
+
+import sys
+import time
+import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+# ライブラリとしては何も出力しない（利用側でハンドラを設定した場合だけ出力する）
+logger = logging.getLogger('ToolsNLP')
+logger.addHandler(logging.NullHandler())
+
+StageStats = namedtuple('StageStats', ['stage', 'wall_sec', 'cpu_sec', 'peak_mem_mb', 'docs', 'tokens', 'docs_per_sec', 'tokens_per_sec', 'extra'])
+TokenizeStats = namedtuple('TokenizeStats', ['sentences', 'tokens', 'normalize_sec', 'parse_sec', 'post_sec'])
+
+
+def _peak_mem_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB on Linux
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def _cpu_sec():
+    # 終了した子プロセス（形態素解析・学習のプロセスプール）のCPU時間も含める
+    try:
+        import resource
+    except ImportError:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _per_sec(count, sec):
+    return count / sec if count is not None and sec > 0 else None
+
+
+class Instrument:
+    '''
+    Description::
+        処理のステージごとの計測（経過時間、CPU時間、ピークメモリ、docs/sec、tokens/sec）
+        計測結果はstatsに追記し、callbacksの各関数にStageStatsを渡し、logging（'ToolsNLP'ロガー）のINFOに出力する
+        ピークメモリはステージ終了時点のプロセスの最大常駐メモリ（ru_maxrss）
+
+    :param verbose:
+        Trueの場合は進捗と計測結果を標準出力に出力する
+        デフォルト：False
+    :param callbacks:
+        StageStatsを受け取る関数のリスト（メトリクスの送信など）
+        デフォルト：()
+
+    Usage::
+        >>> from ToolsNLP.instrument import Instrument
+        >>> instrument = Instrument(callbacks=[print])
+        >>> with instrument.stage('tokenize') as record:
+        ...     record['docs'] = 100
+        >>>
+    '''
+    def __init__(self, verbose=False, callbacks=()):
+        self.verbose = verbose
+        self.callbacks = list(callbacks)
+        self.stats = []
+
+    def message(self, msg):
+        '''
+        Description::
+            進捗のメッセージを出力する（verbose=Trueの場合は標準出力にも出力する）
+        '''
+        logger.info(msg)
+        if self.verbose:
+            print(msg)
+
+    @contextmanager
+    def stage(self, name, msg=''):
+        '''
+        Description::
+            withブロックの処理を1ステージとして計測する
+            ブロック内で record['docs'], record['tokens'] に処理件数、record['extra'] に追加の計測値を設定できる
+        '''
+        if msg:
+            self.message(msg)
+        record = {'docs': None, 'tokens': None, 'extra': {}}
+        wall, cpu = time.perf_counter(), _cpu_sec()
+        yield record
+        wall, cpu = time.perf_counter() - wall, _cpu_sec() - cpu
+        stats = StageStats(name, wall, cpu, _peak_mem_mb(), record['docs'], record['tokens']
+                        ,_per_sec(record['docs'], wall), _per_sec(record['tokens'], wall), record['extra'])
+        self.stats.append(stats)
+        logger.info('stage %s: wall=%.3fs cpu=%.3fs docs=%s tokens=%s', name, wall, cpu, stats.docs, stats.tokens, extra={'stage_stats': stats})
+        if self.verbose:
+            print('  {}: {:.2f} sec (cpu {:.2f} sec{}{})'.format(name, wall, cpu
+                ,'' if stats.docs_per_sec is None else ', {:,.0f} docs/sec'.format(stats.docs_per_sec)
+                ,'' if stats.tokens_per_sec is None else ', {:,.0f} tokens/sec'.format(stats.tokens_per_sec)))
+        for callback in self.callbacks:
+            callback(stats)
+
+
+class TokenizeTimer:
+    '''
+    Description::
+        Tokenizerの正規化・MeCabの解析・後処理（品詞フィルタ・ストップワード）の時間を集計する
+        MecabWrapper.timing()で有効にする（プロセスプールのワーカーでの処理は集計されない）
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sentences = self._tokens = 0
+        self._normalize_sec = self._parse_sec = self._post_sec = 0.0
+
+    def add(self, tokens, normalize_sec, parse_sec, post_sec):
+        with self._lock:
+            self._sentences += 1
+            self._tokens += tokens
+            self._normalize_sec += normalize_sec
+            self._parse_sec += parse_sec
+            self._post_sec += post_sec
+
+    def info(self):
+        with self._lock:
+            return TokenizeStats(self._sentences, self._tokens, self._normalize_sec, self._parse_sec, self._post_sec)
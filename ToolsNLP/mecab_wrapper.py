@@ -3,45 +3,53 @@
 import os
 import MeCab
 import neologdn
+import shutil
 import subprocess
+import tempfile
 import json
 import re
 from pathlib import Path
-import site
+import types
+import hashlib
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from collections import defaultdict
+from ToolsNLP.result_cache import ResultCache
+from ToolsNLP.instrument import TokenizeTimer
+from ToolsNLP.sentiment_lexicon import SentimentLexicon, WagoTrie, load_sentiment_dict, to_polarity
 
 
-class Tokenizer:
-    def __add_pos(self, is_pos, term, pos):
-        if term:
-            if is_pos:
-                return term + ':' + '-'.join(pos)
-            else:
-                return term
+# mecab-config results shared by every instance in the process {option: path}
+_mecab_paths = {}
+
+def _mecab_config(get_type):
+    if get_type not in _mecab_paths:
+        path_mecab_config = shutil.which('mecab-config')
+        if path_mecab_config is None:
+            raise subprocess.CalledProcessError(returncode=-1, cmd="mecab-config not found")
+        _mecab_paths[get_type] = subprocess.check_output([path_mecab_config, '--' + get_type]).decode('utf-8').strip()
+    return _mecab_paths[get_type]
+
 
+class Tokenizer:
     def _stopword_list(self, stopword):
-        stopword_list = []
+        stopword_list = set()
         if stopword:
-            stopword_list = [(i.strip('\n')).lower() for i in open(stopword, 'r', encoding='utf-8') if i.strip('\n')]
+            stopword_list = {(i.strip('\n')).lower() for i in open(stopword, 'r', encoding='utf-8') if i.strip('\n')}
         return stopword_list
 
-    def __pos_filter(self, sentence_parsed_term, pos_filter, is_org, is_pos, stopword_list):
-        term = sentence_parsed_term.split('\t')[0]
-        term_pos = sentence_parsed_term.split('\t')[1].split(',')
-        pos_filter_result = ''
-        # filter: on or off
-        if pos_filter != [[]]:
-            # loop pos list
-            for pos in pos_filter:
-                # pos extract
-                if pos == term_pos[:3]:
-                    pos_filter_result = self._term_to_base(term=term.replace(' ', '-'), term_base=term_pos[6].replace(' ', '-'), is_org=is_org)
-        else:
-            pos_filter_result = self._term_to_base(term=term.replace(' ', '-'), term_base=term_pos[6].replace(' ', '-'), is_org=is_org)
-        # stop word
-        term_result = None if pos_filter_result.lower() in stopword_list else pos_filter_result
-        # add pos
-        return self.__add_pos(is_pos, term_result, term_pos[:3])
+    def _pos_filter_set(self, pos_filter):
+        # filter: off
+        if pos_filter == [[]]:
+            return None
+        key = tuple(tuple(pos) for pos in pos_filter)
+        if key not in self._pos_filter_cache:
+            self._pos_filter_cache[key] = frozenset(key)
+        return self._pos_filter_cache[key]
 
     def _proc_normalized(self, sentence, is_normalized):
         if is_normalized:
@@ -49,16 +57,44 @@ class Tokenizer:
         else:
             return self._mecabObj.parse(sentence)
 
+    def _tokenize(self, sentence, pos_filter, is_normalized, is_org, is_pos):
+        timer = getattr(self._local, 'timer', None)
+        if timer is None:
+            sentence_parsed = self._proc_normalized(sentence, is_normalized)
+            return self._proc_term(sentence_parsed, pos_filter ,is_org ,is_pos)
+        # timing() enabled: split normalize / MeCab parse / post-processing
+        start = time.perf_counter()
+        if is_normalized:
+            sentence = neologdn.normalize(sentence)
+        normalized = time.perf_counter()
+        sentence_parsed = self._mecabObj.parse(sentence)
+        parsed = time.perf_counter()
+        result = self._proc_term(sentence_parsed, pos_filter ,is_org ,is_pos)
+        timer.add(len(result), normalized - start, parsed - normalized, time.perf_counter() - parsed)
+        return result
+
     def _proc_term(self, sentence_parsed, pos_filter, is_org, is_pos):
+        pos_set = self._pos_filter_set(pos_filter)
+        stopword_list = self.stopword_list
         pos_result = []
         # loop term parse pos
         for sentence_parsed_term in sentence_parsed.split('\n'):
             # escape EOS
-            if sentence_parsed_term not in ['EOS', '']:
-                filter_result = self.__pos_filter(sentence_parsed_term, pos_filter ,is_org ,is_pos ,self.stopword_list)
-                # append not None result
-                if filter_result:
-                    pos_result.append(filter_result)
+            if sentence_parsed_term == 'EOS' or not sentence_parsed_term:
+                continue
+            fields = sentence_parsed_term.split('\t')
+            term_pos = fields[1].split(',')
+            pos = tuple(term_pos[:3])
+            # pos extract
+            if pos_set is not None and pos not in pos_set:
+                continue
+            term = fields[0] if not is_org or term_pos[6] == '*' else term_pos[6]
+            term = term.replace(' ', '-')
+            # stop word
+            if not term or term.lower() in stopword_list:
+                continue
+            # add pos
+            pos_result.append(term + ':' + '-'.join(pos) if is_pos else term)
         return pos_result
 
 class TokenizerSentiment:
@@ -67,8 +103,28 @@ class TokenizerSentiment:
             if sentence and not self.re_delimiter.match(sentence):
                 yield sentence
 
+    def _tokenize_sentiment(self, text, is_term):
+        scores = []
+        for sentence in self._split_sentence(text):
+            score = self._proc_sentiment(sentence, is_term)
+            if score:
+                scores.append(score)
+        return scores
+
+    def _score_sentiment(self, text):
+        # sentence count, [(sentence index, score, cnt, positive cnt, negative cnt), ...]
+        rows = []
+        sentence_cnt = 0
+        for sentence_cnt, sentence in enumerate(self._split_sentence(text), 1):
+            result = self._proc_sentiment(sentence, is_term=True)
+            if result:
+                positive = sum(1 for polarity in result['polarities'] if polarity[1] > 0)
+                rows.append((sentence_cnt - 1, result['score'], result['cnt'], positive, result['cnt'] - positive))
+        return sentence_cnt, rows
+
     def _proc_sentiment(self, sentence, is_term):
-        sentence_parsed = self.tokenize(sentence=sentence, is_list=True)
+        # sentence is already normalized in _split_sentence
+        sentence_parsed = self._tokenize(sentence, pos_filter=[[]], is_normalized=False, is_org=True, is_pos=False)
         polarities = []
         lemmas = []
         lemmas_negation = []
@@ -93,50 +149,31 @@ class TokenizerSentiment:
             return score
 
     def __calc_sentiment_polarity(self, lemma, is_term, lemmas, polarities, lemmas_negation):
-        polarity, lemma = self.__lookup_wago(lemma, lemmas, lemmas_negation, self.sentiment_dict)
+        polarity, lemma = self.__lookup_wago(lemma, lemmas, lemmas_negation, self.sentiment_dict, self._sentiment_trie)
         if not polarity:
-            polarity, lemma = self.__lookup_wago(lemma, lemmas, lemmas_negation, self.default_dict)
+            polarity, lemma = self.__lookup_wago(lemma, lemmas, lemmas_negation, self.default_dict, self._default_trie)
         if not polarity and len(polarities) > 0 and lemma in self.negation and lemmas_negation[-1] in lemmas[-3:]:
             polarities[-1][1] *= -1
             polarities[-1][0] = lemmas_negation[-1] + '-' + lemma
         lemmas.append(lemma)
         return polarity, lemma, polarities, lemmas, lemmas_negation
 
-    def __lookup_wago(self, lemma, lemmas, lemmas_negation, set_dict):
-        if lemma in set_dict:
-            polarity = 1 if set_dict[lemma] == 'p' or set_dict[lemma].startswith('ポジ') else -1
+    def __lookup_wago(self, lemma, lemmas, lemmas_negation, set_dict, trie):
+        polarity = set_dict.get(lemma)
+        if polarity is not None:
             return polarity, lemma
-        for i in range(5, 0, -1):
-            wago = ' '.join(lemmas[-i:]) + ' ' + lemma
-            if wago in set_dict:
-                polarity = 1 if set_dict[wago] == 'p' or set_dict[wago].startswith('ポジ') else -1
-                if len(lemmas_negation) > 0:
-                    if lemmas_negation[-1] in wago:
-                        return None, wago
-                return polarity, wago
+        # longest wago of up to 5 preceding lemmas + lemma
+        match = trie.longest_match(lemma, lemmas, 5)
+        if match:
+            wago, polarity = match
+            if len(lemmas_negation) > 0:
+                if lemmas_negation[-1] in wago:
+                    return None, wago
+            return polarity, wago
         return None, lemma
 
-    def _json_to_dict(self, fname):
-        sitedir = site.getsitepackages()[-1]
-        installdir = os.path.join(sitedir, 'ToolsNLP')
-        dict_path = installdir + "/sentiment_dict/" + fname
-        return json.load(open(dict_path, 'r'))
-
     def _make_sentiment_dict(self, fname):
-        default_dict = {**self._json_to_dict('pn_noun.json') ,**self._json_to_dict('pn_wago.json')}
-        sentiment_dict = {}
-        if fname:
-            for line in open(fname, 'r'):
-                word, polarity = line.strip().split(',')
-                sentiment_dict[word] = polarity
-
-            sentiment_dict = dict(sentiment_dict)
-            for k, v in list(sentiment_dict.items()):
-                if v == 'e' or v == 'ニュートラル':
-                    del sentiment_dict[k]
-                    if k in default_dict:
-                        del default_dict[k]
-        return sentiment_dict, default_dict
+        return load_sentiment_dict(fname)
 
 class MecabWrapper(Tokenizer, TokenizerSentiment):
     '''
@@ -151,6 +188,16 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         サンプルファイル
             オオカミくんには騙されない,0,0,0,名詞,固有名詞,一般,*,*,*,オオカミくんには騙されない,オオカミクンニハダマサレナイ,オオカミクンニハダマサレナイ
             ※最終行に改行があるとエラーになる
+    :param userdict_cache_dir:
+        コンパイルしたユーザ辞書を保存するディレクトリ
+        ユーザ辞書の内容とシステム辞書のパスのハッシュをファイル名にして、内容が変わったときだけ再コンパイルする
+        デフォルト：''（$XDG_CACHE_HOME/ToolsNLP/userdict、未設定の場合は~/.cache/ToolsNLP/userdict）
+    :param dicdir:
+        Mecabの辞書ディレクトリ（mecab-config --dicdir）
+        デフォルト：''（必要になったときにmecab-configで取得する。取得結果はプロセス内で共有する）
+    :param libexecdir:
+        mecab-dict-indexのあるディレクトリ（mecab-config --libexecdir）
+        デフォルト：''（ユーザ辞書のコンパイル時にmecab-configで取得する）
     :param stopword:
         ストップワードのファイル名を指定
         1行1単語で改行してファイルを作成する
@@ -158,6 +205,8 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         $cat stopword.txt
         3人
         さん
+        読み込んだストップワードはstopword_list（frozenset）で参照する。変更する場合はlistの操作ではなく新しい値を代入する
+        例：m.stopword_list = m.stopword_list | {'3人'}
     :param noundict:
         センチメント分析用の名詞辞書ファイルのファイル名を指定
         サンプルファイル(p:ポジティブ,n:ネガティブ,e:ニュートラル)
@@ -168,10 +217,23 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         サンプルファイル(ポジ:ポジティブ,ネガ:ネガティブ)
             あがく,ネガ
             颯爽 の,ポジ
+    :param lexicon:
+        compile_sentiment_lexiconで作成したコンパイル済みの極性辞書ファイル名
+        指定した場合はJSONの辞書を読み込まずにファイルをメモリマップして参照する（sentimentdictは無視される）
+        ワーカープロセス間で同じページを共有できるので、プロセスプールでの起動時間とメモリを削減できる
     :param negation:
         センチメント分析用の打消し語の指定
         例：['ず','ない']
         デフォルト：['ない', 'ず', 'ぬ']
+    :param cache_size:
+        tokenize, tokenize_sentimentの結果をキャッシュする件数（LRUで上限を超えたものから削除）
+        デフォルト：0（キャッシュしない）
+    :param cache_path:
+        キャッシュのディスク層として利用するsqliteファイルのパス
+        バッチ実行をまたいで結果を再利用する場合に指定する（cache_sizeの指定が必要）
+        キャッシュキーには辞書（MeCabが読み込んだ辞書のファイル名とバージョン）・ストップワード・センチメント辞書の内容が含まれるため、
+        それらが変わると別のキーになる
+        デフォルト：''（ディスク層を利用しない）
 
     Usage::
         >>> import ToolsNLP
@@ -193,53 +255,255 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         >>> m.tokenize(sentence=text)
         '稲垣吾郎 、 草彅剛 、 香取慎吾 の による レギュラー番組 『 7 . 2 新しい別の窓 』 や 『 オオカミくんには騙されない 』'
     '''
-    def __init__(self, dicttype='ipadic', userdict='', stopword='', sentimentdict='', negation=[]):
+    def __init__(self, dicttype='ipadic', userdict='', stopword='', sentimentdict='', negation=[], cache_size=0, cache_path='', lexicon='', userdict_cache_dir='', dicdir='', libexecdir=''):
+        # worker process rebuild config
+        self._config = {'dicttype': dicttype, 'userdict': userdict, 'stopword': stopword, 'sentimentdict': sentimentdict, 'negation': negation
+                        ,'cache_size': cache_size, 'cache_path': cache_path, 'lexicon': lexicon
+                        ,'userdict_cache_dir': userdict_cache_dir, 'dicdir': dicdir, 'libexecdir': libexecdir}
+        self._cache = ResultCache(cache_size, cache_path) if cache_size else None
+        self._cache_namespace = None
         self._dicttype = dicttype
         self._userdict = userdict
-        self._userdict_name = self._userdict.replace("csv", "dict").split('/')[-1]
-        self._path_mecab_config = self.__shell_check_output('which mecab-config')
-        self._path_mecab_dict = self.__get_mecab_path('dicdir')
-        self._path_mecab_libexe = self.__get_mecab_path('libexecdir')
+        self._userdict_cache_dir = userdict_cache_dir or os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'ToolsNLP', 'userdict')
+        self._dicdir = dicdir
+        self._libexecdir = libexecdir
         self.stopword_list = self._stopword_list(stopword)
-        self.sentiment_dict, self.default_dict = self._make_sentiment_dict(sentimentdict)
+        self._pos_filter_cache = {}
+        if lexicon:
+            self.sentiment_dict, self.default_dict = SentimentLexicon.load(lexicon)
+        else:
+            self.sentiment_dict, self.default_dict = self._make_sentiment_dict(sentimentdict)
         self.re_delimiter = re.compile("[。,．!\?|( )]")
         self.negation = ['ない', 'ず', 'ぬ'] + negation
-        self._mecabObj = self.__CallMecab()
+        self._mecab_args = self.__MecabArgs()
+        self._local = threading.local()
+        self._local.mecabObj = self.__CallMecab()
+        self._initial_state = {name: getattr(self, name) for name in self._MUTABLE_STATE}
+
+    # 設定ごとに共有するインスタンス {(class, config): MecabWrapper}
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, **kwargs):
+        '''
+        Description::
+            同じ設定のMecabWrapperをプロセス内で1つだけ生成して共有する
+            辞書・ストップワード・センチメント辞書などの読み込みは最初の1回だけ行い、
+            MeCab.Taggerはスレッドごとに生成するので、複数スレッドから同時にtokenizeを呼び出せる
+            （MecabWrapperはTaggerをスレッドごとに持つため、shared以外で生成したインスタンスもスレッドセーフ）
+
+        :param kwargs:
+            MecabWrapperのパラメータ
+
+        Usage::
+        >>> import ToolsNLP
+        >>> m = ToolsNLP.MecabWrapper.shared(dicttype='neologd', stopword='stopword.txt')
+        >>> m is ToolsNLP.MecabWrapper.shared(dicttype='neologd', stopword='stopword.txt')
+        True
+        >>>
+        '''
+        # デフォルト値を補ってから比較する（shared()とshared(dicttype='ipadic')は同じインスタンス）
+        arguments = inspect.signature(cls).bind(**kwargs)
+        arguments.apply_defaults()
+        key = (cls, json.dumps(sorted(arguments.arguments.items()), ensure_ascii=False))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(**kwargs)
+            return cls._shared[key]
+
+    @property
+    def _mecabObj(self):
+        # MeCab.Tagger is not thread-safe, so each thread gets its own
+        mecabObj = getattr(self._local, 'mecabObj', None)
+        if mecabObj is None:
+            mecabObj = self._local.mecabObj = self.__CallMecab()
+        return mecabObj
+
+    # 生成後にsetterで変更できる設定（ワーカープロセスには_configで生成してから変更分を反映する）
+    _MUTABLE_STATE = ('stopword_list', 'sentiment_dict', 'default_dict', 'negation')
 
-    def __shell_check_output(self, str_cmd):
-        return subprocess.check_output(str_cmd, shell=True).decode('utf-8').strip('\n')
+    # 結果に影響する設定は変更時にキャッシュを無効化する（直接の書き換えは不可）
+    @property
+    def stopword_list(self):
+        return self._stopword
 
-    def __get_mecab_path(self, get_type):
-        str_cmd = "echo `{0} --{1}`".format(self._path_mecab_config, get_type)
-        return self.__shell_check_output(str_cmd)
+    @stopword_list.setter
+    def stopword_list(self, value):
+        self._stopword = frozenset(value)
+        self._invalidate_cache()
+
+    @property
+    def sentiment_dict(self):
+        return self._sentiment_dict
+
+    @sentiment_dict.setter
+    def sentiment_dict(self, value):
+        self._sentiment_dict = self.__readonly_dict(value)
+        self._sentiment_trie = self.__wago_trie(self._sentiment_dict)
+        self._invalidate_cache()
+
+    @property
+    def default_dict(self):
+        return self._default_dict
+
+    @default_dict.setter
+    def default_dict(self, value):
+        self._default_dict = self.__readonly_dict(value)
+        self._default_trie = self.__wago_trie(self._default_dict)
+        self._invalidate_cache()
+
+    @property
+    def negation(self):
+        return self._negation
+
+    @negation.setter
+    def negation(self, value):
+        self._negation = tuple(value)
+        self._invalidate_cache()
+
+    def __readonly_dict(self, value):
+        if isinstance(value, SentimentLexicon):
+            return value
+        return types.MappingProxyType({k: to_polarity(v) for k, v in value.items()})
+
+    def __wago_trie(self, set_dict):
+        return set_dict.trie if isinstance(set_dict, SentimentLexicon) else WagoTrie(set_dict)
+
+    def _invalidate_cache(self):
+        self._cache_namespace = None
+        if self._cache is not None:
+            self._cache.clear()
+
+    def __get_cache_namespace(self):
+        if self._cache_namespace is None:
+            userdict_digest = os.path.basename(self._userdict_path) if self._userdict else ''
+            # 辞書のパスはneologd・ユーザ辞書で使う場合だけ（_mecab_argsに含まれる）。mecab-configは呼ばない
+            state = [self._dicttype, self._mecab_args, userdict_digest, self.__dictionary_info(), sorted(self.stopword_list)
+                    ,self.__dict_state(self.sentiment_dict), self.__dict_state(self.default_dict), list(self.negation)]
+            self._cache_namespace = hashlib.sha1(json.dumps(state, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return self._cache_namespace
+
+    def __dictionary_info(self):
+        # Taggerが読み込んだ辞書（システム辞書・ユーザ辞書）のファイル名とバージョン
+        info = []
+        dictionary_info = getattr(self._mecabObj, 'dictionary_info', None)
+        d = dictionary_info() if dictionary_info is not None else None
+        while d:
+            info.append([d.filename, d.version])
+            d = d.next
+        return info
+
+    def __dict_state(self, set_dict):
+        return set_dict.digest if isinstance(set_dict, SentimentLexicon) else sorted(set_dict.items())
+
+    def __cached(self, func, *args):
+        key = ResultCache.make_key(self.__get_cache_namespace(), func.__name__, *args)
+        result = self._cache.get(key)
+        if result is None:
+            result = func(*args)
+            self._cache.put(key, result)
+        return result
+
+    @contextmanager
+    def timing(self):
+        '''
+        Description::
+            withブロック内の形態素解析について、正規化・MeCabの解析・後処理の時間を集計する
+            withブロックを実行したスレッドの処理だけを集計する（共有したインスタンスを他のスレッドが使っていても混ざらない）
+            （workersを指定したtokenize_batchなど、ワーカープロセスでの処理は集計されない）
+
+        Usage::
+            >>> import ToolsNLP
+            >>> m = ToolsNLP.MecabWrapper()
+            >>> with m.timing() as timer:
+            ...     m.tokenize_batch(texts)
+            >>> timer.info()
+            TokenizeStats(sentences=1000, tokens=15234, normalize_sec=0.05, parse_sec=0.41, post_sec=0.12)
+            >>>
+        '''
+        timer, self._local.timer = getattr(self._local, 'timer', None), TokenizeTimer()
+        try:
+            yield self._local.timer
+        finally:
+            self._local.timer = timer
+
+    def cache_info(self):
+        '''
+        Description::
+            キャッシュのヒット数（メモリ・ディスク）、ミス数、削除数、最大件数、現在の件数を返す
+            キャッシュを利用していない場合はNone
+
+        Usage::
+        >>> import ToolsNLP
+        >>> m = ToolsNLP.MecabWrapper(cache_size=1000)
+        >>> _ = m.tokenize(sentence='この2人のやりとりはやっぱり面白い')
+        >>> _ = m.tokenize(sentence='この2人のやりとりはやっぱり面白い')
+        >>> m.cache_info()
+        CacheInfo(hits=1, disk_hits=0, misses=1, evictions=0, maxsize=1000, currsize=1)
+        >>>
+        '''
+        return self._cache.info() if self._cache is not None else None
+
+    def cache_clear(self, is_disk=False):
+        '''
+        Description::
+            キャッシュを削除する。is_disk=Trueの場合はディスク層も削除する
+        '''
+        if self._cache is not None:
+            self._cache.clear(is_disk)
+
+    # mecab-config is only called when the path is needed and not given
+    @property
+    def _path_mecab_dict(self):
+        return self._dicdir or _mecab_config('dicdir')
+
+    @property
+    def _path_mecab_libexe(self):
+        return self._libexecdir or _mecab_config('libexecdir')
 
     def __CompileUserdict(self):
-        cmCompileDict = u'{0}/mecab-dict-index -d {1}/ipadic -u {2} -f utf-8 -t utf-8 {3} > /dev/null'.\
-                format(self._path_mecab_libexe, self._path_mecab_dict, self._userdict_name, self._userdict)
+        # compiled dict is cached by the contents of userdict and the system dict
+        path_sysdict = os.path.join(self._path_mecab_dict, 'ipadic')
+        key = hashlib.sha1()
+        with open(self._userdict, 'rb') as f:
+            key.update(f.read())
+        key.update(path_sysdict.encode('utf-8'))
+        if os.path.exists(os.path.join(path_sysdict, 'sys.dic')):
+            key.update(str(os.stat(os.path.join(path_sysdict, 'sys.dic')).st_mtime_ns).encode('utf-8'))
+        path_userdict = os.path.join(self._userdict_cache_dir, key.hexdigest() + '.dict')
+        if os.path.exists(path_userdict):
+            return path_userdict
+        os.makedirs(self._userdict_cache_dir, exist_ok=True)
+        # compile to a temporary file and rename it, so other processes never read a partial dict
+        fd, path_tmp = tempfile.mkstemp(dir=self._userdict_cache_dir, suffix='.tmp')
+        os.close(fd)
+        cmCompileDict = [os.path.join(self._path_mecab_libexe, 'mecab-dict-index'), '-d', path_sysdict, '-u', path_tmp, '-f', 'utf-8', '-t', 'utf-8', self._userdict]
         try:
-            subprocess.call(cmCompileDict, shell=True)
-        except OSError as e:
-            sys.exit('Failed to compile mecab userdict. System ends')
+            subprocess.check_call(cmCompileDict, stdout=subprocess.DEVNULL)
+            os.replace(path_tmp, path_userdict)
+        except (OSError, subprocess.CalledProcessError) as e:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            raise subprocess.CalledProcessError(returncode=-1, cmd="Failed to compile mecab userdict") from e
+        return path_userdict
 
-    def __CallMecab(self):
+    def __MecabArgs(self):
         cmMecabInitialize = ''
         if self._userdict:
-            self.__CompileUserdict()
-            cmMecabInitialize += '-u {} '.format(self._userdict_name)
+            self._userdict_path = self.__CompileUserdict()
+            cmMecabInitialize += '-u {} '.format(self._userdict_path)
         if self._dicttype == 'neologd':
             cmMecabInitialize += '-d {} '.format(os.path.join(self._path_mecab_dict, "mecab-ipadic-neologd"))
+        return cmMecabInitialize
+
+    def __CallMecab(self):
         try:
-            mecabObj = MeCab.Tagger(cmMecabInitialize)
+            mecabObj = MeCab.Tagger(self._mecab_args)
         except Exception as e:
             raise subprocess.CalledProcessError(returncode=-1, cmd="Failed to initialize Mecab object")
         return mecabObj
 
-    def _term_to_base(self, term, term_base, is_org):
-        if is_org:
-            return term if term_base == '*' else term_base
-        else:
-            return term
-
     def tokenize(self, sentence, pos_filter=[[]], is_normalized=True, is_org=True, is_pos=False, is_list=False):
         '''
         Description::
@@ -284,10 +548,222 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         ['草彅剛', 'レギュラー番組', '新しい別の窓', 'オオカミくんには騙されない']
         >>>
         '''
-        sentence_parsed = self._proc_normalized(sentence, is_normalized)
-        pos_result = self._proc_term(sentence_parsed, pos_filter ,is_org ,is_pos)
+        if self._cache is None:
+            pos_result = self._tokenize(sentence, pos_filter, is_normalized, is_org, is_pos)
+        else:
+            pos_result = self.__cached(self._tokenize, sentence, pos_filter, is_normalized, is_org, is_pos)
         return pos_result if is_list else ' '.join(map(str, filter(None, pos_result))).strip() # output: str or list
 
+    def tokenize_batch(self, sentences, workers=None, chunksize=None, **kwargs):
+        '''
+        Description::
+            複数のテキストをプロセスプールで並列にtermに分割する
+            ワーカープロセスごとに同じ設定（dicttype, userdict, stopword）のMecabインスタンスを生成する
+            （生成後にstopword_list, sentiment_dict, default_dict, negationを変更した場合は、変更後の設定を使う）
+            出力の順番と内容はtokenizeを1件ずつ実行した場合と同じ
+
+        :param sentences:
+            入力テキストの配列（イテラブル）
+        :param workers:
+            ワーカープロセス数
+            デフォルト：None（CPUコア数）
+            1の場合はプロセスプールを使わずに逐次実行する
+        :param chunksize:
+            ワーカープロセスに一度に渡すテキスト数
+            デフォルト：None（テキスト数とワーカー数から自動設定）
+        :param kwargs:
+            tokenizeのパラメータ（pos_filter, is_normalized, is_org, is_pos, is_list）
+
+        Usage::
+        >>> import ToolsNLP
+        >>> texts = ['稲垣吾郎さん、草彅剛さん、香取慎吾さんの3人によるレギュラー番組', '『7.2 新しい別の窓』や『オオカミくんには騙されない』']
+        >>> m = ToolsNLP.MecabWrapper(dicttype='neologd', userdict='userdict.csv', stopword='stopword.txt')
+        >>> m.tokenize_batch(texts, workers=2, pos_filter=[['名詞', '固有名詞', '一般']], is_list=True)
+        [['草彅剛', 'レギュラー番組'], ['新しい別の窓', 'オオカミくんには騙されない']]
+        >>>
+        '''
+        return self._map_workers('tokenize', sentences, workers, chunksize, **kwargs)
+
+    def tokenize_stream(self, sentences, workers=None, chunksize=None, batch_size=10000, **kwargs):
+        '''
+        Description::
+            tokenize_batchのジェネレータ版
+            入力をbatch_size件ずつプロセスプールに渡し、結果を入力の順番で1件ずつ返す
+            ファイルから読み込んだ大量のテキストでも、メモリ上に保持するのはbatch_size件分だけ
+
+        :param sentences:
+            入力テキストのイテラブル
+        :param workers:
+            ワーカープロセス数
+            デフォルト：None（CPUコア数）
+        :param chunksize:
+            ワーカープロセスに一度に渡すテキスト数
+            デフォルト：None（batch_sizeとワーカー数から自動設定）
+        :param batch_size:
+            一度にプロセスプールに渡すテキスト数
+            デフォルト：10000
+        :param kwargs:
+            tokenizeのパラメータ（pos_filter, is_normalized, is_org, is_pos, is_list）
+
+        Usage::
+        >>> import ToolsNLP
+        >>> m = ToolsNLP.MecabWrapper(dicttype='neologd')
+        >>> texts = (line.rstrip('\\n') for line in open('data.txt', 'r'))
+        >>> for tokens in m.tokenize_stream(texts, workers=4, is_list=True):
+        ...     pass
+        >>>
+        '''
+        return self._imap_workers('tokenize', sentences, workers, chunksize, batch_size, **kwargs)
+
+    def tokenize_store(self, sentences, workers=None, chunksize=None, batch_size=None, store=None, **kwargs):
+        '''
+        Description::
+            tokenize_batchの結果をTokenStore（語彙と整数IDの配列）で返す
+            termの文字列のリストより少ないメモリで保持でき、corpus.build_corpusにそのまま渡せる
+            is_pos=Trueの場合は品詞を整数コードで保持する（イテレートした結果はtokenize_batch(is_list=True)と同じ）
+
+        :param sentences:
+            入力テキストの配列（イテラブル）
+        :param workers:
+            ワーカープロセス数
+            デフォルト：None（CPUコア数）
+            1の場合はプロセスプールを使わずに逐次実行する
+        :param chunksize:
+            ワーカープロセスに一度に渡すテキスト数
+            デフォルト：None（テキスト数とワーカー数から自動設定）
+        :param batch_size:
+            一度にプロセスプールに渡すテキスト数
+            デフォルト：None（全件）
+        :param store:
+            追加先のTokenStore
+            デフォルト：None（新しく作る）
+        :param kwargs:
+            tokenizeのパラメータ（pos_filter, is_normalized, is_org, is_pos）
+
+        Usage::
+        >>> import ToolsNLP
+        >>> texts = ['稲垣吾郎さん、草彅剛さん、香取慎吾さんの3人によるレギュラー番組', '『7.2 新しい別の窓』や『オオカミくんには騙されない』']
+        >>> m = ToolsNLP.MecabWrapper(dicttype='neologd')
+        >>> store = m.tokenize_store(texts, workers=2, pos_filter=[['名詞', '固有名詞', '一般']], is_pos=True)
+        >>> list(store)
+        [['草彅剛:名詞-固有名詞-一般', 'レギュラー番組:名詞-固有名詞-一般'], ['新しい別の窓:名詞-固有名詞-一般', 'オオカミくんには騙されない:名詞-固有名詞-一般']]
+        >>> store.terms(0), store.pos(0)
+        (['草彅剛', 'レギュラー番組'], ['名詞-固有名詞-一般', '名詞-固有名詞-一般'])
+        >>>
+        '''
+        from ToolsNLP.token_store import TokenStore
+
+        is_pos = kwargs.get('is_pos', False)
+        if store is None:
+            store = TokenStore(is_pos=is_pos)
+        elif store.is_pos != is_pos:
+            raise ValueError('is_pos={} does not match the TokenStore (is_pos={})'.format(is_pos, store.is_pos))
+        kwargs['is_list'] = True
+        store.extend(self._imap_workers('tokenize', sentences, workers, chunksize, batch_size, **kwargs))
+        return store
+
+    def score_sentiment_batch(self, texts, workers=None, chunksize=None, is_detail=False):
+        '''
+        Description::
+            複数のテキストのポジネガをプロセスプールで並列に集計する
+            テキストの正規化と文分割は1回だけ行う
+            ドキュメント別の集計結果をデータフレーム（ドキュメントの順番のindex）で返す
+                score：文のスコアの平均（tokenize_sentiment(is_term=True)のscoreの平均）。ポジネガ単語がない場合はNaN
+                positive, negative：ポジティブ・ネガティブと判定された単語数
+                sentence_cnt：文の数
+                scored_cnt：ポジネガ単語を含む文の数
+
+        :param texts:
+            入力テキストの配列（イテラブル）
+        :param workers:
+            ワーカープロセス数
+            デフォルト：None（CPUコア数）
+            1の場合はプロセスプールを使わずに逐次実行する
+        :param chunksize:
+            ワーカープロセスに一度に渡すテキスト数
+            デフォルト：None（テキスト数とワーカー数から自動設定）
+        :param is_detail:
+            文別の集計結果のデータフレームもあわせて返すかどうか
+            列：doc（ドキュメントの番号）, sentence（文の番号）, score, cnt, positive, negative
+            デフォルトがFalse（ドキュメント別の集計結果のみ）
+
+        Usage::
+        >>> import ToolsNLP
+        >>> texts = ['この2人のやりとりはやっぱり面白い！観てて飽きない！', '今日は天気が悪い。']
+        >>> m = ToolsNLP.MecabWrapper(dicttype='neologd')
+        >>> m.score_sentiment_batch(texts, workers=2)
+           score  positive  negative  sentence_cnt  scored_cnt
+        0    1.0         2         0             2           2
+        1   -1.0         0         1             1           1
+        >>>
+        >>> doc_df, sentence_df = m.score_sentiment_batch(texts, workers=2, is_detail=True)
+        >>> sentence_df
+           doc  sentence  score  cnt  positive  negative
+        0    0         0    1.0    1         1         0
+        1    0         1    1.0    1         1         0
+        2    1         0   -1.0    1         0         1
+        >>>
+        '''
+        import numpy as np
+        import pandas as pd
+
+        results = self._map_workers('_score_sentiment', texts, workers, chunksize)
+        doc_cnt = len(results)
+        sentence_cnt = np.fromiter((result[0] for result in results), dtype=np.int64, count=doc_cnt)
+        rows_cnt = np.fromiter((len(result[1]) for result in results), dtype=np.int64, count=doc_cnt)
+        sentence_df = pd.DataFrame(
+            [row for result in results for row in result[1]]
+            ,columns=['sentence', 'score', 'cnt', 'positive', 'negative']
+            ).astype({'sentence': np.int64, 'score': np.float64, 'cnt': np.int64, 'positive': np.int64, 'negative': np.int64})
+        sentence_df.insert(0, 'doc', np.repeat(np.arange(doc_cnt, dtype=np.int64), rows_cnt))
+
+        doc = sentence_df['doc'].to_numpy()
+        score_sum = np.bincount(doc, weights=sentence_df['score'].to_numpy(), minlength=doc_cnt)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = score_sum / rows_cnt
+        doc_df = pd.DataFrame({
+            'score': np.where(rows_cnt > 0, score, np.nan)
+            ,'positive': np.bincount(doc, weights=sentence_df['positive'].to_numpy(), minlength=doc_cnt).astype(np.int64)
+            ,'negative': np.bincount(doc, weights=sentence_df['negative'].to_numpy(), minlength=doc_cnt).astype(np.int64)
+            ,'sentence_cnt': sentence_cnt
+            ,'scored_cnt': rows_cnt
+            })
+        return (doc_df, sentence_df) if is_detail else doc_df
+
+    def _map_workers(self, method, items, workers=None, chunksize=None, **kwargs):
+        return list(self._imap_workers(method, items, workers, chunksize, None, **kwargs))
+
+    def _imap_workers(self, method, items, workers=None, chunksize=None, batch_size=None, **kwargs):
+        # batch_size=None passes every item to the pool at once
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            func = getattr(self, method)
+            for item in items:
+                yield func(item, **kwargs)
+            return
+        import multiprocessing
+        items = iter(items)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self._config, self._changed_state())) as pool:
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    return
+                batch_chunksize = chunksize
+                if batch_chunksize is None:
+                    batch_chunksize, extra = divmod(len(batch), workers * 4)
+                    batch_chunksize = batch_chunksize + 1 if extra else max(batch_chunksize, 1)
+                yield from pool.imap(partial(_call_worker, method, **kwargs), batch, batch_chunksize)
+                if batch_size is None:
+                    return
+
+    def _changed_state(self):
+        # 生成後にsetterで変更した設定（メモリマップの辞書はpickleできないのでdictにする）
+        state = {}
+        for name in self._MUTABLE_STATE:
+            value = getattr(self, name)
+            if value is not self._initial_state[name]:
+                state[name] = dict(value) if isinstance(value, (types.MappingProxyType, SentimentLexicon)) else value
+        return state
 
     def tokenize_sentiment(self, text, is_term=False):
         '''
@@ -311,10 +787,20 @@ class MecabWrapper(Tokenizer, TokenizerSentiment):
         [{'score': 1.0, 'cnt': 1, 'polarities': [['面白い', 1]]}, {'score': 1.0, 'cnt': 1, 'polarities': [['飽きる-ない', 1]]}]
         >>>
         '''
-        scores = []
-        for sentence in self._split_sentence(text):
-            score = self._proc_sentiment(sentence, is_term)
-            if score:
-                scores.append(score)
-        return scores
+        if self._cache is None:
+            return self._tokenize_sentiment(text, is_term)
+        return self.__cached(self._tokenize_sentiment, text, is_term)
+
+
+
+# worker process state for MecabWrapper._map_workers
+_worker_mecab = None
+
+def _init_worker(config, state=None):
+    global _worker_mecab
+    _worker_mecab = MecabWrapper(**config)
+    for name, value in (state or {}).items():
+        setattr(_worker_mecab, name, value)
 
+def _call_worker(method, item, **kwargs):
+    return getattr(_worker_mecab, method)(item, **kwargs)
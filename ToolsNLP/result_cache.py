@@ -0,0 +1,94 @@
+#! -*- coding: utf-8 -*-
+
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'disk_hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class ResultCache:
+    '''
+    Description::
+        形態素解析・センチメント分析の結果キャッシュ
+        メモリ上はLRUで件数上限を超えたものから削除する
+        pathを指定するとsqliteファイルをディスク層として利用し、プロセスをまたいで結果を再利用する
+        値はJSON文字列で保持するため、呼び出し側で結果を書き換えてもキャッシュには影響しない
+
+    :param maxsize:
+        メモリ上に保持する最大件数
+    :param path:
+        ディスク層のsqliteファイルのパス
+        デフォルト：''（ディスク層を利用しない）
+    '''
+    def __init__(self, maxsize, path=''):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._disk_hits = self._misses = self._evictions = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.commit()
+
+    @staticmethod
+    def make_key(namespace, *args):
+        '''
+        Description::
+            設定のフィンガープリント（namespace）と引数からキャッシュキーを生成する
+        '''
+        return hashlib.sha1(json.dumps([namespace, args], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self._hits += 1
+                return json.loads(self._data[key])
+            value = None
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+                if row:
+                    value = row[0]
+                    self._disk_hits += 1
+                    self.__set(key, value)
+            if value is None:
+                self._misses += 1
+                return None
+        return json.loads(value)
+
+    def put(self, key, result):
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self.__set(key, value)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)', (key, value))
+                self._db.commit()
+
+    def __set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self, is_disk=False):
+        '''
+        Description::
+            メモリ上のキャッシュを削除する。is_disk=Trueの場合はディスク層も削除する
+        '''
+        with self._lock:
+            self._data.clear()
+            if is_disk and self._db is not None:
+                self._db.execute('DELETE FROM cache')
+                self._db.commit()
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._disk_hits, self._misses, self._evictions, self._maxsize, len(self._data))
@@ -0,0 +1,282 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import mmap
+import site
+import struct
+import hashlib
+import argparse
+import tempfile
+from zlib import crc32
+from collections.abc import Mapping
+
+
+MAGIC = b'TNLPLEX1'
+# MAGIC, digest, table count / (offset, size) per table / (entries, hash slots)
+HEADER = struct.Struct('<8s20sI')
+TABLE = struct.Struct('<QQ')
+TABLE_HEADER = struct.Struct('<II')
+TABLE_NAMES = ('user', 'default')
+# 検索結果をメモする件数（頻出する単語はハッシュ表を引かずに返す）
+MEMO_SIZE = 1 << 16
+# プロセス内で読み込み済みのファイル {(path, mtime, size): (ユーザ辞書, デフォルト辞書)}
+_loaded = {}
+
+
+def to_polarity(value):
+    '''
+    Description::
+        辞書の極性（p/n, ポジ/ネガ）を整数（1/-1）に変換する
+    '''
+    if isinstance(value, int):
+        return value
+    return 1 if value == 'p' or value.startswith('ポジ') else -1
+
+
+def _json_to_dict(fname):
+    sitedir = site.getsitepackages()[-1]
+    installdir = os.path.join(sitedir, 'ToolsNLP')
+    dict_path = installdir + "/sentiment_dict/" + fname
+    return json.load(open(dict_path, 'r'))
+
+
+def load_sentiment_dict(fname=''):
+    '''
+    Description::
+        デフォルトの極性辞書（pn_noun.json, pn_wago.json）とユーザの極性辞書を読み込む
+        ユーザ辞書でニュートラル（e, ニュートラル）を指定した単語はどちらの辞書からも除外する
+
+    :param fname:
+        ユーザの極性辞書ファイル名（1行「単語,極性」）
+
+    :return:
+        (ユーザ辞書, デフォルト辞書) 極性は整数（1/-1）
+    '''
+    default_dict = {**_json_to_dict('pn_noun.json') ,**_json_to_dict('pn_wago.json')}
+    sentiment_dict = {}
+    if fname:
+        for line in open(fname, 'r'):
+            word, polarity = line.strip().split(',')
+            sentiment_dict[word] = polarity
+
+        for k, v in list(sentiment_dict.items()):
+            if v == 'e' or v == 'ニュートラル':
+                del sentiment_dict[k]
+                if k in default_dict:
+                    del default_dict[k]
+    return ({k: to_polarity(v) for k, v in sentiment_dict.items()}
+            ,{k: to_polarity(v) for k, v in default_dict.items()})
+
+
+def _pack_table(table):
+    keys = [k.encode('utf-8') for k in table]
+    n = len(keys)
+    n_slots = 8
+    while n_slots < n * 2:
+        n_slots *= 2
+    slots = [0] * n_slots
+    for i, key in enumerate(keys):
+        j = crc32(key) & (n_slots - 1)
+        while slots[j]:
+            j = (j + 1) & (n_slots - 1)
+        slots[j] = i + 1
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    polarities = bytes((v & 0xff) for v in table.values())
+    padding = b'\0' * (-n % 4)
+    return b''.join([TABLE_HEADER.pack(n, n_slots)
+                    ,struct.pack('<{}I'.format(n_slots), *slots)
+                    ,struct.pack('<{}I'.format(n + 1), *offsets)
+                    ,polarities, padding
+                    ,b''.join(keys)])
+
+
+def compile_sentiment_lexicon(output, sentimentdict=''):
+    '''
+    Description::
+        デフォルトの極性辞書とユーザの極性辞書をまとめてバイナリ形式にコンパイルする
+        極性は整数で保持し、MecabWrapper(lexicon=...)からメモリマップで読み込む
+        書き込みは一時ファイル経由で置き換えるため、読み込み中のプロセスに影響しない
+
+    :param output:
+        出力ファイル名
+    :param sentimentdict:
+        ユーザの極性辞書ファイル名（MecabWrapperのsentimentdictと同じ形式）
+
+    Usage::
+        >>> import ToolsNLP
+        >>> ToolsNLP.compile_sentiment_lexicon('pn.lex', sentimentdict='sentiment.csv')
+        >>> m = ToolsNLP.MecabWrapper(lexicon='pn.lex')
+        >>>
+    '''
+    tables = [_pack_table(table) for table in load_sentiment_dict(sentimentdict)]
+    data = bytearray(HEADER.size + TABLE.size * len(tables))
+    for i, table in enumerate(tables):
+        data += b'\0' * (-len(data) % 8)
+        TABLE.pack_into(data, HEADER.size + TABLE.size * i, len(data), len(table))
+        data += table
+    HEADER.pack_into(data, 0, MAGIC, hashlib.sha1(data[HEADER.size:]).digest(), len(tables))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, output)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class SentimentLexicon(Mapping):
+    '''
+    Description::
+        compile_sentiment_lexiconで作成したファイルの1テーブル（ユーザ辞書 or デフォルト辞書）
+        ファイルをメモリマップしたまま参照するため、複数プロセスで同じページを共有できる
+        {単語: 極性(1/-1)} の読み取り専用の辞書として扱う
+    '''
+    def __init__(self, buf, offset, size, digest):
+        view = memoryview(buf)[offset:offset + size]
+        n, n_slots = TABLE_HEADER.unpack_from(view)
+        pos = TABLE_HEADER.size
+        self._slots = view[pos:pos + n_slots * 4].cast('I')
+        pos += n_slots * 4
+        self._offsets = view[pos:pos + (n + 1) * 4].cast('I')
+        pos += (n + 1) * 4
+        self._polarities = view[pos:pos + n].cast('b')
+        pos += n + (-n % 4)
+        self._keys = view[pos:]
+        self._len = n
+        self._mask = n_slots - 1
+        self._memo = {}
+        self._trie = None
+        self.digest = digest
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Description::
+            コンパイル済みファイルをメモリマップして(ユーザ辞書, デフォルト辞書)を返す
+            同じプロセスで同じファイル（更新日時・サイズが同じ）を読み込む場合は読み込み済みのものを返す
+        '''
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if key not in _loaded:
+            _loaded[key] = cls.__load(path)
+        return _loaded[key]
+
+    @classmethod
+    def __load(cls, path):
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, digest, table_count = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError('{} is not a compiled sentiment lexicon'.format(path))
+        tables = []
+        for i in range(table_count):
+            offset, size = TABLE.unpack_from(buf, HEADER.size + TABLE.size * i)
+            tables.append(cls(buf, offset, size, '{}:{}'.format(digest.hex(), TABLE_NAMES[i])))
+        return tuple(tables)
+
+    @property
+    def trie(self):
+        '''
+        Description::
+            複数語のエントリのWagoTrie（初回参照時に作成する）
+        '''
+        if self._trie is None:
+            self._trie = WagoTrie(self)
+        return self._trie
+
+    def __find(self, key):
+        e = self._memo.get(key)
+        if e is not None:
+            return e
+        encoded = key.encode('utf-8')
+        slots, offsets, keys = self._slots, self._offsets, self._keys
+        i = crc32(encoded) & self._mask
+        e = -1
+        while slots[i]:
+            if keys[offsets[slots[i] - 1]:offsets[slots[i]]] == encoded:
+                e = slots[i] - 1
+                break
+            i = (i + 1) & self._mask
+        if len(self._memo) < MEMO_SIZE:
+            self._memo[key] = e
+        return e
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.__find(key) >= 0
+
+    def __getitem__(self, key):
+        e = self.__find(key) if isinstance(key, str) else -1
+        if e < 0:
+            raise KeyError(key)
+        return self._polarities[e]
+
+    def get(self, key, default=None):
+        e = self.__find(key) if isinstance(key, str) else -1
+        return default if e < 0 else self._polarities[e]
+
+    def __iter__(self):
+        keys = bytes(self._keys)
+        offsets = self._offsets.tolist()
+        for e in range(self._len):
+            yield keys[offsets[e]:offsets[e + 1]].decode('utf-8')
+
+    def items(self):
+        return list(zip(self, self._polarities.tolist()))
+
+    def __len__(self):
+        return self._len
+
+
+class WagoTrie:
+    '''
+    Description::
+        複数語の極性辞書エントリ（例：'颯爽 の'）を語の逆順にたどるトライ
+        直前のlemma列（最大n個）と現在のlemmaの連結に一致する最長のエントリを、文字列を連結せずに探す
+    '''
+    def __init__(self, set_dict):
+        self._root = {}
+        for key, polarity in set_dict.items():
+            if ' ' not in key:
+                continue
+            node = self._root
+            for word in reversed(key.split(' ')):
+                node = node.setdefault(word, {})
+            node[None] = (key, polarity)
+
+    def longest_match(self, lemma, lemmas, n=5):
+        '''
+        Description::
+            ' '.join(lemmas[-i:]) + ' ' + lemma が辞書にある最大のi（1..n）について(エントリ, 極性)を返す
+            一致しない場合はNone
+        '''
+        node = self._root
+        for word in reversed(lemma.split(' ')) if ' ' in lemma else (lemma,):
+            node = node.get(word)
+            if node is None:
+                return None
+        match = None
+        # lemmasが空の場合の連結は ' ' + lemma
+        for element in reversed(lemmas[-n:] if lemmas else ['']):
+            for word in reversed(element.split(' ')) if ' ' in element else (element,):
+                node = node.get(word)
+                if node is None:
+                    return match
+            match = node.get(None, match)
+        return match
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='compile sentiment dictionaries into a memory-mappable lexicon')
+    parser.add_argument('output')
+    parser.add_argument('--sentimentdict', default='')
+    args = parser.parse_args(argv)
+    compile_sentiment_lexicon(args.output, args.sentimentdict)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
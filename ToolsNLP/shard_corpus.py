@@ -0,0 +1,397 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+from collections import Counter
+import gensim
+import numpy as np
+from ToolsNLP import corpus
+from ToolsNLP.mecab_wrapper import MecabWrapper
+
+
+# 形態素解析結果に影響しないMecabWrapperの設定（シャードのキーに含めない）
+_IGNORED_CONFIG = ('cache_size', 'cache_path', 'userdict_cache_dir', 'sentimentdict', 'negation', 'lexicon')
+
+
+class Shards:
+    '''
+    Description::
+        TopicModelWrapperのdataにシャードのリストを渡すためのラッパー
+        （[entry_id, sentence]のリストと区別するため、シャードで処理する場合は必ずShardsで指定する）
+
+    :param sources:
+        シャード（TSVファイルのパス、または[entry_id, sentence]のリスト）のリスト
+
+    Usage::
+        >>> import ToolsNLP
+        >>> t = ToolsNLP.TopicModelWrapper(data=ToolsNLP.Shards(['data_01.tsv', 'data_02.tsv']), corpus_dir='corpus_cache')
+        >>>
+    '''
+    def __init__(self, sources):
+        self.sources = list(sources)
+        for source in self.sources:
+            if not isinstance(source, (str, list, tuple)):
+                raise TypeError('shard must be a path or a list of [entry_id, sentence]: {!r}'.format(type(source)))
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+
+class Shard:
+    '''
+    Description::
+        tokenize_shardsで作成した1シャードのキャッシュ（ディレクトリ）
+        形態素解析結果(tokens.txt, TokenFile)、entry_id(urls.json)、語彙ごとの出現頻度と文書頻度(counts.json)、
+        メタ情報(shard.json)を持つ。shard.jsonがあるディレクトリだけが作成済みのシャード
+
+    :param path:
+        シャードのディレクトリ
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'shard.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.key = meta['key']
+        self.source = meta['source']
+        self.n_docs = meta['n_docs']
+        self.n_tokens = meta['n_tokens']
+        # tokenize_shardsでキャッシュを使った（形態素解析しなかった）かどうか
+        self.is_cached = True
+
+    @property
+    def texts(self):
+        token_file = corpus.TokenFile(os.path.join(self.path, 'tokens.txt'))
+        token_file._len, token_file.n_tokens = self.n_docs, self.n_tokens
+        return token_file
+
+    @property
+    def urls(self):
+        with open(os.path.join(self.path, 'urls.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def counts(self):
+        '''
+        Description::
+            count_termsと同じ形式で、シャードの語彙ごとの出現頻度と文書頻度を返す
+        '''
+        with open(os.path.join(self.path, 'counts.json'), 'r', encoding='utf-8') as f:
+            counts = json.load(f)
+        return counts['terms'], np.array(counts['cfs'], dtype=np.int64), np.array(counts['dfs'], dtype=np.int64), self.n_docs
+
+
+def shard_key(source, config):
+    '''
+    Description::
+        シャードの入力（TSVファイルの中身、または[entry_id, sentence]の列）と形態素解析の設定のハッシュを返す
+        キーが同じシャードは形態素解析をやりなおさない
+    '''
+    h = hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    else:
+        for record in source:
+            h.update(json.dumps(list(record), ensure_ascii=False).encode('utf-8'))
+            h.update(b'\n')
+    return h.hexdigest()
+
+
+def _tokenize_config(config_mw, config_tn):
+    config = {k: v for k, v in config_mw.items() if k not in _IGNORED_CONFIG}
+    # ユーザー辞書とストップワードはファイルの中身もキーに含める
+    for name in ('userdict', 'stopword'):
+        if config.get(name) and os.path.isfile(config[name]):
+            with open(config[name], 'rb') as f:
+                config[name] = [config[name], hashlib.sha1(f.read()).hexdigest()]
+    return {'config_mw': config, 'config_tn': config_tn}
+
+
+def count_terms(texts):
+    '''
+    Description::
+        termの配列のイテラブルから、語彙ごとの出現頻度と文書頻度を数える（語彙は辞書順）
+
+    :return:
+        (term_list（辞書順）, 出現頻度の配列, 文書頻度の配列, ドキュメント数)
+    '''
+    cfs, dfs = Counter(), Counter()
+    n_docs = 0
+    for doc in texts:
+        cfs.update(doc)
+        dfs.update(set(doc))
+        n_docs += 1
+    terms = sorted(cfs)
+    return terms, np.array([cfs[w] for w in terms], dtype=np.int64), np.array([dfs[w] for w in terms], dtype=np.int64), n_docs
+
+
+def merge_counts(counts):
+    '''
+    Description::
+        count_termsの結果（シャードごと）を足し合わせる
+        語彙は辞書順に並べるので、シャードの分け方・順番によらず同じIDになる
+
+    Usage::
+        >>> from ToolsNLP import shard_corpus
+        >>> a = shard_corpus.count_terms([['天気', '晴れ'], ['天気']])
+        >>> b = shard_corpus.count_terms([['株価', '天気', '天気']])
+        >>> terms, cfs, dfs, n_docs = shard_corpus.merge_counts([b, a])
+        >>> terms, cfs.tolist(), dfs.tolist(), n_docs
+        (['天気', '晴れ', '株価'], [4, 1, 1], [3, 1, 1], 3)
+        >>>
+    '''
+    terms = sorted(set().union(*(c[0] for c in counts)))
+    index = {w: i for i, w in enumerate(terms)}
+    cfs = np.zeros(len(terms), dtype=np.int64)
+    dfs = np.zeros(len(terms), dtype=np.int64)
+    n_docs = 0
+    for shard_terms, shard_cfs, shard_dfs, shard_n_docs in counts:
+        # シャードの中では語彙は重複しないので、そのまま加算できる
+        ids = np.fromiter((index[w] for w in shard_terms), dtype=np.int64, count=len(shard_terms))
+        cfs[ids] += shard_cfs
+        dfs[ids] += shard_dfs
+        n_docs += shard_n_docs
+    return terms, cfs, dfs, n_docs
+
+
+def tokenize_shards(sources, cache_dir, config_mw={}, config_tn={}, workers=None):
+    '''
+    Description::
+        シャード（TSVファイルのパス、または[entry_id, sentence]のリスト）ごとに形態素解析し、語彙ごとの出現頻度と文書頻度を数える
+        シャードは別々のプロセスで処理し、結果はcache_dir/shards/<キー>に書き出す
+        入力と設定が同じシャード（キャッシュ済み）は処理しない。同じcache_dirを共有すれば、複数のマシンで分担して作成できる
+        処理したシャードの一覧はcache_dir/manifest.jsonに書き出す
+
+    :param sources:
+        シャードのリスト
+    :param cache_dir:
+        キャッシュのディレクトリ
+    :param config_mw:
+        MecabWrapperのパラメータ
+    :param config_tn:
+        MecabWrapper.tokenizeのパラメータ
+    :param workers:
+        並列プロセス数
+        デフォルト：None（CPUコア数）
+
+    :return:
+        Shardのリスト（sourcesと同じ順番）
+    '''
+    config = _tokenize_config(config_mw, config_tn)
+    shard_dir = os.path.join(cache_dir, 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    keys = [shard_key(source, config) for source in sources]
+    tasks, queued = [], set()
+    for source, key in zip(sources, keys):
+        if key not in queued and not os.path.exists(os.path.join(shard_dir, key, 'shard.json')):
+            tasks.append((source, os.path.join(shard_dir, key), config_tn))
+            queued.add(key)
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        _init_shard_worker(config_mw)
+        list(map(_tokenize_shard, tasks))
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(workers, initializer=_init_shard_worker, initargs=(config_mw,)) as pool:
+            # シャードごとの処理時間が大きいので1件ずつ渡す
+            list(pool.imap_unordered(_tokenize_shard, tasks, 1))
+    manifest = {'config': config
+                ,'shards': [{'source': source if isinstance(source, str) else None, 'key': key} for source, key in zip(sources, keys)]
+                ,'tokenized': [os.path.basename(task[1]) for task in tasks]
+                }
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    shards = [Shard(os.path.join(shard_dir, key)) for key in keys]
+    for shard in shards:
+        shard.is_cached = shard.key not in queued
+        # 最後に使った時刻（prune_cacheで使っていないシャードを判定する）
+        _touch(os.path.join(shard.path, 'shard.json'))
+    return shards
+
+
+def build_corpus_shards(shards, masks=None, is_1len=True, is_term_fq=True, limitcnt=3, toprate=0.05, workers=None):
+    '''
+    Description::
+        シャードの出現頻度と文書頻度を足し合わせて辞書を作り、ストップタームの除外を全シャードの頻度で行う
+        BoWのコーパスはシャードごとに別々のプロセスで書き出す（cache_dir/shards/<キー>/corpus_<辞書のハッシュ>.mm）
+        別の辞書のコーパスは削除しない（キャッシュを共有する他のモデルが使っている可能性がある。prune_cacheで削除する）
+        辞書のIDは辞書順に振るので、シャードの分け方によらず同じ辞書になる
+
+    :param shards:
+        tokenize_shardsの結果
+    :param masks:
+        シャードごとの、残すドキュメントのbool配列（Noneのシャードは全件）
+        指定したシャードは残すドキュメントだけで頻度を数えなおす
+
+    :return:
+        (gensim.corpora.Dictionary, シャードのMmCorpusを連結したコーパス, 除外後のtermの配列のコーパス（シャードのTokenFileを連結したもの）)
+    '''
+    masks = [None] * len(shards) if masks is None else masks
+    counts = [shard.counts() if mask is None else count_terms(shard.texts.subset(mask)) for shard, mask in zip(shards, masks)]
+    terms, cfs, dfs, n_docs = merge_counts(counts)
+    keep = corpus.stop_term_mask(terms, cfs, is_1len, is_term_fq, limitcnt, toprate)
+    kept_terms = [w for w, k in zip(terms, keep) if k]
+    # 除外しなかった語彙の文書頻度はそのまま使える（BoWの要素数は文書頻度の合計）
+    dictionary = corpus._make_dictionary(kept_terms, cfs[keep], dfs[keep], n_docs, int(cfs[keep].sum()), int(dfs[keep].sum()))
+
+    dictionary_key = hashlib.sha1(json.dumps(kept_terms, ensure_ascii=False).encode('utf-8'))
+    paths, tasks = [], []
+    for shard, mask in zip(shards, masks):
+        h = dictionary_key.copy()
+        if mask is not None:
+            h.update(np.packbits(np.asarray(mask, dtype=bool)).tobytes())
+        path = os.path.join(shard.path, 'corpus_{}.mm'.format(h.hexdigest()[:16]))
+        paths.append(path)
+        if os.path.exists(path):
+            _touch(path)
+        else:
+            tasks.append((shard.texts if mask is None else shard.texts.subset(mask), path))
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        _init_bow_worker(dictionary.token2id)
+        list(map(_write_shard_bow, tasks))
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(workers, initializer=_init_bow_worker, initargs=(dictionary.token2id,)) as pool:
+            list(pool.imap_unordered(_write_shard_bow, tasks, 1))
+    bows = corpus.ConcatCorpus([gensim.corpora.MmCorpus(path) for path in paths])
+    texts = corpus.ConcatCorpus([(shard.texts if mask is None else shard.texts.subset(mask)).filter(dictionary.token2id)
+                                for shard, mask in zip(shards, masks)])
+    return dictionary, bows, texts
+
+
+def prune_cache(cache_dir, keep=(), max_age=7 * 24 * 3600, dry_run=False):
+    '''
+    Description::
+        シャードのキャッシュ（cache_dir/shards）から、使われていないシャード・コーパス・一時ファイルを削除する
+        tokenize_shards, build_corpus_shardsは使ったシャード(shard.json)・コーパス(corpus_*.mm)の更新時刻を更新するので、
+        更新時刻がmax_age秒より古いものだけを削除する（書き出し中の一時ファイルも、更新が止まってからmax_age秒は残す）
+        シャードのディレクトリは中のファイルがすべて古い場合だけ削除し、残すシャードの中では古いコーパス・一時ファイルだけを削除する
+        keepに指定したシャードのディレクトリ・コーパスは古くても削除しない（keepのシャードの中の古いコーパスは削除する）
+
+    :param cache_dir:
+        キャッシュのディレクトリ
+    :param keep:
+        削除しないシャード（Shard）、またはシャードのディレクトリ・コーパスのパスのリスト
+    :param max_age:
+        最後に使ってから削除するまでの秒数
+        デフォルト：7日
+    :param dry_run:
+        Trueの場合は削除せずに、削除するパスだけを返す
+
+    :return:
+        削除した（dry_run=Trueの場合は削除する）パスのリスト
+
+    Usage::
+        >>> from ToolsNLP import shard_corpus
+        >>> shard_corpus.prune_cache('corpus_cache', keep=t._shards, max_age=24 * 3600)
+        >>>
+    '''
+    keep = set(os.path.abspath(k.path if isinstance(k, Shard) else k) for k in keep)
+    deadline = time.time() - max_age
+    shard_dir = os.path.join(cache_dir, 'shards')
+    removed = []
+    for name in sorted(os.listdir(shard_dir)) if os.path.isdir(shard_dir) else []:
+        path = os.path.join(shard_dir, name)
+        # シャード（作成中を含む）は中のファイルが1つでも新しければ残す
+        candidates = [path] if os.path.abspath(path) not in keep and _last_modified(path) < deadline else []
+        if not candidates and os.path.exists(os.path.join(path, 'shard.json')):
+            # 残すシャードの中の、使われていないコーパスと一時ファイル（.mmと.mm.indexは組で判定する）
+            for fname in sorted(os.listdir(path)):
+                if not fname.startswith('corpus_') or fname.endswith('.index') and os.path.exists(os.path.join(path, fname[:-len('.index')])):
+                    continue
+                file_path = os.path.join(path, fname)
+                related = [file_path] + ([file_path + '.index'] if os.path.exists(file_path + '.index') else [])
+                if os.path.abspath(file_path) not in keep and all(os.path.getmtime(p) < deadline for p in related):
+                    candidates.extend(related)
+        for candidate in candidates:
+            removed.append(candidate)
+            if dry_run:
+                continue
+            if os.path.isdir(candidate):
+                shutil.rmtree(candidate, ignore_errors=True)
+            elif os.path.exists(candidate):
+                os.remove(candidate)
+    return removed
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        # 読み取り専用のキャッシュでは更新しない
+        pass
+
+
+def _last_modified(path):
+    # ディレクトリ自体の更新時刻はprune_cacheでファイルを削除しても変わるので、ファイルがない場合だけ使う
+    mtimes = []
+    for root, _, fnames in os.walk(path):
+        mtimes.extend(os.path.getmtime(os.path.join(root, fname)) for fname in fnames)
+    return max(mtimes) if mtimes else os.path.getmtime(path)
+
+
+# worker process state for tokenize_shards
+_shard_mecab = None
+
+def _init_shard_worker(config_mw):
+    global _shard_mecab
+    _shard_mecab = MecabWrapper(**config_mw)
+
+def _tokenize_shard(task):
+    source, path, config_tn = task
+    # 一時ディレクトリに書き出してから置き換える（書き出し途中のシャードをキャッシュとして使わない）
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.tmp_')
+    try:
+        records = corpus.read_tsv(source) if isinstance(source, str) else source
+        urls = []
+        def docs():
+            for record in records:
+                urls.append(record[0])
+                yield _shard_mecab.tokenize(record[1], is_list=True, **config_tn)
+        texts = corpus.TokenFile.write(os.path.join(tmp, 'tokens.txt'), docs())
+        terms, cfs, dfs, n_docs = count_terms(texts)
+        with open(os.path.join(tmp, 'urls.json'), 'w', encoding='utf-8') as f:
+            json.dump(urls, f, ensure_ascii=False)
+        with open(os.path.join(tmp, 'counts.json'), 'w', encoding='utf-8') as f:
+            json.dump({'terms': terms, 'cfs': cfs.tolist(), 'dfs': dfs.tolist()}, f, ensure_ascii=False)
+        with open(os.path.join(tmp, 'shard.json'), 'w', encoding='utf-8') as f:
+            json.dump({'key': os.path.basename(path), 'source': source if isinstance(source, str) else None
+                        ,'n_docs': n_docs, 'n_tokens': texts.n_tokens}, f, ensure_ascii=False)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # 他のプロセス・マシンが同じシャードを先に作成した
+            if not os.path.exists(os.path.join(path, 'shard.json')):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# worker process state for build_corpus_shards
+_bow_token2id = None
+
+def _init_bow_worker(token2id):
+    global _bow_token2id
+    _bow_token2id = token2id
+
+def _write_shard_bow(task):
+    texts, path = task
+    token2id = _bow_token2id
+    def bows():
+        for doc in texts:
+            yield sorted(Counter(token2id[w] for w in doc if w in token2id).items())
+    # 書き出してから置き換える（.mmがあればindexも作成済み）
+    # 一時ファイル名は書き出すプロセスごとに一意にする（キャッシュを共有する他のマシンと衝突しない）
+    path_tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    gensim.corpora.MmCorpus.serialize(path_tmp, bows(), id2word=token2id)
+    os.replace(path_tmp + '.index', path + '.index')
+    os.replace(path_tmp, path)
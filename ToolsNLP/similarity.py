@@ -0,0 +1,178 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy as np
+import scipy.sparse
+
+
+class SimilarityIndex:
+    '''
+    Description::
+        ドキュメントのベクトル（ドキュメント×トピックのスコア）のコサイン類似度で、類似ドキュメントを検索する
+        ベクトルはL2ノルムで正規化した疎行列（CSR, float32）で保持し、クエリとの内積（疎行列×ベクトル）で全件のスコアを計算する
+        行列はドキュメントのスコアが最大のトピック（代表トピック）の順に並べ替え、代表トピックごとの範囲（リスト）を持つ
+        mode='approximate'の場合は、クエリのスコア上位n_probe個のトピックを代表トピックとするドキュメントだけを検索する
+        （検索するドキュメント数が減るので速いが、代表トピックが異なる類似ドキュメントは見つからない）
+
+    :param vectors:
+        ドキュメント×次元の行列（scipy.sparseまたはnumpy.ndarray）
+    :param mode:
+        'exact'：全ドキュメントを検索する
+        'approximate'：クエリの上位n_probe個のトピックのリストだけを検索する
+        デフォルト：'exact'
+    :param n_probe:
+        approximateで検索するトピック数
+        デフォルト：3
+
+    Usage::
+        >>> import numpy as np
+        >>> from ToolsNLP.similarity import SimilarityIndex
+        >>> index = SimilarityIndex(np.array([[0.9, 0.1, 0.0], [0.0, 0.2, 0.8], [0.8, 0.2, 0.0]]))
+        >>> docs, scores = index.search(np.array([[1.0, 0.0, 0.0]]), k=2)
+        >>> docs
+        array([[0, 2]])
+        >>> np.round(scores, 3)
+        array([[0.994, 0.97 ]], dtype=float32)
+        >>>
+    '''
+    def __init__(self, vectors, mode='exact', n_probe=3):
+        if mode not in ('exact', 'approximate'):
+            raise ValueError("mode must be 'exact' or 'approximate': {}".format(mode))
+        self.mode = mode
+        self.n_probe = n_probe
+        if vectors is None:
+            return
+        # 読み取り専用の配列（メモリマップ）を共有しないようにコピーしてから並べ替える
+        vectors = scipy.sparse.csr_matrix(vectors, dtype=np.float32, copy=True)
+        vectors.eliminate_zeros()
+        vectors.sort_indices()
+        n_docs, dim = vectors.shape
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).reshape(-1))
+        vectors = scipy.sparse.diags(np.where(norms > 0, 1 / np.maximum(norms, 1e-12), 0).astype(np.float32)) @ vectors
+        # 代表トピックの順に並べ替える（ゼロベクトルのドキュメントは末尾にし、どのリストにも入れない）
+        dominant = _row_argmax(vectors)
+        self._order = np.argsort(dominant, kind='stable')
+        self._bounds = np.searchsorted(dominant[self._order], np.arange(dim + 1))
+        self._vectors = vectors[self._order].tocsr()
+        self._vectors.sort_indices()
+
+    @property
+    def shape(self):
+        return self._vectors.shape
+
+    def __len__(self):
+        return self._vectors.shape[0]
+
+    def search(self, queries, k=10, exclude=None, mode=None, n_probe=None):
+        '''
+        Description::
+            クエリごとにコサイン類似度の上位k件のドキュメントを返す（スコアが同じ場合はドキュメントの番号順）
+
+        :param queries:
+            クエリ数×次元の行列（scipy.sparseまたはnumpy.ndarray）
+        :param k:
+            返すドキュメント数
+            デフォルト：10
+        :param exclude:
+            クエリごとに結果から除くドキュメントの番号（クエリ自身など。除かない場合は-1）
+            デフォルト：None（除かない）
+        :param mode, n_probe:
+            指定した場合はインデックスの設定の代わりに使う
+
+        :return:
+            (ドキュメントの番号の配列（クエリ数×k）, スコアの配列（クエリ数×k）)
+            該当するドキュメントがk件に満たない場合は、番号-1・スコア0で埋める
+        '''
+        mode = self.mode if mode is None else mode
+        n_probe = self.n_probe if n_probe is None else n_probe
+        queries = scipy.sparse.csr_matrix(queries, dtype=np.float32)
+        norms = np.sqrt(np.asarray(queries.multiply(queries).sum(axis=1)).reshape(-1))
+        queries = scipy.sparse.diags(np.where(norms > 0, 1 / np.maximum(norms, 1e-12), 0).astype(np.float32)) @ queries
+        exclude = np.full(queries.shape[0], -1) if exclude is None else np.asarray(exclude)
+        docs = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        scores = np.zeros((queries.shape[0], k), dtype=np.float32)
+        for i in range(queries.shape[0]):
+            query = queries.getrow(i)
+            if mode == 'exact':
+                rows = [(0, self._bounds[-1])]
+            else:
+                top = query.indices[np.argsort(-query.data, kind='stable')[:n_probe]]
+                rows = [(self._bounds[t], self._bounds[t + 1]) for t in np.sort(top)]
+            doc, score = self.__top_k(query, rows, k, exclude[i])
+            docs[i, :len(doc)] = doc
+            scores[i, :len(doc)] = score
+        return docs, scores
+
+    def __top_k(self, query, rows, k, exclude):
+        # 検索する行の範囲ごとに内積を計算し、スコアが正のドキュメントから上位kを部分ソートで選ぶ
+        query = query.toarray().reshape(-1)
+        row_ids, scores = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+        for start, end in rows:
+            score = self.__rows(start, end) @ query
+            hit = np.flatnonzero(score > 0)
+            row_ids.append(hit + start)
+            scores.append(score[hit])
+        doc, score = self._order[np.concatenate(row_ids)], np.concatenate(scores)
+        is_valid = doc != exclude
+        doc, score = doc[is_valid], score[is_valid]
+        if len(score) > k:
+            top = np.argpartition(-score, k - 1)[:k]
+            doc, score = doc[top], score[top]
+        top = np.lexsort((doc, -score))
+        return doc[top], score[top]
+
+    def __rows(self, start, end):
+        # 行の範囲をコピーせずに疎行列にする（スライスすると範囲の要素がコピーされる）
+        vectors = self._vectors
+        indptr = vectors.indptr[start:end + 1]
+        return scipy.sparse.csr_matrix((vectors.data[indptr[0]:indptr[-1]], vectors.indices[indptr[0]:indptr[-1]], indptr - indptr[0])
+                                        ,shape=(end - start, vectors.shape[1]), copy=False)
+
+    def save(self, path):
+        '''
+        Description::
+            インデックスをディレクトリに保存する（similarity_*.npy, similarity.json。配列はnpy形式で、loadでメモリマップして読み込める）
+        '''
+        os.makedirs(path, exist_ok=True)
+        for name in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(path, 'similarity_vectors_{}.npy'.format(name)), getattr(self._vectors, name))
+        np.save(os.path.join(path, 'similarity_order.npy'), self._order)
+        np.save(os.path.join(path, 'similarity_bounds.npy'), self._bounds)
+        with open(os.path.join(path, 'similarity.json'), 'w', encoding='utf-8') as f:
+            json.dump({'mode': self.mode, 'n_probe': self.n_probe, 'shape': list(self._vectors.shape)}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''
+        Description::
+            saveで保存したインデックスを読み込む
+            mmap=Trueの場合は配列を読み取り専用でメモリマップし、複数プロセスで同じページを共有する
+        '''
+        with open(os.path.join(path, 'similarity.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        self = cls(None, meta['mode'], meta['n_probe'])
+        self._vectors = scipy.sparse.csr_matrix(tuple(np.load(os.path.join(path, 'similarity_vectors_{}.npy'.format(name)), mmap_mode=mmap_mode)
+                                                    for name in ('data', 'indices', 'indptr'))
+                                                ,shape=tuple(meta['shape']), copy=False)
+        self._order = np.load(os.path.join(path, 'similarity_order.npy'), mmap_mode=mmap_mode)
+        self._bounds = np.load(os.path.join(path, 'similarity_bounds.npy'))
+        return self
+
+
+def _row_argmax(vectors):
+    # 行ごとに最大の要素の列（同じ値の場合は小さい列）。要素のない行は列数にする
+    # （scipyのargmax(axis=1)は行ごとのループで遅いため、配列の演算で求める）
+    n_rows, n_cols = vectors.shape
+    lengths = np.diff(vectors.indptr)
+    is_nonempty = lengths > 0
+    row_max = np.zeros(n_rows, dtype=vectors.dtype)
+    row_max[is_nonempty] = np.maximum.reduceat(vectors.data, vectors.indptr[:-1][is_nonempty])
+    row = np.repeat(np.arange(n_rows), lengths)
+    position = np.flatnonzero(vectors.data == row_max[row])
+    is_first = np.ones(len(position), dtype=bool)
+    is_first[1:] = row[position[1:]] != row[position[:-1]]
+    result = np.full(n_rows, n_cols, dtype=np.int64)
+    result[row[position[is_first]]] = vectors.indices[position[is_first]]
+    return result
@@ -0,0 +1,297 @@
+#! -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class Vocabulary:
+    '''
+    Description::
+        文字列と整数IDの対応（IDは追加した順に0から振る）
+        同じ文字列はVocabularyに1つだけ保持し、TokenStoreには整数IDだけを保持する
+
+    Usage::
+        >>> from ToolsNLP.token_store import Vocabulary
+        >>> vocabulary = Vocabulary()
+        >>> vocabulary.encode(['天気', '晴れ', '天気'])
+        [0, 1, 0]
+        >>> vocabulary[1]
+        '晴れ'
+        >>>
+    '''
+    def __init__(self, terms=()):
+        self.token2id = {}
+        self.id2token = []
+        self.encode(terms)
+
+    def add(self, term):
+        i = self.token2id.get(term)
+        if i is None:
+            i = self.token2id[term] = len(self.id2token)
+            self.id2token.append(term)
+        return i
+
+    def encode(self, terms):
+        '''
+        Description::
+            文字列の配列を整数IDのリストにする（未登録の文字列は追加する）
+        '''
+        ids = list(map(self.token2id.get, terms))
+        if None in ids:
+            ids = [self.add(term) if i is None else i for term, i in zip(terms, ids)]
+        return ids
+
+    def __getitem__(self, i):
+        return self.id2token[i]
+
+    def __contains__(self, term):
+        return term in self.token2id
+
+    def __iter__(self):
+        return iter(self.id2token)
+
+    def __len__(self):
+        return len(self.id2token)
+
+
+def _reserve(buf, size):
+    # 容量が足りない場合は2倍に拡張する（追加1回あたりのコピーを償却O(1)にする）
+    if size <= len(buf):
+        return buf
+    new = np.empty(max(size, len(buf) * 2, 1024), dtype=buf.dtype)
+    new[:len(buf)] = buf
+    return new
+
+
+class TokenStore:
+    '''
+    Description::
+        形態素解析結果（ドキュメントごとのtermの配列）を、語彙（Vocabulary）と整数IDの配列で保持する
+        全ドキュメントのIDを1つの配列（int32）に連結し、ドキュメントの区切りをoffsets（int64）で持つ
+        is_pos=Trueの場合は品詞（'名詞-一般-*'）を別のVocabularyの整数コード（uint16）で保持する
+        termの配列のリスト（tokenize_batch(is_list=True)の結果）と同じようにイテレート・インデックスでき、
+        各ドキュメントはtokenizeと同じ形式（is_pos=Trueの場合は'term:品詞'）のリストで返す
+
+    :param vocabulary:
+        termのVocabulary（複数のTokenStoreで共有できる）
+        デフォルト：None（新しく作る）
+    :param pos_vocabulary:
+        品詞のVocabulary（is_pos=Trueの場合のみ）
+        デフォルト：None（新しく作る）
+    :param is_pos:
+        品詞を保持するかどうか（tokenizeのis_posと同じ設定にする）
+        デフォルト：False
+
+    Usage::
+        >>> from ToolsNLP.token_store import TokenStore
+        >>> store = TokenStore(is_pos=True)
+        >>> store.extend([['天気:名詞-一般-*', '晴れ:名詞-一般-*'], ['天気:名詞-一般-*']])
+        >>> len(store), store.n_tokens
+        (2, 3)
+        >>> store.terms(1), store.pos(1)
+        (['天気'], ['名詞-一般-*'])
+        >>> store[0]
+        ['天気:名詞-一般-*', '晴れ:名詞-一般-*']
+        >>>
+    '''
+    def __init__(self, vocabulary=None, pos_vocabulary=None, is_pos=False):
+        self.vocabulary = Vocabulary() if vocabulary is None else vocabulary
+        self.is_pos = is_pos
+        self.pos_vocabulary = None
+        self._pos = None
+        if is_pos:
+            self.pos_vocabulary = Vocabulary() if pos_vocabulary is None else pos_vocabulary
+            self._pos = np.empty(0, dtype=np.uint16)
+            self._pos_keys = {}
+        self._ids = np.empty(0, dtype=np.int32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._len = 0
+
+    @property
+    def n_tokens(self):
+        return int(self._offsets[self._len])
+
+    @property
+    def ids(self):
+        # 全ドキュメントのtermのIDを連結した配列（追加するまで有効なビュー）
+        return self._ids[:self.n_tokens]
+
+    @property
+    def pos_ids(self):
+        return None if self._pos is None else self._pos[:self.n_tokens]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self._len + 1]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        # 語彙を除いた配列のサイズ
+        return self.ids.nbytes + self.offsets.nbytes + (0 if self._pos is None else self.pos_ids.nbytes)
+
+    def empty_like(self):
+        '''
+        Description::
+            語彙を共有する空のTokenStoreを返す（extendで連結するとIDの変換が不要）
+        '''
+        return TokenStore(self.vocabulary, self.pos_vocabulary, self.is_pos)
+
+    def append_ids(self, ids, pos=None):
+        '''
+        Description::
+            1ドキュメント分のtermのID（と品詞のコード）を追加する
+        '''
+        start = self.n_tokens
+        end = start + len(ids)
+        self._ids = _reserve(self._ids, end)
+        self._ids[start:end] = ids
+        if self._pos is not None:
+            self._pos = _reserve(self._pos, end)
+            self._pos[start:end] = pos
+        self._offsets = _reserve(self._offsets, self._len + 2)
+        self._len += 1
+        self._offsets[self._len] = end
+
+    def append(self, tokens):
+        '''
+        Description::
+            1ドキュメント分のtermの配列（tokenize(is_list=True)の結果）を追加する
+            is_pos=Trueの場合は'term:品詞'をtermと品詞に分ける（品詞には':'が含まれないので最後の':'で分ける）
+        '''
+        if self._pos is None:
+            self.append_ids(self.vocabulary.encode(tokens))
+            return
+        # 'term:品詞'の文字列ごとに(termのID << 16 | 品詞のコード)をキャッシュする（同じ組の分割は1回だけ）
+        keys = list(map(self._pos_keys.get, tokens))
+        if None in keys:
+            keys = [self.__pos_key(token) if key is None else key for token, key in zip(tokens, keys)]
+        keys = np.array(keys, dtype=np.int64)
+        self.append_ids(keys >> 16, keys & 0xffff)
+
+    def __pos_key(self, token):
+        term, _, pos = token.rpartition(':')
+        code = self.pos_vocabulary.add(pos)
+        if code > 0xffff:
+            raise ValueError('too many part-of-speech tags: {}'.format(len(self.pos_vocabulary)))
+        key = self._pos_keys[token] = self.vocabulary.add(term) << 16 | code
+        return key
+
+    def extend(self, docs):
+        '''
+        Description::
+            termの配列のイテラブル、または同じ語彙のTokenStoreを追加する
+        '''
+        if isinstance(docs, TokenStore) and docs.vocabulary is self.vocabulary and docs.pos_vocabulary is self.pos_vocabulary:
+            start, n = self.n_tokens, docs.n_tokens
+            self._ids = _reserve(self._ids, start + n)
+            self._ids[start:start + n] = docs.ids
+            if self._pos is not None:
+                self._pos = _reserve(self._pos, start + n)
+                self._pos[start:start + n] = docs.pos_ids
+            self._offsets = _reserve(self._offsets, self._len + len(docs) + 1)
+            self._offsets[self._len + 1:self._len + len(docs) + 1] = docs.offsets[1:] + start
+            self._len += len(docs)
+            return
+        for tokens in docs:
+            self.append(tokens)
+
+    def select(self, mask):
+        '''
+        Description::
+            全トークンのうちmask（長さn_tokensのbool配列）がTrueのトークンだけを残したTokenStoreを返す（語彙は共有する）
+        '''
+        mask = np.asarray(mask, dtype=bool)
+        store = self.empty_like()
+        store._ids = self.ids[mask]
+        if self._pos is not None:
+            store._pos = self.pos_ids[mask]
+        counts = np.concatenate([[0], np.cumsum(mask, dtype=np.int64)])
+        store._offsets = counts[self.offsets]
+        store._len = self._len
+        return store
+
+    def subset(self, mask):
+        '''
+        Description::
+            mask（長さがドキュメント数のbool配列）がTrueのドキュメントだけのTokenStoreを返す（語彙は共有する）
+        '''
+        mask = np.asarray(mask, dtype=bool)
+        store = self.select(np.repeat(mask, self.lengths))
+        store._offsets = store.offsets[np.concatenate([[True], mask])]
+        store._len = int(mask.sum())
+        return store
+
+    def doc_ids(self, i):
+        return self._ids[self._offsets[i]:self._offsets[i + 1]]
+
+    def terms(self, i):
+        id2token = self.vocabulary.id2token
+        return [id2token[j] for j in self.doc_ids(i).tolist()]
+
+    def pos(self, i):
+        if self._pos is None:
+            return None
+        id2token = self.pos_vocabulary.id2token
+        return [id2token[j] for j in self._pos[self._offsets[i]:self._offsets[i + 1]].tolist()]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('document index out of range')
+        if self._pos is None:
+            return self.terms(i)
+        return [term + ':' + pos for term, pos in zip(self.terms(i), self.pos(i))]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self[i]
+
+    def __len__(self):
+        return self._len
+
+    def encode_terms(self):
+        '''
+        Description::
+            corpus.encode_terms(list(self))と同じ結果（IDはイテレートした場合の初出順）を、文字列を作らずに配列の演算で返す
+
+        :return:
+            (term_list（ID順）, 出現頻度の配列, 全トークンのID列, ドキュメントごとのトークン数の配列)
+        '''
+        if self._pos is None:
+            # 語彙のIDごとに出現頻度と最初の出現位置を数える（ソートしない）
+            n_vocab = len(self.vocabulary)
+            cfs = np.bincount(self.ids, minlength=n_vocab)
+            first = np.full(n_vocab, self.n_tokens, dtype=np.int64)
+            np.minimum.at(first, self.ids, np.arange(self.n_tokens, dtype=np.int64))
+            present = np.flatnonzero(cfs)
+            keys = present[np.argsort(first[present], kind='stable')]
+            remap = np.full(n_vocab, -1, dtype=np.int32)
+            remap[keys] = np.arange(len(keys), dtype=np.int32)
+            ids = remap[self.ids]
+            id2token = self.vocabulary.id2token
+            terms = [id2token[k] for k in keys.tolist()]
+            return terms, cfs[keys].astype(np.int64), ids, self.lengths
+        # 品詞つきはtermと品詞の組をキーにする
+        n_pos = max(len(self.pos_vocabulary), 1)
+        uniq, first, inverse = np.unique(self.ids.astype(np.int64) * n_pos + self.pos_ids, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        rank = np.empty(len(uniq), dtype=np.int32)
+        rank[order] = np.arange(len(uniq), dtype=np.int32)
+        ids = rank[inverse.reshape(-1)]
+        id2token, id2pos = self.vocabulary.id2token, self.pos_vocabulary.id2token
+        terms = [id2token[k // n_pos] + ':' + id2pos[k % n_pos] for k in uniq[order].tolist()]
+        return terms, np.bincount(ids, minlength=len(terms)).astype(np.int64), ids, self.lengths
+
+    def __getstate__(self):
+        # 未使用の容量はpickleしない（プロセスプールに渡す場合など）
+        state = self.__dict__.copy()
+        state['_ids'] = self.ids.copy()
+        state['_pos'] = None if self._pos is None else self.pos_ids.copy()
+        state['_offsets'] = self.offsets.copy()
+        if self._pos is not None:
+            state['_pos_keys'] = {}
+        return state
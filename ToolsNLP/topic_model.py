@@ -3,13 +3,27 @@
 import ToolsNLP
 import gensim
 import numpy as np
-from collections import Counter
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
+import scipy.sparse
+from collections import Counter, deque
 import pandas as pd
-import re
 import site
 import os
+import json
+import itertools
+import time
+import shutil
+import tempfile
+import warnings
+import weakref
+from ToolsNLP import corpus
+from ToolsNLP import dedup
+from ToolsNLP import shard_corpus
+from ToolsNLP import similarity
+from ToolsNLP import instrument
+
+
+# saveで書き出すファイル名の接頭辞（上書き保存で前回のファイルを削除する対象）
+_MODEL_FILES = ('meta.json', 'dictionary.dict', 'corpus.mm', 'lda.model', 'doc_topic_', 'representative.npy', 'similarity')
 
 
 class TopicModelWrapper:
@@ -20,6 +34,12 @@ class TopicModelWrapper:
     :param data:
         入力データ
         [[entry_id1, sentence1], [entry_id2, sentence2], ]
+        TSVファイル（entry_id<TAB>sentence）のパス、または[entry_id, sentence]のイテラブルを指定した場合は
+        ストリーミングで処理する（形態素解析結果とコーパスをファイルに書き出し、メモリ上に全件を保持しない）
+        ToolsNLP.Shards（シャード（TSVファイルのパス、または[entry_id, sentence]のリスト）のリスト）を指定した場合は、シャードごとに
+        別々のプロセスで形態素解析と単語頻度の集計を行い、集計結果を足し合わせて辞書を作る（shard_corpus）
+        シャードの結果はcorpus_dirにキャッシュし、中身の変わったシャードだけを形態素解析しなおす
+        ToolsNLP.Shards(['data_01.tsv', 'data_02.tsv', ])
     :param config_mw:
         MecabWrapperのパラメータを設定
         デフォルト設定
@@ -45,6 +65,15 @@ class TopicModelWrapper:
                     'stop_term_toprate': 0.05
                     ,'stop_term_limitcnt': 3
                     ,'topic_doc_threshold': 0.01
+                    ,'tokenize_workers': 1
+                    ,'tokenize_chunksize': None
+                    ,'corpus_dir': None
+                    ,'stream_batch_size': 10000
+                    ,'dedup_threshold': None
+                    ,'dedup_num_perm': 64
+                    ,'dedup_shingle_size': 2
+                    ,'verbose': False
+                    ,'callbacks': []
                     # コーパス設定
                     ,'is_1len': True
                     ,'is_term_fq': True
@@ -52,23 +81,49 @@ class TopicModelWrapper:
                     ,'num_topics': 100
                     ,'iterations': 100
                     ,'alpha': 'auto'
+                    ,'lda_mode': 'single'
+                    ,'workers': None
+                    ,'chunksize': 2000
+                    ,'passes': 1
+                    ,'eval_every': 10
                     }
 
             # 基本設定(stop_term_toprate = 単語出現頻度上位n％を除外する
-                    ,stop_term_limitcnt = 単語頻度がn以下を除外する
-                    ,topic_doc_threshold = トピックに対して紐づけるドキュメントのスコアの閾値)
-            # コーパス設定(is_1len = 形態素解析後の英数字の文字列が1のものを除外するかどうか
-                    ,is_term_fq = 単語出現頻度のフィルタを実施するかどうか)
+                    ,stop_term_limitcnt = 単語頻度がn未満を除外する
+                    ,topic_doc_threshold = トピックに対して紐づけるドキュメントのスコアの閾値
+                    ,tokenize_workers = 形態素解析の並列プロセス数(Noneの場合はCPUコア数)
+                    ,tokenize_chunksize = 形態素解析のプロセスに一度に渡すドキュメント数(Noneの場合は自動設定)
+                    ,corpus_dir = ストリーミング処理で形態素解析結果(tokens.txt)とコーパス(corpus.mm, Matrix Market形式)を書き出すディレクトリ
+                                  (指定した場合はdataがリストでもストリーミングで処理する。Noneの場合は一時ディレクトリ)
+                                  (dataがShardsの場合は、シャードごとの形態素解析結果・単語頻度・コーパスのキャッシュのディレクトリ)
+                    ,stream_batch_size = ストリーミング処理で一度に形態素解析するドキュメント数
+                    ,dedup_threshold = 重複ドキュメントとする類似度(形態素解析結果のdedup_shingle_size個の連続する単語の組の集合のJaccard係数)
+                                       (指定した場合はMinHash/LSHで重複グループを探し、グループの代表(最初のドキュメント)だけで学習する
+                                        重複ドキュメントには代表と同じスコアを付け、トピック別の記事数は代表だけで数える。Noneの場合は重複を除去しない)
+                    ,dedup_num_perm = 重複の判定に使うMinHashのハッシュ関数の数
+                    ,dedup_shingle_size = 重複の判定に使う連続する単語の数
+                    ,verbose = 進捗とステージごとの計測結果を標準出力に出力するかどうか(デフォルトは出力しない)
+                    ,callbacks = ステージ(tokenize, corpus, train, output)ごとの計測結果(instrument.StageStats)を受け取る関数のリスト
+                                 ※計測結果はloggingの'ToolsNLP'ロガーにも出力し、get_stage_statsで取得できる)
+            # コーパス設定(is_1len = 形態素解析後の1文字のひらがな・カタカナ・英数字を除外するかどうか
+                    ,is_term_fq = 単語出現頻度のフィルタ(stop_term_limitcnt, stop_term_toprate)を実施するかどうか)
             # LDA設定(num_topics = トピック数
                     ,iterations = イテレーション回数
-                    ,alpha = アルファの設定)
+                    ,alpha = アルファの設定
+                    ,lda_mode = 学習方法('single':シングルプロセス(LdaModel), 'multicore':マルチプロセス(LdaMulticore))
+                    ,workers = multicoreの学習プロセス数(Noneの場合はCPUコア数-1)
+                    ,chunksize = 1回の更新で利用するドキュメント数
+                    ,passes = コーパス全体の学習回数
+                    ,eval_every = パープレキシティを計算する更新間隔(multicoreのデフォルトはNone:計算しない))
+            ※multicoreはalpha='auto'に対応していないため、multicoreのalphaのデフォルトは'symmetric'
+              alpha='auto'を指定してmulticoreにした場合は警告を出してsingleで学習する
     Usage::
         >>> import ToolsNLP
-        # doctest用にエスケースしている。元のコード `data = [i.strip('\n').split('\t') for i in open('data.tsv', 'r')]`
+        # doctest用にエスケースしている。元のコード `data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]`
         >>> data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]
         >>> # data[:1] output:[['http://news.livedoor.com/article/detail/4778030/', '友人代表のスピーチ、独女はどうこなしている？ ...]]
         >>> 
-        >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'})
+        >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'}, verbose=True)
         read data ...
         documents count => 5,980
         tokenize text ...
@@ -81,19 +136,269 @@ class TopicModelWrapper:
         >>> 
     '''
     def __init__(self, data, config_mw={}, config_tn={}, **kwargs):
+        self.__set_config(config_mw, config_tn, kwargs)
+        self.__build_corpus(data)
+        self._instrument.message('{}{:,}'.format('topic count => ',self._num_topics))
+        with self._instrument.stage('train', 'make topic model ...') as record:
+            self._lda = self.__create_topic_model()
+            record['docs'], record['tokens'] = len(self._urls), self._dictionary.num_pos
+        self.__make_output()
+        self._instrument.message('DONE')
+
+    def __build_corpus(self, data):
+        self._instrument.message('read data ...')
+        self._data = data
+        self._is_stream = isinstance(data, str) or self._corpus_dir is not None or not isinstance(data, (list, tuple))
+        if isinstance(data, shard_corpus.Shards):
+            with self._instrument.stage('tokenize', 'tokenize text ...') as record:
+                self._shards = self.__tokenizer_text_shards()
+                self._texts = corpus.ConcatCorpus([shard.texts for shard in self._shards])
+                self._urls = [url for shard in self._shards for url in shard.urls]
+                record['docs'], record['tokens'] = len(self._urls), sum(shard.n_tokens for shard in self._shards)
+                record['extra'] = {'shards': len(self._shards), 'cached_shards': sum(shard.is_cached for shard in self._shards)}
+            self._instrument.message('{}{:,}'.format('documents count => ',len(self._urls)))
+            self.__dedup(self._texts)
+            with self._instrument.stage('corpus', 'make corpus ...') as record:
+                self._dictionary, self._corpus, self._texts_cleansing = self.__create_corpus_shards()
+                record['docs'], record['tokens'] = self._dictionary.num_docs, sum(shard.n_tokens for shard in self._shards)
+        elif self._is_stream:
+            with self._instrument.stage('tokenize', 'tokenize text ...') as record, self.m.timing() as timer:
+                self._texts, self._urls = self.__tokenizer_text_stream()
+                record['docs'], record['tokens'], record['extra'] = len(self._urls), self._texts.n_tokens, timer.info()._asdict()
+            self._instrument.message('{}{:,}'.format('documents count => ',len(self._urls)))
+            texts = self.__dedup(self._texts)
+            with self._instrument.stage('corpus', 'make corpus ...') as record:
+                self._dictionary, self._corpus, self._texts_cleansing = self.__create_corpus_stream(texts)
+                record['docs'], record['tokens'] = len(texts), self._texts.n_tokens
+        else:
+            self._urls = [doc[0] for doc in self._data]
+            self._instrument.message('{}{:,}'.format('documents count => ',len(self._data)))
+            with self._instrument.stage('tokenize', 'tokenize text ...') as record, self.m.timing() as timer:
+                self._texts = self.__tokenizer_text()
+                record['docs'], record['tokens'], record['extra'] = len(self._texts), self._texts.n_tokens, timer.info()._asdict()
+            texts = self.__dedup(self._texts)
+            with self._instrument.stage('corpus', 'make corpus ...') as record:
+                self._dictionary, self._corpus, self._texts_cleansing = self.__create_corpus(texts)
+                record['docs'], record['tokens'] = len(texts), texts.n_tokens
+
+    def __dedup(self, texts):
+        # 重複グループの代表のドキュメントだけのtextsを返す（_representativeに各ドキュメントの代表の番号を保持する）
+        self._representative = None
+        if self._dedup_threshold is None:
+            return texts
+        with self._instrument.stage('dedup', 'remove duplicate documents ...') as record:
+            self._representative = dedup.find_duplicates(texts
+                                                        ,threshold=self._dedup_threshold
+                                                        ,num_perm=self._dedup_num_perm
+                                                        ,shingle_size=self._dedup_shingle_size
+                                                        )
+            is_unique = self._representative == np.arange(len(self._representative))
+            record['docs'], record['extra'] = len(is_unique), {'duplicates': int(len(is_unique) - is_unique.sum())}
+        self._instrument.message('{}{:,}'.format('duplicate documents => ',int(len(is_unique) - is_unique.sum())))
+        return texts.subset(is_unique)
+
+    def __make_output(self):
+        self._lda_corpus = self._lda[self._corpus]
+        with self._instrument.stage('output', 'make output data ...') as record:
+            doc_topic = self.__doc_topic_matrix(self._corpus, self._chunksize)
+            self._topic_list, self._topic_df = self.__count_topic(Counter(), doc_topic)
+            self._doc_topic = self.__expand_duplicates(doc_topic)
+            record['docs'] = self._doc_topic.shape[0]
+        self._similarity_index = self._url_index = None
+
+    def __expand_duplicates(self, doc_topic):
+        # 代表のドキュメントのスコアを重複ドキュメントにも付ける（行は全ドキュメントの順番）
+        if self._representative is None:
+            return doc_topic
+        unique = np.flatnonzero(self._representative == np.arange(len(self._representative)))
+        return doc_topic[np.searchsorted(unique, self._representative)]
+
+    def get_duplicate_list(self):
+        '''
+        Description::
+            重複ドキュメント（dedup_thresholdで除去したもの）と、その代表のドキュメントのentry_idのデータフレームを出力する
+            代表のドキュメントで学習し、重複ドキュメントには代表と同じスコアを付けている
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, dedup_threshold=0.9)
+            >>> t.get_duplicate_list().head()
+                                                           url                                      duplicate_of
+            21  http://news.livedoor.com/article/detail/4778112/  http://news.livedoor.com/article/detail/4778030/
+            >>> 
+        '''
+        representative = np.arange(len(self._urls)) if self._representative is None else self._representative
+        docs = np.flatnonzero(representative != np.arange(len(representative)))
+        return pd.DataFrame({'url': [self._urls[d] for d in docs.tolist()]
+                            ,'duplicate_of': [self._urls[d] for d in representative[docs].tolist()]
+                            }, index=docs)
+
+    def get_stage_stats(self):
+        '''
+        Description::
+            ステージごとの計測結果（経過時間、CPU時間、ピークメモリ、docs/sec、tokens/sec）のデータフレームを出力する
+            tokenizeのextraには形態素解析の正規化・MeCabの解析・後処理の時間（tokenize_workers=1の場合のみ）が入る
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, callbacks=[print])
+            >>> t.get_stage_stats()
+                  stage   wall_sec    cpu_sec  peak_mem_mb  docs    tokens  docs_per_sec  tokens_per_sec  extra
+            0  tokenize  ...
+            >>> 
+        '''
+        return pd.DataFrame(self._instrument.stats, columns=instrument.StageStats._fields)
+
+    @classmethod
+    def search(cls, data, num_topics_list=(10, 20, 50, 100), alpha_list=('symmetric',), config_mw={}, config_tn={}
+                ,search_workers=None, holdout_rate=0.1, coherence='u_mass', metric='coherence', patience=None, seed=0, **kwargs):
+        '''
+        Description::
+            トピック数（とalpha）の候補ごとにLDAモデルを学習し、ホールドアウトのパープレキシティとトピックのコヒーレンスで比較する
+            形態素解析とコーパスの作成は1回だけ行い、候補の学習は複数プロセスで並列に実行する
+            候補はnum_topicsの小さい順に学習し、patience個続けてmetricが改善しない場合は残りの候補を学習せずに終了する
+            （並列に学習する場合も候補はsearch_workers個ずつ投入するので、打ち切った後に学習を始めるのは最大search_workers-1個）
+            候補の数・投入した数・比較した数はget_stage_stats()のsearchのextraに入る
+            最良の候補のモデルで全ドキュメントのスコアを推定したTopicModelWrapperを返す（モデルの学習はホールドアウト以外のドキュメントのみ）
+
+        :param data:
+            入力データ（TopicModelWrapperと同じ）
+        :param num_topics_list:
+            トピック数の候補
+            デフォルト：(10, 20, 50, 100)
+        :param alpha_list:
+            alphaの候補
+            デフォルト：('symmetric',)
+        :param config_mw, config_tn, kwargs:
+            TopicModelWrapperと同じ（num_topics, alpha, lda_modeは候補ごとの設定を使う。候補の学習はLdaModel）
+        :param search_workers:
+            候補を並列に学習するプロセス数(Noneの場合はCPUコア数)
+        :param holdout_rate:
+            パープレキシティの計算に使うホールドアウトのドキュメントの割合
+            デフォルト：0.1
+        :param coherence:
+            コヒーレンスの種類（gensim.models.CoherenceModelのcoherence。'u_mass', 'c_v'など）
+            デフォルト：'u_mass'
+        :param metric:
+            最良の候補を選ぶ指標（'coherence':大きいほど良い, 'perplexity':小さいほど良い）
+            デフォルト：'coherence'
+        :param patience:
+            early stoppingまでに改善しない候補の数
+            デフォルト：None（全候補を学習する）
+        :param seed:
+            ホールドアウトの分割とLDAの乱数のシード
+            デフォルト：0
+
+        :return:
+            (候補ごとの結果のデータフレーム, 最良の候補のTopicModelWrapper)
+
+        Usage::
+            >>> import ToolsNLP
+            >>> df_search, t = ToolsNLP.TopicModelWrapper.search(data, num_topics_list=[20, 50, 100], alpha_list=['symmetric', 'auto'])
+            >>> df_search
+               num_topics      alpha  perplexity  coherence  train_sec
+            0          20  symmetric  ...
+            >>> t.get_topic2topdoc_list().head()
+            >>> 
+        '''
+        if metric not in ('coherence', 'perplexity'):
+            raise ValueError("metric must be 'coherence' or 'perplexity': {}".format(metric))
+        self = cls.__new__(cls)
+        self.__set_config(config_mw, config_tn, kwargs)
+        self.__build_corpus(data)
+
+        with self._instrument.stage('search', 'search topic model ...') as record:
+            n_docs = len(self._corpus)
+            is_holdout = np.zeros(n_docs, dtype=bool)
+            is_holdout[np.random.RandomState(seed).permutation(n_docs)[:int(n_docs * holdout_rate)]] = True
+            train = corpus.SubsetCorpus(self._corpus, ~is_holdout)
+            holdout = corpus.SubsetCorpus(self._corpus, is_holdout)
+            texts = None if coherence == 'u_mass' else self._texts_cleansing
+            params = dict(iterations=self._iterations
+                        ,chunksize=self._chunksize
+                        ,passes=self._passes
+                        ,random_state=seed
+                        ,dtype=np.float64
+                        )
+            candidates = [(num_topics, alpha) for num_topics in sorted(num_topics_list) for alpha in alpha_list]
+            state = (train, holdout, texts, self._dictionary, coherence, params)
+
+            results, best_score, best_lda, wait = [], None, None, 0
+            sign = 1 if metric == 'coherence' else -1
+            search_workers = search_workers or os.cpu_count() or 1
+            # 候補はワーカー数ずつ順番に投入する（early stoppingで打ち切った後の候補は学習しない）
+            submitted = []
+            def submit(candidates):
+                for candidate in candidates:
+                    submitted.append(candidate)
+                    yield candidate
+            if search_workers == 1:
+                _init_search_worker(*state)
+                scores = map(_train_candidate, submit(candidates))
+                pool = None
+            else:
+                import multiprocessing
+                search_workers = min(search_workers, len(candidates))
+                pool = multiprocessing.Pool(search_workers, initializer=_init_search_worker, initargs=state)
+                scores = _imap_window(pool, _train_candidate, submit(candidates), search_workers)
+            try:
+                for (num_topics, alpha), (lda, perplexity, score, train_sec) in zip(candidates, scores):
+                    results.append({'num_topics': num_topics, 'alpha': alpha, 'perplexity': perplexity, 'coherence': score, 'train_sec': train_sec})
+                    value = sign * (score if metric == 'coherence' else perplexity)
+                    if best_score is None or value > best_score:
+                        best_score, best_lda, wait = value, lda, 0
+                        self._num_topics, self._alpha = num_topics, alpha
+                    else:
+                        wait += 1
+                        if patience is not None and wait >= patience:
+                            break
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+            record['docs'], record['tokens'] = len(train), self._dictionary.num_pos
+            record['extra'] = {'candidates': len(candidates), 'submitted': len(submitted), 'evaluated': len(results)}
+
+        self._lda_mode = 'single'
+        self._lda = best_lda
+        self._lda.id2word = self._dictionary
+        self.__make_output()
+        self._instrument.message('DONE')
+        return pd.DataFrame(results, columns=['num_topics', 'alpha', 'perplexity', 'coherence', 'train_sec']), self
+
+    def __set_config(self, config_mw, config_tn, kwargs):
         sitedir = site.getsitepackages()[-1]
         installdir = os.path.join(sitedir, 'ToolsNLP')
         self._fpath = installdir +  '/.fonts/ipaexg.ttf'
         # 基本設定
+        self._stop_term_toprate = kwargs.get('stop_term_toprate', 0.05)
         self._stop_term_limitcnt = kwargs.get('stop_term_limitcnt', 3)
         self._topic_doc_threshold = kwargs.get('topic_doc_threshold', 0.01)
+        self._tokenize_workers = kwargs.get('tokenize_workers', 1)
+        self._tokenize_chunksize = kwargs.get('tokenize_chunksize', None)
+        self._corpus_dir = kwargs.get('corpus_dir', None)
+        self._stream_batch_size = kwargs.get('stream_batch_size', 10000)
+        self._dedup_threshold = kwargs.get('dedup_threshold', None)
+        self._dedup_num_perm = kwargs.get('dedup_num_perm', 64)
+        self._dedup_shingle_size = kwargs.get('dedup_shingle_size', 2)
+        self._instrument = instrument.Instrument(verbose=kwargs.get('verbose', False), callbacks=kwargs.get('callbacks', ()))
         # コーパス設定
         self._is_1len = kwargs.get('is_1len', True)
         self._is_term_fq = kwargs.get('is_term_fq', True)
         # LDA設定
         self._num_topics = kwargs.get('num_topics', 100)
         self._iterations = kwargs.get('iterations', 100)
-        self._alpha = kwargs.get('alpha', 'auto')
+        self._lda_mode = kwargs.get('lda_mode', 'single')
+        if self._lda_mode not in ('single', 'multicore'):
+            raise ValueError("lda_mode must be 'single' or 'multicore': {}".format(self._lda_mode))
+        self._alpha = kwargs.get('alpha', 'symmetric' if self._lda_mode == 'multicore' else 'auto')
+        if self._lda_mode == 'multicore' and self._alpha == 'auto':
+            warnings.warn("alpha='auto' is not supported by lda_mode='multicore', training with lda_mode='single'", stacklevel=3)
+            self._lda_mode = 'single'
+        self._workers = kwargs.get('workers', None)
+        self._chunksize = kwargs.get('chunksize', 2000)
+        self._passes = kwargs.get('passes', 1)
+        self._eval_every = kwargs.get('eval_every', None if self._lda_mode == 'multicore' else 10)
         # 形態素解析設定
         self._config_mw = config_mw
         self._config_tn = config_tn
@@ -101,62 +406,404 @@ class TopicModelWrapper:
             self._config_tn['pos_filter'] = [['名詞', '一般', '*']]
         self.m = ToolsNLP.MecabWrapper(**self._config_mw)
 
-        print('read data ...')
-        self._data = data
-        print('{}{:,}'.format('documents count => ',len(self._data)))
-        print('tokenize text ...')
-        self._texts = self.__tokenizer_text()
-        print('make corpus ...')
-        self._dictionary, self._corpus, self._texts_cleansing = self.__create_corpus()
-        print('{}{:,}'.format('topic count => ',self._num_topics))
-        print('make topic model ...')
-        self._lda = self.__create_topic_model()
-        self._lda_corpus = self._lda[self._corpus]
-        print('make output data ...')
-        self._topic_list, self._topic_df = self.__count_topic()
-        self._df_docweight = self.__proc_docweight()
-        print('DONE')
+    def __get_config(self):
+        return {'stop_term_toprate': self._stop_term_toprate
+                ,'stop_term_limitcnt': self._stop_term_limitcnt
+                ,'topic_doc_threshold': self._topic_doc_threshold
+                ,'tokenize_workers': self._tokenize_workers
+                ,'tokenize_chunksize': self._tokenize_chunksize
+                ,'stream_batch_size': self._stream_batch_size
+                ,'dedup_threshold': self._dedup_threshold
+                ,'dedup_num_perm': self._dedup_num_perm
+                ,'dedup_shingle_size': self._dedup_shingle_size
+                ,'is_1len': self._is_1len
+                ,'is_term_fq': self._is_term_fq
+                ,'num_topics': self._num_topics
+                ,'iterations': self._iterations
+                ,'alpha': self._alpha
+                ,'lda_mode': self._lda_mode
+                ,'workers': self._workers
+                ,'chunksize': self._chunksize
+                ,'passes': self._passes
+                ,'eval_every': self._eval_every
+                }
 
     def __tokenizer_text(self):
-        return [self.m.tokenize(sentence=doc[1], is_list=True, **self._config_tn) for doc in self._data]
-
-    def __stop_term(self, is_1len, is_term_fq):
-        r = re.compile('^[ぁ-んァ-ン0-9a-zA-Z]$')
-        count = Counter(w for doc in self._texts for w in doc)
-
-        if is_1len and is_term_fq:
-            return [[w for w in doc if count[w] >= self._stop_term_limitcnt and not re.match(r,w)] for doc in self._texts]
-        elif is_1len and not is_term_fq:
-            return [[w for w in doc if count[w] >= self._stop_term_limitcnt] for doc in self._texts]
-        elif not is_1len and is_term_fq:
-            return [[w for w in doc if not re.match(r,w)] for doc in self._texts]
-        else:
-            return self._texts
+        # 形態素解析結果は語彙と整数IDの配列（TokenStore）で保持する
+        return self.m.tokenize_store([doc[1] for doc in self._data]
+                                    ,workers=self._tokenize_workers
+                                    ,chunksize=self._tokenize_chunksize
+                                    ,**self._config_tn
+                                    )
 
-    def __create_corpus(self):
-        texts = self.__stop_term(self._is_1len, self._is_term_fq)
-        dictionary = gensim.corpora.Dictionary(texts)
-        corpus = [dictionary.doc2bow(text) for text in texts]
-        return dictionary, corpus, texts
-    
-    def __create_topic_model(self):
-        return gensim.models.ldamodel.LdaModel(corpus=self._corpus
-                                                ,id2word=self._dictionary
-                                                ,num_topics=self._num_topics
-                                                ,iterations=self._iterations
-                                                ,alpha=self._alpha
-                                                ,dtype=np.float64
+    def __prepare_corpus_dir(self):
+        if self._corpus_dir is None:
+            self._corpus_dir = tempfile.mkdtemp(prefix='ToolsNLP_')
+            weakref.finalize(self, shutil.rmtree, self._corpus_dir, ignore_errors=True)
+        os.makedirs(self._corpus_dir, exist_ok=True)
+
+    def __tokenizer_text_shards(self):
+        self.__prepare_corpus_dir()
+        return shard_corpus.tokenize_shards(self._data.sources
+                                            ,self._corpus_dir
+                                            ,config_mw=self._config_mw
+                                            ,config_tn=self._config_tn
+                                            ,workers=self._tokenize_workers
+                                            )
+
+    def __create_corpus_shards(self):
+        masks = None
+        if self._representative is not None:
+            # 重複ドキュメントを除いたシャードだけ単語頻度を数えなおす
+            is_unique = self._representative == np.arange(len(self._representative))
+            masks = np.split(is_unique, np.cumsum([shard.n_docs for shard in self._shards])[:-1])
+            masks = [None if mask.all() else mask for mask in masks]
+        return shard_corpus.build_corpus_shards(self._shards
+                                                ,masks=masks
+                                                ,is_1len=self._is_1len
+                                                ,is_term_fq=self._is_term_fq
+                                                ,limitcnt=self._stop_term_limitcnt
+                                                ,toprate=self._stop_term_toprate
+                                                ,workers=self._tokenize_workers
                                                 )
 
-    def __count_topic(self):
-        topic_counnter = Counter(topic[0] for doc in self._lda_corpus for topic in doc if topic[1] > self._topic_doc_threshold).most_common()
-        topic_list = list(pd.DataFrame(topic_counnter)[0])
+    def __tokenizer_text_stream(self):
+        self.__prepare_corpus_dir()
+        records = corpus.read_tsv(self._data) if isinstance(self._data, str) else self._data
+        urls = []
+        def texts():
+            for record in records:
+                urls.append(record[0])
+                yield record[1]
+        docs = self.m.tokenize_stream(texts()
+                                    ,workers=self._tokenize_workers
+                                    ,chunksize=self._tokenize_chunksize
+                                    ,batch_size=self._stream_batch_size
+                                    ,is_list=True
+                                    ,**self._config_tn
+                                    )
+        return corpus.TokenFile.write(os.path.join(self._corpus_dir, 'tokens.txt'), docs), urls
+
+    def __create_corpus_stream(self, texts):
+        return corpus.build_corpus_stream(texts
+                                        ,os.path.join(self._corpus_dir, 'corpus.mm')
+                                        ,is_1len=self._is_1len
+                                        ,is_term_fq=self._is_term_fq
+                                        ,limitcnt=self._stop_term_limitcnt
+                                        ,toprate=self._stop_term_toprate
+                                        )
+
+    def __create_corpus(self, texts):
+        return corpus.build_corpus(texts
+                                ,is_1len=self._is_1len
+                                ,is_term_fq=self._is_term_fq
+                                ,limitcnt=self._stop_term_limitcnt
+                                ,toprate=self._stop_term_toprate
+                                )
+
+    def __create_topic_model(self):
+        params = dict(corpus=self._corpus
+                    ,id2word=self._dictionary
+                    ,num_topics=self._num_topics
+                    ,iterations=self._iterations
+                    ,alpha=self._alpha
+                    ,chunksize=self._chunksize
+                    ,passes=self._passes
+                    ,eval_every=self._eval_every
+                    ,dtype=np.float64
+                    )
+        if self._lda_mode == 'multicore':
+            return gensim.models.ldamulticore.LdaMulticore(workers=self._workers, **params)
+        return gensim.models.ldamodel.LdaModel(**params)
+
+    def __doc_topic_matrix(self, bows, batch_size):
+        # ドキュメント×トピックのスコア（self._lda[bow]と同じくminimum_probability未満と、topic_doc_threshold以下は除く）
+        minimum_probability = max(self._lda.minimum_probability, 1e-8)
+        rows = []
+        for gamma in self.__inference(bows, batch_size):
+            gamma[(gamma < minimum_probability) | (gamma <= self._topic_doc_threshold)] = 0
+            rows.append(scipy.sparse.csr_matrix(gamma))
+        if not rows:
+            return scipy.sparse.csr_matrix((0, self._lda.num_topics))
+        return scipy.sparse.vstack(rows, format='csr')
+
+    def __count_topic(self, topic_counnter, doc_topic):
+        # topic_counnterに、doc_topicのトピック別の記事数を加算する
+        counts = np.bincount(doc_topic.indices, minlength=self._lda.num_topics)
+        topic_counnter = (topic_counnter + Counter({topic: int(counts[topic]) for topic in np.flatnonzero(counts).tolist()})).most_common()
+        topic_list = [topic for topic, _ in topic_counnter]
         topic_df = pd.DataFrame(topic_counnter, columns=['topic', 'cnt']).set_index('topic')
         return topic_list, topic_df
 
-    def __proc_docweight(self):
-        return pd.DataFrame([{topic[0]:topic[1] for topic in doc if topic[1] > self._topic_doc_threshold} for doc in self._lda_corpus])\
-                .join(pd.DataFrame(self._data).rename(columns={0:'url'})['url'], how='inner')
+    @property
+    def _df_docweight(self):
+        # 互換用：ドキュメント×トピックのデータフレーム（スコアがないトピックはNaN）
+        # 全件を密行列にするため、大規模なデータでは_doc_topic（scipy.sparse.csr_matrix）を使う
+        topics = np.unique(self._doc_topic.indices)
+        weight = self._doc_topic[:, topics].toarray()
+        weight[weight == 0] = np.nan
+        df = pd.DataFrame(weight, columns=topics.tolist())
+        df['url'] = self._urls
+        return df
+
+    def transform(self, docs, batch_size=2000, workers=None, is_sparse=False):
+        '''
+        Description::
+            学習済みのモデルで新しいドキュメントのトピックのスコアを推定する（再学習はしない）
+            学習時と同じ形態素解析の設定(config_tn)で形態素解析し、学習時の辞書でBoWにする
+            辞書には学習時のストップターム除外後の単語だけが含まれるため、除外した単語はBoWに入らない
+            batch_size件ずつ形態素解析・推定するため、docsはイテラブルでもよい
+
+        :param docs:
+            ドキュメントの文章のリスト（イテラブル）
+        :param batch_size:
+            一度に形態素解析・推定するドキュメント数
+            デフォルト：2000
+        :param workers:
+            形態素解析の並列プロセス数
+            デフォルト：None（tokenize_workersの設定）
+        :param is_sparse:
+            Trueの場合はtopic_doc_thresholdより大きいスコアだけを持つscipy.sparse.csr_matrixを返す
+            デフォルト：False
+
+        :return:
+            ドキュメント数×トピック数の行列（各行の合計は1）
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper.load('model')
+            >>> t.transform(['友人代表のスピーチ、独女はどうこなしている？']).shape
+            (1, 100)
+            >>> 
+        '''
+        tokens = self.m.tokenize_stream(docs
+                                    ,workers=self._tokenize_workers if workers is None else workers
+                                    ,chunksize=self._tokenize_chunksize
+                                    ,batch_size=batch_size
+                                    ,is_list=True
+                                    ,**self._config_tn
+                                    )
+        bows = (self._dictionary.doc2bow(doc) for doc in tokens)
+        results = []
+        with self._instrument.stage('transform') as record:
+            for gamma in self.__inference(bows, batch_size):
+                if is_sparse:
+                    gamma[gamma <= self._topic_doc_threshold] = 0
+                    results.append(scipy.sparse.csr_matrix(gamma))
+                else:
+                    results.append(gamma)
+            record['docs'] = sum(result.shape[0] for result in results)
+        if is_sparse:
+            return scipy.sparse.vstack(results, format='csr') if results else scipy.sparse.csr_matrix((0, self._lda.num_topics))
+        return np.vstack(results) if results else np.zeros((0, self._lda.num_topics))
+
+    def __inference(self, bows, batch_size):
+        bows = iter(bows)
+        for chunk in iter(lambda: list(itertools.islice(bows, batch_size)), []):
+            gamma, _ = self._lda.inference(chunk)
+            yield gamma / gamma.sum(axis=1)[:, np.newaxis]
+
+    def update(self, new_docs, max_new_terms=None, batch_size=2000):
+        '''
+        Description::
+            追加のドキュメントだけを形態素解析し、学習済みのLDAモデルをオンライン学習で更新する
+            辞書にない単語は、追加分の単語頻度でストップタームの除外（is_1len, is_term_fq, stop_term_limitcnt）を通過したものだけを
+            頻度の高い順にmax_new_terms件まで辞書に追加する
+            トピック別の記事数とドキュメントのスコアは追加分だけ推定して追記する（既存のドキュメントのスコアは再計算しない）
+            load(mmap=True)で読み込んだモデルは、更新する配列をメモリ上にコピーしてから更新する
+
+        :param new_docs:
+            追加のドキュメント（dataと同じ形式、またはTSVファイルのパス）
+            [[entry_id1, sentence1], [entry_id2, sentence2], ]
+        :param max_new_terms:
+            辞書に追加する単語数の上限（0の場合は辞書を拡張しない）
+            デフォルト：None（上限なし）
+        :param batch_size:
+            ドキュメントのスコアを一度に推定するドキュメント数
+            デフォルト：2000
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper.load('model')
+            >>> new_data = [i.strip('\\n').split('\\t') for i in open('data_new.tsv', 'r')]
+            >>> t.update(new_data)
+            >>> t.save('model')
+            >>> 
+        '''
+        records = list(corpus.read_tsv(new_docs)) if isinstance(new_docs, str) else list(new_docs)
+        if not records:
+            return
+        with self._instrument.stage('tokenize', 'tokenize text ...') as record, self.m.timing() as timer:
+            # 既存のTokenStoreと語彙を共有して、追加分をそのまま連結できるようにする
+            store = self.m.tokenize_store([doc[1] for doc in records]
+                                        ,workers=self._tokenize_workers
+                                        ,chunksize=self._tokenize_chunksize
+                                        ,store=self._texts.empty_like() if isinstance(self._texts, ToolsNLP.TokenStore) else None
+                                        ,**self._config_tn
+                                        )
+            texts = list(store)
+            record['docs'], record['tokens'], record['extra'] = len(store), store.n_tokens, timer.info()._asdict()
+        token2id = self._dictionary.token2id
+        terms, cfs, _, _ = corpus.encode_terms(texts, is_keep_ids=False)
+        keep = corpus.stop_term_mask(terms, cfs, self._is_1len, self._is_term_fq, self._stop_term_limitcnt, 0)
+        new_terms = set([terms[i] for i in np.argsort(-cfs, kind='stable') if keep[i] and terms[i] not in token2id][:max_new_terms])
+        texts_cleansing = [[w for w in doc if w in token2id or w in new_terms] for doc in texts]
+        num_terms = len(self._dictionary)
+        bows = [self._dictionary.doc2bow(doc, allow_update=True) for doc in texts_cleansing]
+        self.__resize_terms(len(self._dictionary) - num_terms)
+        with self._instrument.stage('train', 'update topic model ...') as record:
+            # 辞書の単語を1つも含まない場合は学習しない（gensimはゼロ除算の警告を出す）
+            if any(bows):
+                self._lda.update(bows)
+            record['docs'], record['tokens'] = len(bows), sum(cnt for bow in bows for _, cnt in bow)
+
+        if isinstance(self._texts, ToolsNLP.TokenStore):
+            self._texts_cleansing.extend(store.select(np.fromiter((w in token2id for w in itertools.chain.from_iterable(texts)), dtype=bool, count=store.n_tokens)))
+            self._texts.extend(store)
+        elif isinstance(self._texts, corpus.TokenFile):
+            self._texts.append(texts)
+            self._texts_cleansing = self._texts.filter(set(self._dictionary.token2id))
+            if self._representative is not None:
+                self._texts_cleansing = self._texts_cleansing.subset(np.concatenate([self._representative == np.arange(len(self._representative)), np.ones(len(texts), dtype=bool)]))
+        elif isinstance(self._texts, corpus.ConcatCorpus):
+            # シャードのキャッシュは変更せず、追加分を別のファイルに書き出して連結する
+            token_file = corpus.TokenFile.write(os.path.join(self._corpus_dir, 'tokens_{}.txt'.format(len(self._urls))), texts)
+            self._texts = corpus.ConcatCorpus([self._texts, token_file])
+            self._texts_cleansing = corpus.ConcatCorpus([self._texts_cleansing, token_file.filter(set(self._dictionary.token2id))])
+        if self._representative is not None:
+            # 追加分は重複の判定をせず、それぞれを代表にする
+            self._representative = np.concatenate([self._representative, np.arange(len(self._urls), len(self._urls) + len(records))])
+        if isinstance(self._corpus, list):
+            self._corpus.extend(bows)
+        else:
+            self._corpus = corpus.ConcatCorpus([self._corpus, bows])
+        self._lda_corpus = self._lda[self._corpus]
+        self._urls = list(self._urls) + [doc[0] for doc in records]
+
+        with self._instrument.stage('output', 'make output data ...') as record:
+            doc_topic = self.__doc_topic_matrix(bows, batch_size)
+            self._doc_topic = scipy.sparse.vstack([self._doc_topic, doc_topic], format='csr')
+            self._topic_list, self._topic_df = self.__count_topic(Counter(dict(self._topic_df['cnt'].items())), doc_topic)
+            record['docs'] = len(bows)
+        # 類似ドキュメントのインデックスは次のmost_similarで作りなおす
+        self._similarity_index = self._url_index = None
+
+    def __resize_terms(self, n_new):
+        # 語彙の追加分だけsstatsとetaを拡張する（メモリマップの読み取り専用の配列は書き込み可能なコピーになる）
+        lda = self._lda
+        eta = np.asarray(lda.eta)
+        lda.eta = np.concatenate([eta, np.repeat(eta.mean(axis=-1, keepdims=True), n_new, axis=-1)], axis=-1)
+        lda.state.eta = lda.eta
+        lda.state.sstats = np.concatenate([lda.state.sstats, np.zeros((lda.num_topics, n_new), dtype=lda.state.sstats.dtype)], axis=1)
+        lda.alpha = np.array(lda.alpha)
+        lda.num_terms += n_new
+        lda.id2word = self._dictionary
+        lda.sync_state()
+
+    def save(self, path):
+        '''
+        Description::
+            学習済みのモデルをディレクトリに保存する
+            辞書(dictionary.dict)、コーパス(corpus.mm)、LDAモデル(lda.model)、トピック別の記事数とドキュメントのスコア(doc_topic_*.npy, CSR形式)、設定(meta.json)を書き出す
+            dedup_thresholdを指定した場合は、ドキュメントごとの重複グループの代表(representative.npy)も書き出す
+            build_similarity_index（most_similar）で作成した類似ドキュメントのインデックスがあれば、インデックス(similarity_*)も書き出す
+            LDAモデルとドキュメントのスコアの配列はnpy形式で保存するため、loadでメモリマップして読み込める
+
+        :param path:
+            保存先のディレクトリ
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'})
+            >>> t.save('model')
+            >>> t = ToolsNLP.TopicModelWrapper.load('model')
+            >>> 
+        '''
+        # 一時ディレクトリに書き出してからファイルごとに置き換える（メモリマップで読み込み中のモデルに上書き保存しても壊れない）
+        # 以前の保存で書き出したファイルのうち、今回書き出さなかったもの（representative.npyなど）は削除し、meta.jsonは最後に置き換える
+        os.makedirs(path, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=path)
+        try:
+            self.__save_files(tmp)
+            fnames = set(os.listdir(tmp))
+            for fname in sorted(fnames - {'meta.json'}):
+                os.replace(os.path.join(tmp, fname), os.path.join(path, fname))
+            for fname in os.listdir(path):
+                if fname.startswith(_MODEL_FILES) and fname not in fnames:
+                    os.remove(os.path.join(path, fname))
+            os.replace(os.path.join(tmp, 'meta.json'), os.path.join(path, 'meta.json'))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def __save_files(self, path):
+        self._dictionary.save(os.path.join(path, 'dictionary.dict'))
+        gensim.corpora.MmCorpus.serialize(os.path.join(path, 'corpus.mm'), self._corpus, id2word=self._dictionary)
+        self._lda.save(os.path.join(path, 'lda.model'), sep_limit=0)
+        for name in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(path, 'doc_topic_{}.npy'.format(name)), getattr(self._doc_topic, name))
+        if self._representative is not None:
+            np.save(os.path.join(path, 'representative.npy'), self._representative)
+        if self._similarity_index is not None:
+            self._similarity_index.save(path)
+        meta = {'config_mw': self._config_mw
+                ,'config_tn': self._config_tn
+                ,'kwargs': self.__get_config()
+                ,'topic_cnt': [[topic, cnt] for topic, cnt in self._topic_df['cnt'].items()]
+                ,'doc_topic_shape': self._doc_topic.shape
+                ,'urls': list(self._urls)
+                ,'is_representative': self._representative is not None
+                }
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, default=lambda o: o.tolist())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''
+        Description::
+            saveで保存したモデルを読み込む（形態素解析・学習はしない）
+            mmap=Trueの場合はLDAモデルとドキュメントのスコアの配列を読み取り専用でメモリマップし、複数プロセスで同じページを共有する
+            コーパスはファイルから逐次読み込む
+
+        :param path:
+            saveで保存したディレクトリ
+        :param mmap:
+            配列をメモリマップで読み込むかどうか
+            デフォルト：True
+        '''
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        self = cls.__new__(cls)
+        self.__set_config(meta['config_mw'], meta['config_tn'], meta['kwargs'])
+        self._data = None
+        self._is_stream = False
+        self._texts = self._texts_cleansing = None
+        self._urls = meta['urls']
+        # 書き出したファイルはmeta.jsonで判定する（以前のバージョンで保存したモデルはファイルの有無で判定する）
+        path_representative = os.path.join(path, 'representative.npy')
+        self._representative = None
+        if meta.get('is_representative', os.path.exists(path_representative)):
+            self._representative = np.load(path_representative)
+            if len(self._representative) != len(self._urls):
+                raise ValueError('representative.npy does not match the documents in meta.json: {} != {}'.format(len(self._representative), len(self._urls)))
+        self._dictionary = gensim.corpora.Dictionary.load(os.path.join(path, 'dictionary.dict'))
+        self._corpus = gensim.corpora.MmCorpus(os.path.join(path, 'corpus.mm'))
+        self._lda = gensim.models.ldamodel.LdaModel.load(os.path.join(path, 'lda.model'), mmap=mmap_mode)
+        self._lda.id2word = self._dictionary
+        self._lda_corpus = self._lda[self._corpus]
+        self._topic_df = pd.DataFrame(meta['topic_cnt'], columns=['topic', 'cnt']).set_index('topic')
+        self._topic_list = list(self._topic_df.index)
+        self._doc_topic = scipy.sparse.csr_matrix(tuple(np.load(os.path.join(path, 'doc_topic_{}.npy'.format(name)), mmap_mode=mmap_mode)
+                                                        for name in ('data', 'indices', 'indptr'))
+                                                ,shape=tuple(meta['doc_topic_shape']), copy=False)
+        self._url_index = None
+        is_similarity = os.path.exists(os.path.join(path, 'similarity.json'))
+        self._similarity_index = similarity.SimilarityIndex.load(path, mmap=mmap) if is_similarity else None
+        if self._similarity_index is not None and len(self._similarity_index) != self._doc_topic.shape[0]:
+            # ドキュメント数が合わないインデックスは使わない（次のmost_similarで作りなおす）
+            warnings.warn('similarity index does not match the documents ({} != {}), ignoring it'.format(len(self._similarity_index), self._doc_topic.shape[0]), stacklevel=2)
+            self._similarity_index = None
+        return self
 
     def get_topic2topdoc_list(self, topic_count=20, top_n=10):
         '''
@@ -172,9 +819,9 @@ class TopicModelWrapper:
 
         Usage::
             >>> import ToolsNLP
-            # doctest用にエスケースしている。元のコード `data = [i.strip('\n').split('\t') for i in open('data.tsv', 'r')]`
+            # doctest用にエスケースしている。元のコード `data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]`
             >>> data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]
-            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'})
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'}, verbose=True)
             read data ...
             documents count => 5,980
             tokenize text ...
@@ -194,12 +841,101 @@ class TopicModelWrapper:
             1022     84  http://news.livedoor.com/article/detail/6374433/  0.910676
         '''
 
-        df_top_weight = pd.DataFrame()
+        # トピックごとに列を取り出し、上位top_nだけを部分ソート（argpartition）で選ぶ
+        doc_topic = self._doc_topic.tocsc()
+        topics, docs, weights = [], [], []
         for i in self._topic_list[:topic_count]:
-            df_top_weight_org = self._df_docweight.sort_values(i, ascending=False).head(top_n).loc[:,['url',i]].rename(columns={i: 'weight'})
-            df_top_weight_org['topic'] = i
-            df_top_weight = pd.concat([df_top_weight, df_top_weight_org[['topic', 'url', 'weight']]])
-        return df_top_weight
+            start, end = doc_topic.indptr[i], doc_topic.indptr[i + 1]
+            weight = doc_topic.data[start:end]
+            top = _top_n(weight, top_n)
+            topics.append(np.full(len(top), i))
+            docs.append(doc_topic.indices[start:end][top])
+            weights.append(weight[top])
+        docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int64)
+        return pd.DataFrame({'topic': np.concatenate(topics) if topics else np.zeros(0, dtype=np.int64)
+                            ,'url': [self._urls[d] for d in docs.tolist()]
+                            ,'weight': np.concatenate(weights) if weights else np.zeros(0)
+                            }, index=docs)
+
+    def build_similarity_index(self, mode='exact', n_probe=3):
+        '''
+        Description::
+            ドキュメントのスコア（ドキュメント×トピック）から類似ドキュメントのインデックス（similarity.SimilarityIndex）を作成する
+            most_similarで最初に検索したときにも、デフォルトの設定で作成する
+
+        :param mode:
+            'exact'：全ドキュメントとのコサイン類似度を計算する
+            'approximate'：クエリのスコア上位n_probe個のトピックを最大のスコアのトピックとするドキュメントだけを検索する（大規模なデータ向け）
+            デフォルト：'exact'
+        :param n_probe:
+            approximateで検索するトピック数
+            デフォルト：3
+        '''
+        with self._instrument.stage('index', 'make similarity index ...') as record:
+            self._similarity_index = similarity.SimilarityIndex(self._doc_topic, mode=mode, n_probe=n_probe)
+            record['docs'] = len(self._similarity_index)
+        return self._similarity_index
+
+    def most_similar(self, doc=None, k=10, mode=None, n_probe=None, row=None, entry_id=None):
+        '''
+        Description::
+            ドキュメントのスコア（トピックの分布）のコサイン類似度が高い順に、類似ドキュメントのentry_idのデータフレームを出力する
+            entry_id・ドキュメントの番号を指定した場合はそのドキュメント自身を除き、テキストを指定した場合はtransformでスコアを推定する
+            重複ドキュメント（dedup_threshold）は代表と同じスコアなので、スコア1.0で出力される
+            doc, row, entry_idのいずれか1つを指定する
+
+        :param doc:
+            entry_id、またはテキスト（entry_idに一致しない文字列）
+            intもentry_idとして扱う（ドキュメントの番号はrowで指定する）
+        :param k:
+            出力するドキュメント数
+            デフォルト：10
+        :param mode, n_probe:
+            指定した場合はインデックスの設定（build_similarity_index）の代わりに使う
+        :param row:
+            ドキュメントの番号（出力のデータフレームのindex）
+        :param entry_id:
+            entry_id（一致するドキュメントがない場合はKeyError）
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper.load('model')
+            >>> t.most_similar('http://news.livedoor.com/article/detail/4778030/', k=3)
+                                                               url     score
+            2187  http://news.livedoor.com/article/detail/5645421/  0.998012
+            ...
+            >>> t.most_similar('友人代表のスピーチ、独女はどうこなしている？', k=3)
+            >>> t.most_similar(row=2187, k=3)
+            >>> 
+        '''
+        if sum(x is not None for x in (doc, row, entry_id)) != 1:
+            raise ValueError('specify exactly one of doc, row, entry_id')
+        if self._similarity_index is None:
+            self.build_similarity_index()
+        if row is None and self._url_index is None:
+            self._url_index = {}
+            for i, url in enumerate(self._urls):
+                self._url_index.setdefault(url, i)
+        if entry_id is not None:
+            if entry_id not in self._url_index:
+                raise KeyError('entry_id not found: {}'.format(entry_id))
+            row = self._url_index[entry_id]
+        elif doc is not None:
+            if doc in self._url_index:
+                row = self._url_index[doc]
+            elif not isinstance(doc, str):
+                raise KeyError('entry_id not found: {}'.format(doc))
+        if row is None:
+            query, exclude = self.transform([doc], is_sparse=True), None
+        else:
+            exclude = int(row)
+            if not 0 <= exclude < len(self._urls):
+                raise IndexError('row out of range: {}'.format(row))
+            query = self._doc_topic[exclude]
+        docs, scores = self._similarity_index.search(query, k=k, exclude=None if exclude is None else [exclude], mode=mode, n_probe=n_probe)
+        is_found = docs[0] >= 0
+        docs, scores = docs[0][is_found], scores[0][is_found]
+        return pd.DataFrame({'url': [self._urls[d] for d in docs.tolist()], 'score': scores}, index=docs)
 
     def get_topic2doccnt_plot(self, topic_count=50):
         '''
@@ -212,9 +948,9 @@ class TopicModelWrapper:
 
         Usage::
             >>> import ToolsNLP
-            # doctest用にエスケースしている。元のコード `data = [i.strip('\n').split('\t') for i in open('data.tsv', 'r')]`
+            # doctest用にエスケースしている。元のコード `data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]`
             >>> data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]
-            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'})
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'}, verbose=True)
             read data ...
             documents count => 5,980
             tokenize text ...
@@ -228,6 +964,7 @@ class TopicModelWrapper:
             >>> t.get_topic2doccnt_plot()
             >>> 
         '''
+        import matplotlib.pyplot as plt
 
         fig = plt.figure(figsize=(20,5))
         plt.subplot(1, 2, 1)
@@ -252,9 +989,9 @@ class TopicModelWrapper:
 
         Usage::
             >>> import ToolsNLP
-            # doctest用にエスケースしている。元のコード `data = [i.strip('\n').split('\t') for i in open('data.tsv', 'r')]`
+            # doctest用にエスケースしている。元のコード `data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]`
             >>> data = [i.strip('\\n').split('\\t') for i in open('data.tsv', 'r')]
-            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'})
+            >>> t = ToolsNLP.TopicModelWrapper(data=data, config_mw={'dicttype':'neologd'}, verbose=True)
             read data ...
             documents count => 5,980
             tokenize text ...
@@ -268,7 +1005,12 @@ class TopicModelWrapper:
             >>> t.get_topic2term_plot()
             >>> 
         '''
+        import matplotlib.pyplot as plt
+        from wordcloud import WordCloud
+
         topic_count = self._num_topics if topic_count >= self._num_topics else topic_count
+        topic_terms = self.__topic_terms(self._topic_list[:topic_count], term_count)
+        wordcloud = WordCloud(background_color='white',font_path=self._fpath,width=1400,height=700)
         loop_count = int(np.ceil(topic_count / 3))
         for i in range(loop_count):
             plt.figure(figsize=(23,loop_count*10))
@@ -276,9 +1018,215 @@ class TopicModelWrapper:
                 if t+1 <= topic_count:
                     topic = self._topic_list[t]
                     plt.subplot(loop_count,3,t+1)
-                    x = dict(self._lda.show_topic(topic,term_count))
-                    im = WordCloud(background_color='white',font_path=self._fpath,width=1400,height=700).generate_from_frequencies(x)
+                    im = wordcloud.generate_from_frequencies(topic_terms[topic])
                     plt.imshow(im)
                     plt.axis('off')
                     plt.title('Topic #' + str(topic).rjust(3, '0'))
             plt.show()
+
+    def __topic_terms(self, topics, term_count):
+        # トピック×単語の確率（get_topics）を1回だけ取り出し、トピックごとに上位term_countの単語を選ぶ（show_topicと同じ結果）
+        topic_term = self._lda.get_topics()
+        topic_terms = {}
+        for topic in topics:
+            prob = topic_term[topic] / topic_term[topic].sum()
+            top = np.argpartition(-prob, term_count - 1)[:term_count] if len(prob) > term_count else np.arange(len(prob))
+            top = top[np.argsort(-prob[top], kind='stable')]
+            topic_terms[topic] = {self._dictionary[i]: float(prob[i]) for i in top.tolist()}
+        return topic_terms
+
+    def export_plots(self, path, topic_count=20, term_count=200, workers=None, font_path=None, width=1400, height=700, random_state=0):
+        '''
+        Description::
+            トピック別の単語のワードクラウド（get_topic2term_plot）と、トピック別の記事数の棒グラフ（get_topic2doccnt_plot）を画像ファイルに書き出す
+            ディスプレイは使わない（ワードクラウドはPILで直接、棒グラフはmatplotlibのAggで描画する）
+            ワードクラウドはプロセスプールで並列に描画し、フォントはワーカーごとに1回だけ読み込む
+            描画する内容（単語と確率、サイズ、フォントファイルの内容、乱数のシード）のハッシュをmanifest.jsonに保存し、
+            前回と同じ内容のファイルは描画しない（updateで変わらなかったトピックは書き出さない）
+
+        :param path:
+            出力先のディレクトリ
+            topic_XXX.png（XXXはトピック番号）、topic_doccnt.png、manifest.jsonを書き出す
+        :param topic_count:
+            出力するトピック数（記事数の多い順）
+            デフォルト：20
+        :param term_count:
+            ワードクラウドに表示する単語数
+            デフォルト：200
+        :param workers:
+            ワードクラウドを描画するプロセス数
+            デフォルト：None（CPUコア数）
+            1の場合はプロセスプールを使わずに逐次実行する
+        :param font_path:
+            フォントファイルのパス
+            デフォルト：None（ToolsNLPのIPAexゴシック）
+        :param width, height:
+            ワードクラウドの画像サイズ
+            デフォルト：1400, 700
+        :param random_state:
+            ワードクラウドの配置の乱数のシード（同じ内容なら同じ画像になる）
+            デフォルト：0
+
+        :return:
+            出力したファイルのデータフレーム（file, topic, hash, is_skipped）
+
+        Usage::
+            >>> import ToolsNLP
+            >>> t = ToolsNLP.TopicModelWrapper.load('model')
+            >>> t.export_plots('report', topic_count=50, workers=4)
+                          file  topic  hash  is_skipped
+            0    topic_084.png     84  ...        False
+            >>> t.update(new_data)
+            >>> t.export_plots('report', topic_count=50, workers=4)  # 変わったトピックだけ描画する
+            >>> 
+        '''
+        font_path = font_path or self._fpath
+        os.makedirs(path, exist_ok=True)
+        path_manifest = os.path.join(path, 'manifest.json')
+        manifest = {}
+        if os.path.exists(path_manifest):
+            with open(path_manifest, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+        with self._instrument.stage('export', 'export plots ...') as record:
+            topic_count = min(topic_count, self._num_topics)
+            topics = self._topic_list[:topic_count]
+            # 確率は有効数字6桁に丸めてから描画・ハッシュする（計算誤差だけの違いでは描画しなおさない）
+            topic_terms = {topic: {term: float('{:.6g}'.format(prob)) for term, prob in terms.items()}
+                           for topic, terms in self.__topic_terms(topics, term_count).items()}
+            # フォントはファイルの内容のハッシュで比較する（同じファイル名の別のフォントに差し替えた場合も描画しなおす）
+            setting = [_file_hash(font_path), width, height, random_state]
+            rows, tasks = [], []
+            for topic in topics:
+                fname = 'topic_{}.png'.format(str(topic).rjust(3, '0'))
+                key = _content_hash([setting, sorted(topic_terms[topic].items())])
+                is_skipped = manifest.get(fname) == key and os.path.exists(os.path.join(path, fname))
+                rows.append([fname, topic, key, is_skipped])
+                if not is_skipped:
+                    tasks.append((os.path.join(path, fname), topic_terms[topic]))
+
+            counts = self._topic_df['cnt'].head(topic_count)
+            fname = 'topic_doccnt.png'
+            key = _content_hash([[int(topic), int(cnt)] for topic, cnt in counts.items()])
+            is_skipped = manifest.get(fname) == key and os.path.exists(os.path.join(path, fname))
+            rows.append([fname, None, key, is_skipped])
+            if not is_skipped:
+                _save_doccnt_plot(os.path.join(path, fname), counts)
+
+            state = (font_path, width, height, random_state)
+            workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+            if workers == 1:
+                _init_plot_worker(*state)
+                for task in tasks:
+                    _render_wordcloud(task)
+            else:
+                import multiprocessing
+                with multiprocessing.Pool(workers, initializer=_init_plot_worker, initargs=state) as pool:
+                    pool.map(_render_wordcloud, tasks, chunksize=1)
+
+            # 画像を全て書き出してからmanifestを更新する（途中で失敗した場合は次回に描画しなおす。変更がなければ書き出さない）
+            new_manifest = dict(manifest, **{row[0]: row[2] for row in rows})
+            if new_manifest != manifest or not os.path.exists(path_manifest):
+                _replace_file(path_manifest, lambda f: f.write(json.dumps(new_manifest, ensure_ascii=False, indent=1).encode('utf-8')))
+            record['extra'] = {'rendered': sum(not row[3] for row in rows), 'skipped': sum(row[3] for row in rows)}
+        return pd.DataFrame(rows, columns=['file', 'topic', 'hash', 'is_skipped'])
+
+
+def _top_n(weight, n):
+    # スコアの大きい順（同じスコアはドキュメントの番号順）に上位n件の位置を返す
+    # 全件のソートと同じ結果になるように、n件目と同じスコアのものは位置の小さい順に選ぶ
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if len(weight) > n:
+        kth = -np.partition(-weight, n - 1)[n - 1]
+        top = np.flatnonzero(weight > kth)
+        top = np.sort(np.concatenate([top, np.flatnonzero(weight == kth)[:n - len(top)]]))
+    else:
+        top = np.arange(len(weight))
+    return top[np.argsort(-weight[top], kind='stable')]
+
+
+# worker process state for TopicModelWrapper.search
+_search_state = None
+
+def _init_search_worker(*state):
+    global _search_state
+    _search_state = state
+
+def _imap_window(pool, func, items, window):
+    # pool.imapと同じく順番に結果を返すが、未完了のタスクがwindow件になるまでしか投入しない
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _train_candidate(candidate):
+    train, holdout, texts, dictionary, coherence, params = _search_state
+    num_topics, alpha = candidate
+    start = time.perf_counter()
+    lda = gensim.models.ldamodel.LdaModel(corpus=train, id2word=dictionary, num_topics=num_topics, alpha=alpha, eval_every=None, **params)
+    train_sec = time.perf_counter() - start
+    perplexity = np.exp2(-lda.log_perplexity(holdout)) if len(holdout) else np.nan
+    score = gensim.models.CoherenceModel(model=lda, corpus=train, texts=texts, dictionary=dictionary, coherence=coherence, processes=1).get_coherence()
+    return lda, perplexity, score, train_sec
+
+
+# worker process state for TopicModelWrapper.export_plots
+_plot_state = None
+
+def _init_plot_worker(font_path, width, height, random_state):
+    global _plot_state
+    from wordcloud import WordCloud
+    _plot_state = (WordCloud(background_color='white', font_path=font_path, width=width, height=height), random_state)
+
+def _render_wordcloud(task):
+    import random
+    path, frequencies = task
+    wordcloud, random_state = _plot_state
+    # 乱数はファイルごとにシードから作りなおす（描画する順番・プロセスによらず同じ画像にする）
+    wordcloud.random_state = random.Random(random_state)
+    image = wordcloud.generate_from_frequencies(frequencies).to_image()
+    _replace_file(path, lambda f: image.save(f, format='PNG'))
+
+def _save_doccnt_plot(path, counts):
+    # pyplotを使わずにAggのキャンバスに描画する（ディスプレイ不要・グローバルなバックエンドを変更しない）
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    # 記事数のあるトピックがない場合（topic_doc_thresholdが大きい場合など）はタイトルだけの空のグラフにする
+    fig = Figure(figsize=(20,5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 2, 1)
+    ax.set_title('observation cnt')
+    if len(counts):
+        counts.plot.bar(ax=ax)
+    ax = fig.add_subplot(1, 2, 2)
+    ax.set_title('observation cnt rate')
+    if len(counts):
+        (counts / np.sum(counts)).plot.bar(ax=ax)
+    _replace_file(path, lambda f: fig.savefig(f, format='png'))
+
+def _content_hash(content):
+    import hashlib
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _file_hash(path):
+    import hashlib
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _replace_file(path, write):
+    # 一時ファイルに書き出してから置き換える（書き出し途中のファイルを残さない）
+    fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(path_tmp, path)
+    except BaseException:
+        os.remove(path_tmp)
+        raise
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+'''
+AsyncMecabWrapperの負荷試験
+同時接続数（concurrency）ごとに、クライアントのタスクが待ち時間なしでリクエストを送り続け、レイテンシのパーセンタイルとスループットを計測する
+イベントループの遅延（1msごとに起きるタスクの遅れ）も計測し、他のリクエストの処理がブロックされていないかを確認する
+
+    blocking：イベントループの中でMecabWrapper.tokenizeを直接呼び出す（変更前のサービスと同じ）
+    thread：AsyncMecabWrapper(executor='thread')
+    process：AsyncMecabWrapper(executor='process')
+
+    $ cd benchmarks && python3 bench_async.py --concurrency 1 8 32 128 --requests 2000 --workers 4
+    $ cd benchmarks && python3 bench_async.py --fake-tagger   # MeCabのない環境（bench_suite.pyと同じ代替Tagger）
+'''
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+from bench_corpus import make_corpus
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else float('nan')
+
+
+async def measure_lag(lags, stop):
+    # 1msごとに起きるはずのタスクの遅れ（イベントループがブロックされた時間）
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0.001)
+        lags.append(loop.time() - start - 0.001)
+
+
+async def run_level(handler, texts, concurrency, n_requests, timeout):
+    latencies, lags, errors = [], [], {'timeout': 0, 'error': 0}
+    stop = asyncio.Event()
+    counter = iter(range(n_requests))
+    rnd = random.Random(concurrency)
+
+    async def client():
+        for _ in counter:
+            text = rnd.choice(texts)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(handler(text), timeout)
+            except asyncio.TimeoutError:
+                errors['timeout'] += 1
+            except Exception:
+                errors['error'] += 1
+            latencies.append(time.perf_counter() - start)
+
+    lag_task = asyncio.ensure_future(measure_lag(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    return {'rps': len(latencies) / elapsed, 'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9), 'p99': percentile(latencies, 0.99)
+            ,'max': max(latencies), 'lag_p99': percentile(lags, 0.99), **errors}
+
+
+async def run_mode(mode, args, texts):
+    kwargs = dict(pos_filter=[['名詞', '一般', '*'], ['名詞', '固有名詞', '一般']], is_list=True)
+    if mode == 'blocking':
+        import ToolsNLP
+        m = ToolsNLP.MecabWrapper()
+
+        async def handler(text):
+            return m.tokenize(text, **kwargs)
+        for concurrency in args.concurrency:
+            yield concurrency, await run_level(handler, texts, concurrency, args.requests, args.timeout), None
+        return
+    from ToolsNLP.async_mecab import AsyncMecabWrapper
+    async with AsyncMecabWrapper(workers=args.workers, executor=mode, max_batch_size=args.max_batch_size) as m:
+        # ワーカーの初期化は計測に含めない
+        await m.tokenize_async(texts[0], **kwargs)
+        for concurrency in args.concurrency:
+            before = m.stats()
+            result = await run_level(lambda text: m.tokenize_async(text, **kwargs), texts, concurrency, args.requests, args.timeout)
+            after = m.stats()
+            batches = after['batches'] - before['batches']
+            yield concurrency, result, (after['dispatched'] - before['dispatched']) / batches if batches else float('nan')
+
+
+async def main_async(args):
+    texts = [text for _, text in make_corpus(args.docs, args.seed, sentences=(1, 3))]
+    print('{:<9}{:>6}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}{:>8}{:>9}'.format(
+        'mode', 'conc', 'req/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'lag p99 ms', 'batch', 'timeout'))
+    for mode in args.modes:
+        async for concurrency, r, batch in run_mode(mode, args, texts):
+            print('{:<9}{:>6}{:>10,.0f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>12.2f}{:>8}{:>9}'.format(
+                mode, concurrency, r['rps'], r['p50'] * 1000, r['p90'] * 1000, r['p99'] * 1000, r['max'] * 1000, r['lag_p99'] * 1000
+                ,'-' if batch is None else '{:.1f}'.format(batch), r['timeout']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=['blocking', 'thread', 'process'], choices=['blocking', 'thread', 'process'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--requests', type=int, default=2000, help='同時接続数ごとのリクエスト数')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fake-tagger', action='store_true')
+    args = parser.parse_args()
+    if args.fake_tagger:
+        # ワーカープロセスもこのsys.pathを引き継ぐ
+        sys.path.insert(0, os.path.join(BENCH_DIR, 'fake_mecab'))
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+ベンチマーク用の日本語コーパスを生成する
+語彙（品詞・原形つき）を組み合わせて文を作るので、シードとドキュメント数が同じなら同じコーパスになる
+LEXICONはfake_mecab（MeCabを使わない計測用のTagger）の辞書としても使う
+
+    $ cd benchmarks && python3 bench_corpus.py corpus.tsv --docs 10000
+'''
+
+import argparse
+import random
+
+
+# (表層形, 品詞, 品詞細分類1, 品詞細分類2, 原形)
+NOUNS = [(w, '名詞', '一般', '*', w) for w in (
+    '天気', '経済', '株価', '市場', '会社', '電車', '温泉', '病院', '医者', '学校', '先生', '学生', '映画', '音楽', '俳優',
+    '番組', '選手', '野球', '試合', '監督', 'チーム', 'カメラ', '写真', 'ゲーム', '政治', '選挙', '料理', 'ラーメン', '行列', '人気',
+    '成功', '失敗', '喜び', '不安', '評判', '問題', '事故', '景気', '旅行', '季節', '雨', '夕方', '駅前', '味', '場所')]
+PROPER = [
+    ('東京', '名詞', '固有名詞', '地域', '東京'), ('大阪', '名詞', '固有名詞', '地域', '大阪'), ('京都', '名詞', '固有名詞', '地域', '京都'),
+    ('山田', '名詞', '固有名詞', '人名', '山田'), ('佐藤', '名詞', '固有名詞', '人名', '佐藤'), ('鈴木', '名詞', '固有名詞', '人名', '鈴木'),
+    ('トヨタ', '名詞', '固有名詞', '組織', 'トヨタ'), ('ソニー', '名詞', '固有名詞', '組織', 'ソニー'),
+]
+VERBS = [
+    ('撮れる', '動詞', '自立', '*', '撮れる'), ('降る', '動詞', '自立', '*', '降る'), ('収め', '動詞', '自立', '*', '収める'),
+    ('当たり', '動詞', '自立', '*', '当たる'), ('できる', '動詞', '自立', '*', 'できる'), ('見', '動詞', '自立', '*', '見る'),
+    ('行っ', '動詞', '自立', '*', '行く'), ('上がっ', '動詞', '自立', '*', '上がる'), ('下がっ', '動詞', '自立', '*', '下がる'),
+]
+ADJS = [
+    ('新しい', '形容詞', '自立', '*', '新しい'), ('面白い', '形容詞', '自立', '*', '面白い'), ('美味しい', '形容詞', '自立', '*', '美味しい'),
+    ('悪く', '形容詞', '自立', '*', '悪い'), ('良い', '形容詞', '自立', '*', '良い'), ('暗い', '形容詞', '自立', '*', '暗い'),
+]
+PARTICLES = [(w, '助詞', '格助詞', '一般', w) for w in ('が', 'を', 'に', 'で', 'と', 'の', 'から')] + [('は', '助詞', '係助詞', '*', 'は')]
+AUX = [('た', '助動詞', '*', '*', 'た'), ('ない', '助動詞', '*', '*', 'ない'), ('です', '助動詞', '*', '*', 'です')]
+SUFFIX = [('さん', '名詞', '接尾', '人名', 'さん')]
+SYMBOLS = [('。', '記号', '句点', '*', '。'), ('、', '記号', '読点', '*', '、'), ('！', '記号', '一般', '*', '！')]
+
+LEXICON = {entry[0]: entry for entry in NOUNS + PROPER + VERBS + ADJS + PARTICLES + AUX + SUFFIX + SYMBOLS}
+
+
+def make_sentence(rnd):
+    words = []
+    for _ in range(rnd.randint(1, 3)):
+        if rnd.random() < 0.3:
+            words += [rnd.choice(PROPER)[0]] + (['さん'] if rnd.random() < 0.5 else [])
+        else:
+            words.append(rnd.choice(NOUNS)[0])
+        words.append(rnd.choice(PARTICLES)[0])
+    words.append(rnd.choice(NOUNS)[0] + rnd.choice(['が', 'は']))
+    if rnd.random() < 0.5:
+        words += [rnd.choice(ADJS)[0]] + (['ない'] if rnd.random() < 0.2 else [])
+    else:
+        words += [rnd.choice(VERBS)[0], rnd.choice(AUX)[0]]
+    return ''.join(words) + rnd.choice(['。', '。', '！'])
+
+
+def make_corpus(n_docs, seed=0, sentences=(2, 8)):
+    '''
+    Description::
+        [[entry_id, text], ...] を生成する（TopicModelWrapperのdataと同じ形式）
+        ドキュメントごとに話題の語彙を偏らせて、トピックモデルで分かれるようにする
+    '''
+    rnd = random.Random(seed)
+    topics = [[w[0] for w in rnd.sample(NOUNS, 5)] for _ in range(20)]
+    docs = []
+    for i in range(n_docs):
+        topic = rnd.choice(topics)
+        text = []
+        for _ in range(rnd.randint(*sentences)):
+            # 話題の名詞を文頭に追加する
+            text.append(rnd.choice(topic) + 'と' + rnd.choice(topic) + 'の' + make_sentence(rnd))
+        docs.append(['http://example.com/{}'.format(i), ''.join(text)])
+    return docs
+
+
+def write_tsv(path, docs):
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry_id, text in docs:
+            f.write('{}\t{}\n'.format(entry_id, text))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output')
+    parser.add_argument('--docs', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_tsv(args.output, make_corpus(args.docs, args.seed))
+
+
+if __name__ == '__main__':
+    main()
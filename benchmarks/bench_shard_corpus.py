@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+シャードに分けたコーパスの作成（shard_corpus）と、1ファイルのストリーミング処理の処理時間を比較する
+    stream：1つのTSVファイルをtokenize_stream + build_corpus_streamで処理する（変更前）
+    shards：シャードごとに別々のプロセスで形態素解析・頻度の集計を行い、集計結果をマージする
+    cached：全シャードがキャッシュ済みの場合（辞書とコーパスの作成のみ）
+    changed：1シャードだけ変更した場合（そのシャードだけ形態素解析しなおす）
+辞書（語彙と出現頻度・文書頻度）が同じになることも確認する
+
+    $ cd benchmarks && python3 bench_shard_corpus.py --docs 100000 --shards 16 --workers 4
+    $ cd benchmarks && python3 bench_shard_corpus.py --fake-tagger   # MeCabのない環境（bench_suite.pyと同じ代替Tagger）
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+from bench_corpus import make_corpus, write_tsv
+
+
+def dictionary_counts(dictionary):
+    return {w: (dictionary.cfs[i], dictionary.dfs[i]) for w, i in dictionary.token2id.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fake-tagger', action='store_true')
+    args = parser.parse_args()
+    if args.fake_tagger:
+        # ワーカープロセスもこのsys.pathを引き継ぐ
+        sys.path.insert(0, os.path.join(BENCH_DIR, 'fake_mecab'))
+    import ToolsNLP
+    from ToolsNLP import corpus, shard_corpus
+
+    docs = make_corpus(args.docs, args.seed)
+    tmp = tempfile.mkdtemp(prefix='bench_shard_')
+    try:
+        path_all = os.path.join(tmp, 'all.tsv')
+        write_tsv(path_all, docs)
+        size = -(-len(docs) // args.shards)
+        paths = []
+        for i in range(args.shards):
+            paths.append(os.path.join(tmp, 'part_{:03d}.tsv'.format(i)))
+            write_tsv(paths[-1], docs[i * size:(i + 1) * size])
+        config_tn = {'pos_filter': [['名詞', '一般', '*']], 'is_normalized': True, 'is_org': True, 'is_pos': False}
+
+        start = time.perf_counter()
+        m = ToolsNLP.MecabWrapper()
+        texts = m.tokenize_stream((record[1] for record in corpus.read_tsv(path_all)), workers=args.workers, is_list=True, **config_tn)
+        token_file = corpus.TokenFile.write(os.path.join(tmp, 'tokens.txt'), texts)
+        dictionary, _, _ = corpus.build_corpus_stream(token_file, os.path.join(tmp, 'corpus.mm'))
+        results = [('stream', time.perf_counter() - start)]
+        expected = dictionary_counts(dictionary)
+
+        cache_dir = os.path.join(tmp, 'cache')
+        for name in ('shards', 'cached', 'changed'):
+            if name == 'changed':
+                with open(paths[0], 'a', encoding='utf-8') as f:
+                    f.write('changed\t追加のドキュメント\n')
+            start = time.perf_counter()
+            shards = shard_corpus.tokenize_shards(paths, cache_dir, config_tn=config_tn, workers=args.workers)
+            dictionary, _, _ = shard_corpus.build_corpus_shards(shards, workers=args.workers)
+            results.append((name, time.perf_counter() - start))
+            if name != 'changed':
+                assert dictionary_counts(dictionary) == expected
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print('docs: {:,}  shards: {}  workers: {}'.format(args.docs, args.shards, args.workers or os.cpu_count()))
+    for name, sec in results:
+        print('{:<8}{:>8.2f} sec'.format(name, sec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+'''
+類似ドキュメントの検索（similarity.SimilarityIndex）のレイテンシを計測する
+トピックモデルのドキュメント×トピックのスコアと同じく、ドキュメントごとに少数のトピックだけにスコアを持つ疎行列を合成する
+    pandas：ドキュメント×トピックのデータフレーム（_df_docweight）で全件のコサイン類似度を計算してnlargestで選ぶ（変更前の方法）
+    exact：SimilarityIndex(mode='exact')
+    approximate：SimilarityIndex(mode='approximate')。exactの結果に対する再現率（recall@k）も計算する
+
+    $ cd benchmarks && python3 bench_similarity.py --docs 1000000 --topics 100
+'''
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from ToolsNLP.similarity import SimilarityIndex
+
+
+def make_doc_topic(n_docs, n_topics, max_topics, seed):
+    # ドキュメントごとに1〜max_topics個のトピックを選び、スコアの合計を1にする
+    rnd = np.random.RandomState(seed)
+    lengths = rnd.randint(1, max_topics + 1, size=n_docs)
+    # トピックの出現頻度には偏りをつける
+    popularity = rnd.dirichlet(np.full(n_topics, 0.5))
+    indices = rnd.choice(n_topics, size=lengths.sum(), p=popularity)
+    data = rnd.gamma(0.5, size=lengths.sum()) + 0.01
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    doc_topic = scipy.sparse.csr_matrix((data, indices, indptr), shape=(n_docs, n_topics))
+    doc_topic.sum_duplicates()
+    return scipy.sparse.diags(1 / np.asarray(doc_topic.sum(axis=1)).reshape(-1)) @ doc_topic
+
+
+def measure(func, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(func(q))
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=1000000)
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--max-topics', type=int, default=5, help='ドキュメントごとのスコアを持つトピック数の上限')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-probe', type=int, default=3)
+    parser.add_argument('--pandas-docs', type=int, default=200000, help='pandasで検索するドキュメント数（全件は密行列のメモリが大きい）')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    doc_topic = make_doc_topic(args.docs, args.topics, args.max_topics, args.seed)
+    queries = np.random.RandomState(args.seed + 1).choice(args.docs, size=args.queries, replace=False)
+    print('docs: {:,}  topics: {}  nnz: {:,}  k: {}'.format(args.docs, args.topics, doc_topic.nnz, args.k))
+    print('{:<14}{:>12}{:>10}{:>10}{:>10}'.format('mode', 'build sec', 'p50 ms', 'p99 ms', 'recall'))
+
+    n = min(args.pandas_docs, args.docs)
+    df = pd.DataFrame(doc_topic[:n].toarray())
+    start = time.perf_counter()
+    norms = np.sqrt((df ** 2).sum(axis=1))
+    build_sec = time.perf_counter() - start
+    def pandas_search(q):
+        score = df.dot(df.iloc[q]) / norms / norms[q]
+        return score.drop(q).nlargest(args.k).index.values
+    p50, p99, _ = measure(pandas_search, queries[queries < n][:20])
+    print('{:<14}{:>12.2f}{:>10.2f}{:>10.2f}{:>10}'.format('pandas({:,})'.format(n) if n < args.docs else 'pandas', build_sec, p50, p99, '-'))
+    del df
+
+    start = time.perf_counter()
+    index = SimilarityIndex(doc_topic, n_probe=args.n_probe)
+    build_sec = time.perf_counter() - start
+    exact = None
+    for mode in ('exact', 'approximate'):
+        p50, p99, results = measure(lambda q: index.search(doc_topic[q], k=args.k, exclude=[q], mode=mode)[0][0], queries)
+        if exact is None:
+            exact = results
+            recall = 1.0
+        else:
+            recall = np.mean([len(set(r) & set(e)) / args.k for r, e in zip(results, exact)])
+        print('{:<14}{:>12.2f}{:>10.2f}{:>10.2f}{:>10.3f}'.format(mode, build_sec, p50, p99, recall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+'''
+import ToolsNLP とMecabWrapperのコンストラクタの時間を計測する
+importは毎回新しいプロセスで計測する
+
+    $ cd benchmarks && python3 bench_startup.py --repeat 5
+'''
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+IMPORT_CASES = [
+    ('import ToolsNLP', 'import ToolsNLP'),
+    ('MecabWrapper', 'from ToolsNLP import MecabWrapper'),
+    ('TopicModelWrapper', 'from ToolsNLP import TopicModelWrapper'),
+]
+
+
+def bench_import(statement, repeat):
+    code = 'import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)'.format(statement)
+    return [float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(repeat)]
+
+
+def bench_constructor(kwargs, repeat):
+    import ToolsNLP
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ToolsNLP.MecabWrapper(**kwargs)
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+def report(name, elapsed):
+    print('{:<40}median {:>8.1f} ms  min {:>8.1f} ms  max {:>8.1f} ms'.format(
+        name, statistics.median(elapsed) * 1000, min(elapsed) * 1000, max(elapsed) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dicttype', default='ipadic')
+    parser.add_argument('--lexicon', default='')
+    args = parser.parse_args()
+
+    for name, statement in IMPORT_CASES:
+        report(name, bench_import(statement, args.repeat))
+    constructor_cases = [('MecabWrapper()', {'dicttype': args.dicttype})]
+    if args.lexicon:
+        constructor_cases.append(('MecabWrapper(lexicon)', {'dicttype': args.dicttype, 'lexicon': args.lexicon}))
+    for name, kwargs in constructor_cases:
+        elapsed = bench_constructor(kwargs, args.repeat)
+        report(name + ' first', elapsed[:1])
+        report(name + ' next', elapsed[1:] or elapsed)
+
+
+if __name__ == '__main__':
+    main()
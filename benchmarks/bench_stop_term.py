@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+コーパス作成（ストップタームの除外・辞書・BoW）の処理時間を計測する
+MeCabは使わず、Zipf分布に従う合成コーパスで比較する
+
+    $ cd benchmarks && python3 bench_stop_term.py --docs 100000 --doc-len 80 --vocab 50000
+'''
+
+import argparse
+import re
+import time
+from collections import Counter
+
+import gensim
+import numpy as np
+
+from ToolsNLP import corpus
+
+
+def make_texts(n_docs, doc_len, n_vocab, seed=0):
+    '''Zipf分布の単語頻度を持つ合成コーパス（1文字のひらがな・カタカナ・英数字を含む）'''
+    rnd = np.random.RandomState(seed)
+    short = [chr(c) for c in range(ord('ぁ'), ord('ん') + 1)] + list('abcxyz0123456789')
+    vocab = np.array(short + ['単語{}'.format(i) for i in range(n_vocab - len(short))], dtype=object)
+    rnd.shuffle(vocab)
+    weights = 1.0 / np.arange(1, n_vocab + 1)
+    ids = rnd.choice(n_vocab, size=n_docs * doc_len, p=weights / weights.sum())
+    return [vocab[ids[i:i + doc_len]].tolist() for i in range(0, n_docs * doc_len, doc_len)]
+
+
+def legacy(texts, limitcnt):
+    '''変更前の処理（出現ごとに正規表現で判定し、フィルタ後のリストから辞書を作成する）'''
+    r = re.compile('^[ぁ-んァ-ン0-9a-zA-Z]$')
+    count = Counter(w for doc in texts for w in doc)
+    texts = [[w for w in doc if count[w] >= limitcnt and not re.match(r, w)] for doc in texts]
+    dictionary = gensim.corpora.Dictionary(texts)
+    return dictionary, [dictionary.doc2bow(text) for text in texts], texts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--doc-len', type=int, default=80)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--limitcnt', type=int, default=3)
+    args = parser.parse_args()
+
+    texts = make_texts(args.docs, args.doc_len, args.vocab)
+    n_tokens = args.docs * args.doc_len
+    print('docs={:,} tokens={:,} vocab={:,}'.format(args.docs, n_tokens, args.vocab))
+
+    cases = [
+        ('legacy', lambda: legacy(texts, args.limitcnt)),
+        ('build_corpus', lambda: corpus.build_corpus(texts, limitcnt=args.limitcnt, toprate=0)),
+        ('build_corpus toprate=0.05', lambda: corpus.build_corpus(texts, limitcnt=args.limitcnt, toprate=0.05)),
+    ]
+    for name, func in cases:
+        start = time.perf_counter()
+        dictionary, bows, _ = func()
+        elapsed = time.perf_counter() - start
+        print('{:<28} {:>8.2f} sec {:>12,.0f} tokens/sec  terms={:,}'.format(name, elapsed, n_tokens / elapsed, len(dictionary)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+'''
+形態素解析・センチメント分析・トピックモデルの各処理を、生成したコーパスで計測してJSONに出力する
+前回の結果（--baseline）と比較して、処理時間の変化を表示する
+
+    $ cd benchmarks && python3 bench_suite.py --docs 2000 --output base.json
+    $ cd benchmarks && python3 bench_suite.py --docs 2000 --output new.json --baseline base.json
+    $ cd benchmarks && python3 bench_suite.py --current new.json --baseline base.json   # 計測せずに比較だけする
+
+--fake-tagger を指定するとMeCabの代わりにfake_mecab（bench_corpusの語彙で最長一致するTagger）を使う
+MeCabのない環境でも形態素解析以外（後処理・コーパス作成・学習・レポート）の変化を計測できる
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_MECAB_DIR = os.path.join(BENCH_DIR, 'fake_mecab')
+
+from bench_corpus import make_corpus
+
+
+POS_FILTER = [['名詞', '一般', '*'], ['名詞', '固有名詞', '一般'], ['名詞', '固有名詞', '人名'], ['動詞', '自立', '*'], ['形容詞', '自立', '*']]
+
+
+def timed(func, repeat):
+    '''funcをrepeat回実行し、最短の時間と最後の戻り値を返す'''
+    elapsed, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), result
+
+
+def bench_import(statement, repeat, env):
+    code = 'import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)'.format(statement)
+    elapsed = [float(subprocess.check_output([sys.executable, '-c', code], env=env)) for _ in range(repeat)]
+    return {'sec': statistics.median(elapsed)}
+
+
+def bench_tokenize(m, texts, repeat, **kwargs):
+    sec, tokens = timed(lambda: sum(len(m.tokenize(sentence=text, is_list=True, **kwargs)) for text in texts), repeat)
+    return {'sec': sec, 'docs': len(texts), 'tokens': tokens}
+
+
+def bench_topic_model(data, repeat, num_topics):
+    import ToolsNLP
+    stages = {}
+    for _ in range(repeat):
+        collected = []
+        t = ToolsNLP.TopicModelWrapper(data=data, num_topics=num_topics, iterations=50, config_tn={'pos_filter': POS_FILTER}, callbacks=[collected.append])
+        for stats in collected:
+            if stats.stage not in stages or stats.wall_sec < stages[stats.stage]['sec']:
+                stages[stats.stage] = {'sec': stats.wall_sec, 'docs': stats.docs, 'tokens': stats.tokens}
+    return t, stages
+
+
+def run(args):
+    env = dict(os.environ)
+    if args.fake_tagger:
+        env['PYTHONPATH'] = os.pathsep.join([FAKE_MECAB_DIR, BENCH_DIR] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    data = make_corpus(args.docs, args.seed)
+    texts = [text for _, text in data]
+    results = {}
+
+    def record(name, func):
+        if args.cases and not any(name.startswith(case) for case in args.cases):
+            return
+        try:
+            result = func()
+        except Exception as e:
+            results[name] = {'error': repr(e)}
+            print('{:<32} ERROR {!r}'.format(name, e))
+            return
+        for key in ('docs', 'tokens'):
+            if result.get(key) is not None and result['sec'] > 0:
+                result[key + '_per_sec'] = result[key] / result['sec']
+        results[name] = result
+        print('{:<32} {:>10.4f} sec{}'.format(name, result['sec']
+            ,''.join('  {:>12,.0f} {}'.format(result[key], key) for key in ('docs_per_sec', 'tokens_per_sec') if key in result)))
+
+    record('import/ToolsNLP', lambda: bench_import('import ToolsNLP', args.repeat, env))
+    record('import/TopicModelWrapper', lambda: bench_import('from ToolsNLP import TopicModelWrapper', args.repeat, env))
+
+    import ToolsNLP
+    fd, stopword = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write('さん\nの\n天気\n')
+    try:
+        record('constructor/MecabWrapper', lambda: {'sec': timed(lambda: ToolsNLP.MecabWrapper(), args.repeat)[0]})
+        record('constructor/MecabWrapper_stopword', lambda: {'sec': timed(lambda: ToolsNLP.MecabWrapper(stopword=stopword), args.repeat)[0]})
+        m = ToolsNLP.MecabWrapper()
+        m_stopword = ToolsNLP.MecabWrapper(stopword=stopword)
+        record('tokenize/plain', lambda: bench_tokenize(m, texts, args.repeat))
+        record('tokenize/no_normalize', lambda: bench_tokenize(m, texts, args.repeat, is_normalized=False))
+        record('tokenize/pos_filter', lambda: bench_tokenize(m, texts, args.repeat, pos_filter=POS_FILTER))
+        record('tokenize/stopword', lambda: bench_tokenize(m_stopword, texts, args.repeat, pos_filter=POS_FILTER))
+        record('tokenize/pos', lambda: bench_tokenize(m, texts, args.repeat, pos_filter=POS_FILTER, is_pos=True))
+        sentiment_texts = texts[:args.sentiment_docs]
+        record('sentiment/tokenize_sentiment', lambda: dict(zip(('sec', 'docs'), (timed(lambda: [m.tokenize_sentiment(text) for text in sentiment_texts], args.repeat)[0], len(sentiment_texts)))))
+    finally:
+        os.remove(stopword)
+
+    if not args.cases or any(case.startswith('topic') for case in args.cases):
+        try:
+            t, stages = bench_topic_model(data, args.repeat, args.num_topics)
+        except Exception as e:
+            t, stages = None, {}
+            results['topic/model'] = {'error': repr(e)}
+            print('{:<32} ERROR {!r}'.format('topic/model', e))
+        for stage, result in stages.items():
+            record('topic/' + stage, lambda: result)
+        if t is not None:
+            from ToolsNLP import corpus
+            record('topic/build_corpus', lambda: dict(zip(('sec', 'docs'), (timed(lambda: corpus.build_corpus(t._texts), args.repeat)[0], len(data)))))
+            record('topic/report_topdoc', lambda: {'sec': timed(lambda: t.get_topic2topdoc_list(topic_count=args.num_topics), args.repeat)[0]})
+            record('topic/transform', lambda: {'sec': timed(lambda: t.transform(texts[:args.sentiment_docs]), args.repeat)[0], 'docs': len(texts[:args.sentiment_docs])})
+    return results
+
+
+def meta(args):
+    versions = {}
+    for name in ('numpy', 'scipy', 'pandas', 'gensim', 'neologdn', 'MeCab'):
+        try:
+            module = __import__(name)
+            versions[name] = getattr(module, '__version__', getattr(module, 'VERSION', ''))
+        except ImportError:
+            versions[name] = None
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version()
+            ,'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': versions
+            ,'docs': args.docs, 'seed': args.seed, 'repeat': args.repeat, 'num_topics': args.num_topics, 'fake_tagger': args.fake_tagger}
+
+
+def compare(baseline, current, threshold):
+    '''処理時間の比（current / baseline）を表示し、threshold以上遅くなったケースの数を返す'''
+    for key in ('docs', 'seed', 'fake_tagger', 'num_topics'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print('WARNING: {} differs (baseline={}, current={})'.format(key, baseline['meta'].get(key), current['meta'].get(key)))
+    print('{:<32} {:>12} {:>12} {:>8}'.format('case', 'baseline', 'current', 'change'))
+    regressions = 0
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        base, curr = baseline['results'].get(name, {}), current['results'].get(name, {})
+        if 'sec' not in base or 'sec' not in curr:
+            print('{:<32} {:>12} {:>12}'.format(name, 'sec' in base and '{:.4f}'.format(base['sec']) or '-', 'sec' in curr and '{:.4f}'.format(curr['sec']) or '-'))
+            continue
+        change = curr['sec'] / base['sec'] - 1 if base['sec'] > 0 else 0.0
+        mark = ''
+        if change >= threshold:
+            mark, regressions = 'SLOWER', regressions + 1
+        elif change <= -threshold:
+            mark = 'faster'
+        print('{:<32} {:>12.4f} {:>12.4f} {:>+7.1%} {}'.format(name, base['sec'], curr['sec'], change, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--num-topics', type=int, default=20)
+    parser.add_argument('--sentiment-docs', type=int, default=500)
+    parser.add_argument('--cases', nargs='*', help='計測するケースの接頭辞（例: tokenize topic）')
+    parser.add_argument('--fake-tagger', action='store_true')
+    parser.add_argument('--output', default='')
+    parser.add_argument('--baseline', default='')
+    parser.add_argument('--current', default='', help='計測せずにこのJSONをbaselineと比較する')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+    if args.fake_tagger:
+        # MeCab（とToolsNLP）をimportする前に追加する
+        sys.path.insert(0, FAKE_MECAB_DIR)
+
+    if args.current:
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+    else:
+        current = {'meta': meta(args), 'results': run(args)}
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''
+MecabWrapper.sharedのインスタンスを複数スレッドから呼び出したときのスループット（docs/sec）を
+スレッド数ごとに計測する
+
+    $ cd benchmarks && python3 bench_threads.py --threads 1 2 4 8 --docs 20000
+'''
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ToolsNLP
+from bench_tokenize import SENTENCES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dicttype', default='ipadic')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--method', default='tokenize', choices=['tokenize', 'tokenize_sentiment'])
+    args = parser.parse_args()
+
+    m = ToolsNLP.MecabWrapper.shared(dicttype=args.dicttype)
+    texts = (SENTENCES * (args.docs // len(SENTENCES) + 1))[:args.docs]
+    func = getattr(m, args.method)
+    for threads in args.threads:
+        with ThreadPoolExecutor(threads) as executor:
+            # create the per-thread taggers before timing
+            list(executor.map(func, texts[:threads * 4]))
+            start = time.perf_counter()
+            list(executor.map(func, texts, chunksize=64))
+            elapsed = time.perf_counter() - start
+        print('{:<12}threads={:<4}{:>10,.0f} docs/sec'.format(args.method, threads, len(texts) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+'''
+形態素解析結果の保持に使うメモリ（termの文字列のリスト と TokenStore）と、build_corpusの処理時間を比較する
+MeCabは使わず、bench_stop_termと同じZipf分布の合成コーパスを使う
+形態素解析の結果と同じく、トークンごとに別の文字列オブジェクトを作る
+
+    $ cd benchmarks && python3 bench_token_store.py --docs 100000 --doc-len 80 --vocab 50000
+'''
+
+import argparse
+import time
+import tracemalloc
+
+from ToolsNLP import corpus
+from ToolsNLP.token_store import TokenStore
+
+from bench_stop_term import make_texts
+
+
+def tokenized(texts, is_pos):
+    # MeCabの出力から切り出した文字列と同じく、トークンごとに新しい文字列を作る
+    # （w + ''はwそのものを返すので、1文字足してから切り出す）
+    suffix = ':名詞-一般-*' if is_pos else ' '
+    end = None if is_pos else -1
+    for doc in texts:
+        yield [(w + suffix)[:end] for w in doc]
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    sec = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size / 1024 / 1024, sec
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--doc-len', type=int, default=80)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--pos', action='store_true', help='品詞つき（is_pos=True）のtermで比較する')
+    args = parser.parse_args()
+
+    texts = make_texts(args.docs, args.doc_len, args.vocab)
+    docs, list_mb, list_sec = measure(lambda: list(tokenized(texts, args.pos)))
+    store = TokenStore(is_pos=args.pos)
+    _, store_mb, store_sec = measure(lambda: store.extend(tokenized(texts, args.pos)))
+    print('tokens: {:,}  vocabulary: {:,}'.format(store.n_tokens, len(store.vocabulary)))
+    print('list of str : {:8.1f} MB  ({:.2f} sec)'.format(list_mb, list_sec))
+    print('TokenStore  : {:8.1f} MB  ({:.2f} sec, arrays {:.1f} MB)'.format(store_mb, store_sec, store.nbytes / 1024 / 1024))
+
+    start = time.perf_counter()
+    result_list = corpus.build_corpus(docs)
+    list_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    result_store = corpus.build_corpus(store)
+    store_sec = time.perf_counter() - start
+    assert result_list[0].token2id == result_store[0].token2id and result_list[1] == result_store[1]
+    print('build_corpus: list {:.2f} sec, TokenStore {:.2f} sec'.format(list_sec, store_sec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+MecabWrapper.tokenize のスループット（tokens/sec）を計測する
+
+    $ cd benchmarks && python3 bench_tokenize.py --dicttype ipadic --repeat 2000
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import ToolsNLP
+
+
+SENTENCES = [
+    '稲垣吾郎さん、草彅剛さん、香取慎吾さんの3人によるレギュラー番組 『7.2 新しい別の窓』や『オオカミくんには騙されない』',
+    'この2人のやりとりはやっぱり面白い！観てて飽きない！',
+    '東京都内の天気は晴れのち曇りで、夕方からは雨が降る見込みです。',
+    '新しいスマートフォンのカメラは暗い場所でもきれいな写真が撮れると評判だ。',
+    '昨日の試合では監督の采配が見事に当たり、チームは逆転勝利を収めた。',
+    '駅前に新しくできたラーメン屋は行列ができるほどの人気で、味も悪くない。',
+]
+
+POS_FILTER = [['名詞', '一般', '*'], ['名詞', '固有名詞', '一般'], ['名詞', '固有名詞', '人名'], ['動詞', '自立', '*'], ['形容詞', '自立', '*']]
+
+
+def make_stopword(n_words):
+    '''ダミーのストップワードファイルを作成する'''
+    rnd = random.Random(0)
+    chars = [chr(c) for c in range(ord('ぁ'), ord('ん') + 1)]
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write('さん\nの\n')
+        for _ in range(n_words):
+            f.write(''.join(rnd.choice(chars) for _ in range(4)) + '\n')
+    return path
+
+
+def bench(m, repeat, **kwargs):
+    texts = SENTENCES * repeat
+    tokens = 0
+    start = time.perf_counter()
+    for text in texts:
+        tokens += len(m.tokenize(sentence=text, is_list=True, **kwargs))
+    elapsed = time.perf_counter() - start
+    return tokens, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dicttype', default='ipadic')
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--stopword-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    stopword = make_stopword(args.stopword_size)
+    try:
+        cases = [
+            ('default', ToolsNLP.MecabWrapper(dicttype=args.dicttype), {}),
+            ('pos_filter', ToolsNLP.MecabWrapper(dicttype=args.dicttype), {'pos_filter': POS_FILTER}),
+            ('stopword', ToolsNLP.MecabWrapper(dicttype=args.dicttype, stopword=stopword), {}),
+            ('pos_filter+stopword+is_pos', ToolsNLP.MecabWrapper(dicttype=args.dicttype, stopword=stopword), {'pos_filter': POS_FILTER, 'is_pos': True}),
+            ('not normalized', ToolsNLP.MecabWrapper(dicttype=args.dicttype), {'is_normalized': False}),
+        ]
+        for name, m, kwargs in cases:
+            tokens, elapsed = bench(m, args.repeat, **kwargs)
+            print('{:<28}{:>10,} tokens {:>8.3f} sec {:>12,.0f} tokens/sec'.format(name, tokens, elapsed, tokens / elapsed))
+    finally:
+        os.remove(stopword)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+'''
+MeCabを使わずにToolsNLPの形態素解析以外の処理を計測するための代替モジュール
+bench_corpus.LEXICONの語彙で最長一致し、ipadicと同じ形式（表層形\\t品詞,...,原形,読み,発音）で出力する
+辞書にない文字は1文字ずつ記号（数字は名詞,数）にする
+
+bench_suite.py --fake-tagger でこのディレクトリをsys.path（とPYTHONPATH）の先頭に追加して使う
+'''
+
+from bench_corpus import LEXICON
+
+
+VERSION = 'fake'
+_MAX_LEN = max(len(w) for w in LEXICON)
+
+
+class Tagger:
+    def __init__(self, args=''):
+        self._args = args
+
+    def parse(self, sentence):
+        lines = []
+        i, n = 0, len(sentence)
+        while i < n:
+            for size in range(min(_MAX_LEN, n - i), 0, -1):
+                entry = LEXICON.get(sentence[i:i + size])
+                if entry is not None:
+                    surface, pos, pos1, pos2, base = entry
+                    lines.append('{}\t{},{},{},*,*,*,{},*,*'.format(surface, pos, pos1, pos2, base))
+                    i += size
+                    break
+            else:
+                c = sentence[i]
+                i += 1
+                # MeCabと同じく空白は出力しない
+                if c.isspace():
+                    continue
+                pos = '名詞,数' if c.isdigit() else '記号,一般'
+                lines.append('{}\t{},*,*,*,*,{},*,*'.format(c, pos, c))
+        lines.append('EOS')
+        return '\n'.join(lines) + '\n'
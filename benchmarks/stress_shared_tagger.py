@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+MecabWrapper.sharedのインスタンスを複数スレッドから同時に呼び出し、
+逐次実行の結果と一致することを確認する（不一致・例外があれば終了コード1）
+
+    $ cd benchmarks && python3 stress_shared_tagger.py --threads 16 --iterations 2000
+'''
+
+import argparse
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ToolsNLP
+from bench_tokenize import SENTENCES, POS_FILTER
+
+
+def make_tasks(texts, iterations, seed):
+    rnd = random.Random(seed)
+    options = [
+        ('tokenize', {}),
+        ('tokenize', {'pos_filter': POS_FILTER, 'is_pos': True, 'is_list': True}),
+        ('tokenize', {'is_normalized': False, 'is_org': False}),
+        ('tokenize_sentiment', {'is_term': True}),
+        ('tokenize_sentiment', {}),
+    ]
+    return [(rnd.choice(texts),) + rnd.choice(options) for _ in range(iterations)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dicttype', default='ipadic')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--cache-size', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    m = ToolsNLP.MecabWrapper.shared(dicttype=args.dicttype, cache_size=args.cache_size)
+    texts = SENTENCES + [a + b for a in SENTENCES for b in SENTENCES]
+    tasks = make_tasks(texts, args.iterations, args.seed)
+
+    # expected results from a separate instance on the main thread
+    reference = ToolsNLP.MecabWrapper(dicttype=args.dicttype)
+    expected = {}
+    for text, method, kwargs in tasks:
+        key = (text, method, repr(sorted(kwargs.items())))
+        if key not in expected:
+            expected[key] = getattr(reference, method)(text, **kwargs)
+
+    barrier = threading.Barrier(args.threads)
+    def run(chunk):
+        barrier.wait()
+        errors = 0
+        for text, method, kwargs in chunk:
+            if getattr(m, method)(text, **kwargs) != expected[(text, method, repr(sorted(kwargs.items())))]:
+                errors += 1
+        return errors
+
+    chunks = [tasks[i::args.threads] for i in range(args.threads)]
+    with ThreadPoolExecutor(args.threads) as executor:
+        errors = sum(executor.map(run, chunks))
+    shared = ToolsNLP.MecabWrapper.shared(dicttype=args.dicttype, cache_size=args.cache_size)
+    print('threads={} calls={} mismatches={} shared instance reused={}'.format(args.threads, len(tasks), errors, shared is m))
+    if m.cache_info():
+        print(m.cache_info())
+    return 1 if errors or shared is not m else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,7 +20,7 @@ setup(
     long_description=readme,
     author='9en',
     author_email='mty.0613@gmail.com',
-    python_requires='>=3.4',
+    python_requires='>=3.7',
     install_requires=['numpy','neologdn','scipy', 'mecab-python3', 'gensim', 'matplotlib', 'wordcloud', 'pandas'],
     url='https://github.com/9en/ToolsNLP',
     license=license,
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+import io
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+
+def _has_mecab():
+    # MeCabと辞書が使えない環境では、形態素解析を使うテストをスキップする
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            import MeCab
+            MeCab.Tagger('').parse('テスト')
+        return True
+    except Exception:
+        return False
+
+requires_mecab = unittest.skipUnless(_has_mecab(), 'MeCab or its dictionary is not available')
+
+
+# トピックモデル・コーパスのテスト用のドキュメント（8文の組み合わせなので、同じ文章のドキュメントを含む）
+SENTENCES = ['東京の天気は晴れ、大阪の天気は雨でした'
+            ,'この2人のやりとりはやっぱり面白い！観てて飽きない！'
+            ,'つまらない映画だったので途中で帰った'
+            ,'友人代表のスピーチ、独女はどうこなしている？'
+            ,'新しいスマートフォンの発売日が発表された'
+            ,'サッカー日本代表が試合に勝利した'
+            ,'株価が大きく下落し、市場に不安が広がった'
+            ,'週末は家族で映画を観に行く予定です'
+            ]
+DATA = [['http://example.com/{}'.format(i), '{}。{}'.format(SENTENCES[i % len(SENTENCES)], SENTENCES[i * 3 % len(SENTENCES)])]
+        for i in range(60)]
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import os
 import doctest
+import unittest
 import ToolsNLP
 
 if __name__ == "__main__":
     doctest.testmod(ToolsNLP.mecab_wrapper, verbose=True)
     doctest.testmod(ToolsNLP.topic_model, verbose=True)
+    # test_*.py（スレッドセーフ・並列処理と逐次処理の結果の一致など）
+    # MeCabと辞書が使えない環境では、形態素解析を使うテストはスキップする（tests.requires_mecab）
+    path_tests = os.path.dirname(os.path.abspath(__file__))
+    tests = unittest.defaultTestLoader.discover(path_tests, pattern='test_*.py', top_level_dir=os.path.dirname(path_tests))
+    unittest.TextTestRunner(verbosity=2).run(tests)
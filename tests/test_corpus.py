@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import unittest
+import numpy as np
+import ToolsNLP
+from ToolsNLP import corpus, dedup, shard_corpus
+from ToolsNLP.similarity import SimilarityIndex
+from ToolsNLP.token_store import TokenStore
+from tests import DATA, requires_mecab
+
+
+TEXTS = [['東京', 'の', '天気', 'は', '晴れ'], ['大阪', 'の', '株価', 'が', '下落'], ['映画', 'を', '観る'], ['東京', 'の', '天気', 'は', '晴れ'], []] * 10
+
+
+def dictionary_counts(dictionary):
+    return {w: (dictionary.cfs[i], dictionary.dfs[i]) for w, i in dictionary.token2id.items()}
+
+
+class TestTokenStore(unittest.TestCase):
+    def test_same_as_list(self):
+        store = TokenStore()
+        store.extend(TEXTS)
+        self.assertEqual(list(store), TEXTS)
+        self.assertEqual(store.n_tokens, sum(len(doc) for doc in TEXTS))
+        d_list, bows_list, texts_list = corpus.build_corpus(TEXTS, limitcnt=1, toprate=0)
+        d_store, bows_store, texts_store = corpus.build_corpus(store, limitcnt=1, toprate=0)
+        self.assertEqual(dictionary_counts(d_store), dictionary_counts(d_list))
+        self.assertEqual(bows_store, bows_list)
+        self.assertEqual(list(texts_store), texts_list)
+
+    def test_subset(self):
+        store = TokenStore()
+        store.extend(TEXTS)
+        mask = np.arange(len(TEXTS)) % 3 == 0
+        self.assertEqual(list(store.subset(mask)), [doc for doc, m in zip(TEXTS, mask) if m])
+
+
+class TestDedup(unittest.TestCase):
+    def test_find_duplicates(self):
+        representative = dedup.find_duplicates(TEXTS)
+        self.assertEqual(representative[:5].tolist(), [0, 1, 2, 0, 4])
+        # 2つ目以降の繰り返しは最初のドキュメントが代表（空のドキュメントは重複としない）
+        self.assertEqual(representative[5:10].tolist(), [0, 1, 2, 0, 9])
+
+    def test_token_store(self):
+        store = TokenStore()
+        store.extend(TEXTS)
+        np.testing.assert_array_equal(dedup.find_duplicates(store), dedup.find_duplicates(TEXTS))
+
+    def test_short_document(self):
+        # shingle_sizeより短いドキュメントも比較できる
+        self.assertEqual(dedup.find_duplicates([['東京'], ['大阪'], ['東京']]).tolist(), [0, 1, 0])
+
+    def test_transitive(self):
+        # A~B, B~Cの場合は、AとCの類似度がthreshold未満でも同じグループになる
+        a = [str(i) for i in range(100)]
+        b = ['b{}'.format(i) for i in range(3)] + a[3:]
+        c = b[:97] + ['c{}'.format(i) for i in range(3)]
+        self.assertEqual(dedup.find_duplicates([a, c], threshold=0.85, num_perm=128).tolist(), [0, 1])
+        self.assertEqual(dedup.find_duplicates([a, b, c], threshold=0.85, num_perm=128).tolist(), [0, 0, 0])
+
+
+@requires_mecab
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.sources = [DATA[:20], DATA[20:45], DATA[45:]]
+
+    def test_same_as_stream(self):
+        m = ToolsNLP.MecabWrapper()
+        token_file = corpus.TokenFile.write(os.path.join(self.cache_dir, 'tokens.txt'), m.tokenize_batch([text for _, text in DATA], workers=1, is_list=True))
+        expected, _, _ = corpus.build_corpus_stream(token_file, os.path.join(self.cache_dir, 'corpus.mm'), limitcnt=1)
+        for workers in (1, 2):
+            shards = shard_corpus.tokenize_shards(self.sources, self.cache_dir, workers=workers)
+            dictionary, bows, texts = shard_corpus.build_corpus_shards(shards, limitcnt=1, workers=workers)
+            self.assertEqual(dictionary_counts(dictionary), dictionary_counts(expected))
+            self.assertEqual(len(bows), len(DATA))
+            self.assertEqual(sum(shard.n_docs for shard in shards), len(DATA))
+        self.assertTrue(all(shard.is_cached for shard in shards))
+
+    def test_shards_type(self):
+        self.assertEqual(len(ToolsNLP.Shards(self.sources)), 3)
+        with self.assertRaises(TypeError):
+            ToolsNLP.Shards([1, 2])
+
+    def test_prune_cache(self):
+        shards = shard_corpus.tokenize_shards(self.sources, self.cache_dir, workers=1)
+        shard_corpus.build_corpus_shards(shards, limitcnt=1, workers=1)
+        # 使ったばかりのシャードは削除しない
+        self.assertEqual(shard_corpus.prune_cache(self.cache_dir, max_age=3600), [])
+        old = time.time() - 7200
+        for root, _, fnames in os.walk(os.path.join(self.cache_dir, 'shards')):
+            for fname in fnames:
+                os.utime(os.path.join(root, fname), (old, old))
+        removed = shard_corpus.prune_cache(self.cache_dir, keep=shards[:1], max_age=3600)
+        self.assertNotIn(shards[0].path, removed)
+        self.assertIn(shards[1].path, removed)
+        self.assertTrue(os.path.exists(os.path.join(shards[0].path, 'shard.json')))
+        self.assertFalse(os.path.exists(shards[1].path))
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.vectors = rnd.dirichlet(np.full(8, 0.3), size=200)
+
+    def test_exact(self):
+        index = SimilarityIndex(self.vectors)
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        docs, scores = index.search(self.vectors[:5], k=5, exclude=np.arange(5))
+        for i in range(5):
+            expected = normalized @ normalized[i]
+            expected[i] = -1
+            np.testing.assert_allclose(scores[i], np.sort(expected)[::-1][:5], atol=1e-5)
+            np.testing.assert_allclose(expected[docs[i]], scores[i], atol=1e-5)
+
+    def test_save_load(self):
+        index = SimilarityIndex(self.vectors, mode='approximate', n_probe=2)
+        path = tempfile.mkdtemp()
+        index.save(path)
+        loaded = SimilarityIndex.load(path)
+        self.assertEqual((loaded.mode, loaded.n_probe), ('approximate', 2))
+        for a, b in zip(index.search(self.vectors[:10], k=5), loaded.search(self.vectors[:10], k=5)):
+            np.testing.assert_array_equal(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import subprocess
+import tempfile
+import threading
+import unittest
+import ToolsNLP
+from ToolsNLP.sentiment_lexicon import compile_sentiment_lexicon
+from ToolsNLP.token_store import TokenStore
+from tests import requires_mecab
+
+
+TEXTS = ['この2人のやりとりはやっぱり面白い！観てて飽きない！'
+        ,'稲垣吾郎さん、草彅剛さん、香取慎吾さんの3人によるレギュラー番組'
+        ,'東京の天気は晴れ、大阪の天気は雨でした'
+        ,'つまらない映画だったので途中で帰った'
+        ,'友人代表のスピーチ、独女はどうこなしている？'
+        ] * 8
+
+
+@requires_mecab
+class TestShared(unittest.TestCase):
+    def test_same_config(self):
+        m = ToolsNLP.MecabWrapper.shared()
+        self.assertIs(m, ToolsNLP.MecabWrapper.shared(dicttype='ipadic'))
+        self.assertIs(m, ToolsNLP.MecabWrapper.shared(negation=[], cache_size=0))
+        self.assertIsNot(m, ToolsNLP.MecabWrapper.shared(cache_size=10))
+
+    def test_unknown_argument(self):
+        with self.assertRaises(TypeError):
+            ToolsNLP.MecabWrapper.shared(unknown=1)
+
+
+@requires_mecab
+class TestCache(unittest.TestCase):
+    def test_hit(self):
+        m = ToolsNLP.MecabWrapper(cache_size=100)
+        self.assertEqual(m.tokenize(TEXTS[0]), m.tokenize(TEXTS[0]))
+        info = m.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_invalidate(self):
+        m = ToolsNLP.MecabWrapper(cache_size=100)
+        before = m.tokenize(TEXTS[0])
+        m.stopword_list = m.stopword_list | {'面白い'}
+        self.assertIn('面白い', before.split(' '))
+        self.assertNotIn('面白い', m.tokenize(TEXTS[0]).split(' '))
+
+    def test_readonly(self):
+        # 直接書き換えるとキャッシュが無効化されないため、変更できない型で返す
+        m = ToolsNLP.MecabWrapper(cache_size=100)
+        with self.assertRaises(AttributeError):
+            m.stopword_list.add('面白い')
+        with self.assertRaises(TypeError):
+            m.sentiment_dict['映画'] = -1
+        m.stopword_list = ['面白い', '飽きる']
+        self.assertEqual(m.stopword_list, frozenset(['面白い', '飽きる']))
+
+    def test_disk(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+        expected = ToolsNLP.MecabWrapper(cache_size=100, cache_path=path).tokenize_sentiment(TEXTS[0], is_term=True)
+        m = ToolsNLP.MecabWrapper(cache_size=100, cache_path=path)
+        self.assertEqual(m.tokenize_sentiment(TEXTS[0], is_term=True), expected)
+        self.assertEqual(m.cache_info().disk_hits, 1)
+
+
+@requires_mecab
+class TestUserdict(unittest.TestCase):
+    def test_compile_error(self):
+        # mecab-dict-indexが見つからない場合は、元の例外を__cause__に残す
+        path = tempfile.mkdtemp()
+        userdict = os.path.join(path, 'userdict.csv')
+        with open(userdict, 'w', encoding='utf-8') as f:
+            f.write('テスト,,,1,名詞,一般,*,*,*,*,テスト,テスト,テスト\n')
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            ToolsNLP.MecabWrapper(userdict=userdict, libexecdir=path, userdict_cache_dir=path)
+        self.assertIsInstance(cm.exception.__cause__, OSError)
+        self.assertEqual([f for f in os.listdir(path) if f.endswith('.tmp')], [])
+
+
+@requires_mecab
+class TestThreadSafety(unittest.TestCase):
+    def test_tokenize_threads(self):
+        m = ToolsNLP.MecabWrapper.shared()
+        expected = [m.tokenize(text) for text in TEXTS]
+        results = {}
+        def run(i):
+            results[i] = [m.tokenize(text) for text in TEXTS]
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(4):
+            self.assertEqual(results[i], expected)
+
+
+@requires_mecab
+class TestTiming(unittest.TestCase):
+    def test_counts(self):
+        m = ToolsNLP.MecabWrapper()
+        with m.timing() as timer:
+            tokens = [m.tokenize(text, is_list=True) for text in TEXTS]
+        m.tokenize(TEXTS[0])
+        info = timer.info()
+        self.assertEqual(info.sentences, len(TEXTS))
+        self.assertEqual(info.tokens, sum(len(t) for t in tokens))
+        self.assertGreater(info.normalize_sec, 0)
+        self.assertGreater(info.parse_sec, 0)
+        self.assertGreater(info.post_sec, 0)
+        # is_normalized=Falseの場合は正規化しない（時間の計測だけ）
+        with m.timing() as timer:
+            m.tokenize(TEXTS[0], is_normalized=False)
+        self.assertEqual(timer.info().sentences, 1)
+        self.assertLess(timer.info().normalize_sec, timer.info().parse_sec)
+
+    def test_nested(self):
+        # 内側のwithブロックの処理は外側のタイマーに集計されない
+        m = ToolsNLP.MecabWrapper()
+        with m.timing() as outer:
+            m.tokenize(TEXTS[0])
+            with m.timing() as inner:
+                m.tokenize(TEXTS[1])
+                m.tokenize(TEXTS[2])
+            m.tokenize(TEXTS[3])
+        self.assertEqual((outer.info().sentences, inner.info().sentences), (2, 2))
+
+    def test_timing_per_thread(self):
+        # 他のスレッドの形態素解析はwithブロックのタイマーに集計されない
+        m = ToolsNLP.MecabWrapper.shared()
+        barrier = threading.Barrier(2)
+        def other():
+            barrier.wait()
+            for text in TEXTS:
+                m.tokenize(text)
+        thread = threading.Thread(target=other)
+        thread.start()
+        with m.timing() as timer:
+            barrier.wait()
+            for text in TEXTS[:10]:
+                m.tokenize(text)
+        thread.join()
+        self.assertEqual(timer.info().sentences, 10)
+
+
+@requires_mecab
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.m = ToolsNLP.MecabWrapper()
+        self.expected = [self.m.tokenize(text, is_list=True) for text in TEXTS]
+
+    def test_tokenize_batch(self):
+        for workers in (1, 2):
+            self.assertEqual(self.m.tokenize_batch(TEXTS, workers=workers, is_list=True), self.expected)
+
+    def test_setter_in_workers(self):
+        # setterで変更した設定はワーカープロセスにも反映する
+        self.m.stopword_list = {'面白い'}
+        self.m.negation = ['ない']
+        self.m.sentiment_dict = {'映画': -1}
+        self.assertEqual(self.m.tokenize_batch(TEXTS, workers=2), self.m.tokenize_batch(TEXTS, workers=1))
+        parallel = self.m.score_sentiment_batch(TEXTS, workers=2, is_detail=True)
+        serial = self.m.score_sentiment_batch(TEXTS, workers=1, is_detail=True)
+        for p, s in zip(parallel, serial):
+            self.assertTrue(p.equals(s))
+
+    def test_tokenize_stream(self):
+        for workers in (1, 2):
+            result = self.m.tokenize_stream(iter(TEXTS), workers=workers, batch_size=7, is_list=True)
+            self.assertEqual(list(result), self.expected)
+
+    def test_tokenize_store(self):
+        store = self.m.tokenize_store(TEXTS, workers=2)
+        self.assertIsInstance(store, TokenStore)
+        self.assertEqual(list(store), self.expected)
+
+
+@requires_mecab
+class TestSentimentLexicon(unittest.TestCase):
+    def test_compiled(self):
+        path = os.path.join(tempfile.mkdtemp(), 'pn.lex')
+        compile_sentiment_lexicon(path)
+        m = ToolsNLP.MecabWrapper()
+        m_lex = ToolsNLP.MecabWrapper(lexicon=path)
+        self.assertEqual(dict(m_lex.sentiment_dict), dict(m.sentiment_dict))
+        self.assertEqual(len(m_lex.default_dict), len(m.default_dict))
+        for text in TEXTS:
+            self.assertEqual(m_lex.tokenize_sentiment(text, is_term=True), m.tokenize_sentiment(text, is_term=True))
+
+
+@requires_mecab
+class TestAsyncMecabWrapper(unittest.TestCase):
+    def test_same_as_sync(self):
+        m = ToolsNLP.MecabWrapper()
+        async def run(executor):
+            async with ToolsNLP.AsyncMecabWrapper(workers=2, executor=executor) as am:
+                tokens = await asyncio.gather(*[am.tokenize_async(text, is_list=True) for text in TEXTS])
+                scores = await asyncio.gather(*[am.tokenize_sentiment_async(text) for text in TEXTS])
+                return tokens, scores
+        for executor in ('thread', 'process'):
+            tokens, scores = asyncio.run(run(executor))
+            self.assertEqual(tokens, [m.tokenize(text, is_list=True) for text in TEXTS])
+            self.assertEqual(scores, [m.tokenize_sentiment(text) for text in TEXTS])
+
+
+if __name__ == '__main__':
+    unittest.main()
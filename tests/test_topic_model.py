@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+import warnings
+import gensim
+import numpy as np
+import scipy.sparse
+import ToolsNLP
+from ToolsNLP.similarity import SimilarityIndex
+from tests import DATA, SENTENCES, requires_mecab
+
+
+def fit(data=DATA, **kwargs):
+    kwargs = dict(dict(num_topics=3, iterations=5, stop_term_limitcnt=1, stop_term_toprate=0), **kwargs)
+    return ToolsNLP.TopicModelWrapper(data, **kwargs)
+
+
+def assert_sparse_equal(a, b):
+    np.testing.assert_array_equal(a.toarray(), b.toarray())
+
+
+@requires_mecab
+class TestSaveLoad(unittest.TestCase):
+    def test_round_trip(self):
+        t = fit()
+        path = tempfile.mkdtemp()
+        t.save(path)
+        loaded = ToolsNLP.TopicModelWrapper.load(path, mmap=True)
+        assert_sparse_equal(loaded._doc_topic, t._doc_topic)
+        self.assertTrue(loaded._topic_df.equals(t._topic_df))
+        self.assertEqual(loaded._urls, t._urls)
+        # LDAの乱数の状態も保存されるので、保存後の最初の推定は同じ結果になる
+        np.testing.assert_allclose(loaded.transform(SENTENCES), t.transform(SENTENCES))
+
+    def test_overwrite(self):
+        # 重複除去したモデルの上に、重複除去しないモデルを保存しても前回のrepresentative.npyを読み込まない
+        path = tempfile.mkdtemp()
+        fit(dedup_threshold=0.9).save(path)
+        self.assertTrue(os.path.exists(os.path.join(path, 'representative.npy')))
+        t = fit(DATA[:40])
+        t.save(path)
+        self.assertFalse(os.path.exists(os.path.join(path, 'representative.npy')))
+        loaded = ToolsNLP.TopicModelWrapper.load(path)
+        self.assertIsNone(loaded._representative)
+        self.assertEqual(loaded._doc_topic.shape[0], 40)
+        self.assertEqual(len(loaded.get_duplicate_list()), 0)
+
+
+@requires_mecab
+class TestMostSimilar(unittest.TestCase):
+    def test_entry_id(self):
+        t = fit([[1000 + i, text] for i, (_, text) in enumerate(DATA)])
+        # intのentry_idは行番号ではなくentry_idとして検索する
+        self.assertTrue(t.most_similar(1005, k=3).equals(t.most_similar(row=5, k=3)))
+        self.assertTrue(t.most_similar(entry_id=1005, k=3).equals(t.most_similar(row=5, k=3)))
+        self.assertNotIn(5, t.most_similar(row=5, k=3).index)
+        with self.assertRaises(KeyError):
+            t.most_similar(5)
+        with self.assertRaises(ValueError):
+            t.most_similar(1005, row=5)
+
+    def test_save_update_save_load(self):
+        # updateで追加したドキュメントも、保存しなおしたモデルの検索結果に含まれる
+        path = tempfile.mkdtemp()
+        t = fit(DATA[:50])
+        t.most_similar(row=0)
+        t.save(path)
+        t = ToolsNLP.TopicModelWrapper.load(path)
+        t.update(DATA[50:52])
+        t.save(path)
+        loaded = ToolsNLP.TopicModelWrapper.load(path)
+        self.assertIsNone(loaded._similarity_index)
+        self.assertEqual(len(loaded.most_similar(row=0, k=60)), 51)
+        self.assertEqual(len(loaded._similarity_index), 52)
+        self.assertIn(51, loaded.most_similar(row=50, k=60).index)
+
+    def test_load_mismatched_index(self):
+        path = tempfile.mkdtemp()
+        fit(DATA[:20]).save(path)
+        SimilarityIndex(np.eye(3)).save(path)
+        with self.assertWarns(UserWarning):
+            loaded = ToolsNLP.TopicModelWrapper.load(path)
+        self.assertIsNone(loaded._similarity_index)
+
+
+# 追加分は辞書にない単語（野球・優勝など）を含む
+NEW_DATA = [['http://example.com/new/{}'.format(i), '野球チームが優勝した。野球ファンが優勝を喜んだ'] for i in range(4)]
+
+
+@requires_mecab
+class TestUpdate(unittest.TestCase):
+    def assert_updated(self, t, n_docs):
+        num_terms = len(t._dictionary)
+        self.assertNotIn('野球', t._dictionary.token2id)
+        t.update(NEW_DATA)
+        # 語彙の追加分だけLDAのパラメータを拡張する
+        self.assertIn('野球', t._dictionary.token2id)
+        self.assertGreater(len(t._dictionary), num_terms)
+        self.assertEqual(t._lda.num_terms, len(t._dictionary))
+        self.assertEqual(t._lda.state.sstats.shape, (3, len(t._dictionary)))
+        self.assertEqual(t._lda.get_topics().shape, (3, len(t._dictionary)))
+        # 既存のドキュメントのスコアは残したまま、追加分を追記する
+        self.assertEqual(t._doc_topic.shape, (n_docs + len(NEW_DATA), 3))
+        self.assertEqual(len(t._urls), n_docs + len(NEW_DATA))
+        # トピック別の記事数は重複グループの代表だけを数える
+        unique = np.arange(t._doc_topic.shape[0]) if t._representative is None else np.unique(t._representative)
+        self.assertEqual(t._topic_df['cnt'].sum(), t._doc_topic[unique].nnz)
+        if t._representative is not None:
+            self.assertEqual(len(t._representative), n_docs + len(NEW_DATA))
+            self.assertEqual(len(t.get_duplicate_list()), len(t._representative) - len(np.unique(t._representative)))
+        # 類似ドキュメントのインデックスは追加分を含めて作りなおす
+        self.assertEqual(len(t.most_similar(row=0, k=100)), n_docs + len(NEW_DATA) - 1)
+        self.assertEqual(len(t._similarity_index), n_docs + len(NEW_DATA))
+        self.assertLessEqual(set(range(n_docs + 1, n_docs + len(NEW_DATA))), set(t.most_similar(row=n_docs, k=100).index))
+        # 保存しなおしたモデルも同じ状態で読み込める
+        path = tempfile.mkdtemp()
+        t.save(path)
+        loaded = ToolsNLP.TopicModelWrapper.load(path, mmap=True)
+        assert_sparse_equal(loaded._doc_topic, t._doc_topic)
+        self.assertEqual(len(loaded._dictionary), len(t._dictionary))
+        self.assertEqual(len(loaded._similarity_index), n_docs + len(NEW_DATA))
+        return t
+
+    def test_list(self):
+        self.assert_updated(fit(), len(DATA))
+
+    def test_list_dedup(self):
+        self.assert_updated(fit(dedup_threshold=0.9), len(DATA))
+
+    def test_stream(self):
+        t = self.assert_updated(fit(corpus_dir=tempfile.mkdtemp()), len(DATA))
+        self.assertEqual(len(t._texts), len(DATA) + len(NEW_DATA))
+
+    def test_stream_dedup(self):
+        t = self.assert_updated(fit(corpus_dir=tempfile.mkdtemp(), dedup_threshold=0.9), len(DATA))
+        self.assertEqual(len(t._texts_cleansing), len(np.unique(t._representative)))
+
+    def test_shards(self):
+        t = fit(ToolsNLP.Shards([DATA[:20], DATA[20:40], DATA[40:]]), corpus_dir=tempfile.mkdtemp())
+        t = self.assert_updated(t, len(DATA))
+        self.assertEqual(len(t._texts), len(DATA) + len(NEW_DATA))
+        self.assertEqual(len(t._texts_cleansing), len(DATA) + len(NEW_DATA))
+
+    def test_mmap(self):
+        # 読み取り専用でメモリマップした配列も、コピーして更新する
+        path = tempfile.mkdtemp()
+        fit(dedup_threshold=0.9).save(path)
+        t = ToolsNLP.TopicModelWrapper.load(path, mmap=True)
+        t.most_similar(row=0)
+        self.assert_updated(t, len(DATA))
+
+    def test_no_new_terms(self):
+        t = fit()
+        num_terms = len(t._dictionary)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            t.update(NEW_DATA, max_new_terms=0)
+        self.assertEqual(len(t._dictionary), num_terms)
+        self.assertEqual(t._doc_topic.shape[0], len(DATA) + len(NEW_DATA))
+
+
+@requires_mecab
+class TestSearch(unittest.TestCase):
+    def search(self, **kwargs):
+        kwargs = dict(dict(num_topics_list=[2, 3, 4, 5, 6, 8], holdout_rate=0.2, iterations=5, stop_term_limitcnt=1, stop_term_toprate=0), **kwargs)
+        df, t = ToolsNLP.TopicModelWrapper.search(DATA, **kwargs)
+        return df, t, t.get_stage_stats().set_index('stage').loc['search', 'extra']
+
+    def test_workers(self):
+        # 並列に学習しても、候補ごとのスコアと選ばれるモデルは同じ
+        df_serial, t_serial, _ = self.search(search_workers=1)
+        df_parallel, t_parallel, _ = self.search(search_workers=2)
+        self.assertEqual(len(df_serial), 6)
+        np.testing.assert_allclose(df_parallel[['perplexity', 'coherence']].values, df_serial[['perplexity', 'coherence']].values)
+        self.assertEqual(t_parallel._num_topics, t_serial._num_topics)
+        assert_sparse_equal(t_parallel._doc_topic, t_serial._doc_topic)
+
+    def test_early_stopping(self):
+        # 打ち切った後の候補は投入しない（並列の場合もsearch_workers-1個まで）
+        df, _, extra = self.search(search_workers=1, patience=1)
+        self.assertLess(len(df), 6)
+        self.assertEqual(extra, {'candidates': 6, 'submitted': len(df), 'evaluated': len(df)})
+        df_parallel, _, extra = self.search(search_workers=2, patience=1)
+        self.assertTrue(df_parallel.drop(columns='train_sec').equals(df.drop(columns='train_sec')))
+        self.assertEqual(extra['evaluated'], len(df))
+        self.assertLessEqual(extra['submitted'], len(df) + 1)
+
+
+@requires_mecab
+class TestTransform(unittest.TestCase):
+    def setUp(self):
+        # 推定が収束するようにiterationsを増やす（初期値によって別の解に収束するドキュメントがあるので乱数を固定する）
+        np.random.seed(0)
+        self.t = fit(iterations=50)
+        self.unknown = 'グーテンベルク銀河系のアルゴリズム論'
+        self.assertFalse(set(self.t.m.tokenize(self.unknown, is_list=True)) & set(self.t._dictionary.token2id) - {'の'})
+
+    def test_training_docs(self):
+        # 学習したドキュメントは、学習時のスコアとほぼ同じになる（推定の初期値が乱数なので完全には一致しない。学習時は閾値以下のスコアが0）
+        result = self.t.transform([doc[1] for doc in DATA])
+        self.assertEqual(result.shape, (len(DATA), 3))
+        np.testing.assert_allclose(result.sum(axis=1), 1)
+        np.testing.assert_allclose(result, self.t._doc_topic.toarray(), atol=0.02)
+        # batch_sizeで分割しても、イテラブルでも同じ
+        sparse = self.t.transform((doc[1] for doc in DATA), batch_size=7, is_sparse=True)
+        self.assertEqual(sparse.shape, (len(DATA), 3))
+        np.testing.assert_allclose(sparse.toarray(), self.t._doc_topic.toarray(), atol=0.02)
+
+    def test_unknown_terms(self):
+        # 辞書にない単語は無視する
+        result = self.t.transform([DATA[0][1], DATA[0][1] + '。' + self.unknown, self.unknown, ''])
+        np.testing.assert_allclose(result[1], result[0], atol=1e-3)
+        np.testing.assert_allclose(result[2], result[3])
+        self.assertEqual(self.t.transform([]).shape, (0, 3))
+
+
+@requires_mecab
+class TestExportPlots(unittest.TestCase):
+    def setUp(self):
+        import matplotlib
+        self.font_path = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', 'DejaVuSans.ttf')
+        self.path = tempfile.mkdtemp()
+
+    def mtimes(self):
+        return {fname: os.stat(os.path.join(self.path, fname)).st_mtime_ns for fname in os.listdir(self.path)}
+
+    def test_skip_unchanged(self):
+        t = fit()
+        df = t.export_plots(self.path, workers=1, font_path=self.font_path)
+        self.assertEqual(sorted(df['file']), sorted(['topic_{:03d}.png'.format(topic) for topic in t._topic_list] + ['topic_doccnt.png']))
+        self.assertFalse(df['is_skipped'].any())
+        mtimes = self.mtimes()
+        # 2回目は同じ内容なので、画像もmanifest.jsonも書き出しなおさない
+        df = t.export_plots(self.path, workers=2, font_path=self.font_path)
+        self.assertTrue(df['is_skipped'].all())
+        self.assertEqual(self.mtimes(), mtimes)
+        # 画像を削除した場合は、そのファイルだけ描画しなおす
+        os.remove(os.path.join(self.path, 'topic_doccnt.png'))
+        df = t.export_plots(self.path, workers=1, font_path=self.font_path)
+        self.assertEqual(df.loc[~df['is_skipped'], 'file'].tolist(), ['topic_doccnt.png'])
+
+    def test_empty_topics(self):
+        # どのドキュメントにもトピックのスコアがない場合は、空の棒グラフだけを書き出す
+        t = fit(topic_doc_threshold=1.0)
+        self.assertTrue(t._topic_df.empty)
+        df = t.export_plots(self.path, workers=1, font_path=self.font_path)
+        self.assertEqual(df['file'].tolist(), ['topic_doccnt.png'])
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'topic_doccnt.png')))
+
+
+@requires_mecab
+class TestMulticore(unittest.TestCase):
+    def test_alpha_auto_fallback(self):
+        # multicoreはalpha='auto'で学習できないので、警告を出してsingleで学習する（警告は呼び出し元の行を指す）
+        with self.assertWarns(UserWarning) as cm:
+            t = fit(lda_mode='multicore', alpha='auto', workers=2)
+        self.assertIn("alpha='auto'", str(cm.warning))
+        self.assertEqual(cm.filename, __file__)
+        self.assertEqual(t._lda_mode, 'single')
+        self.assertNotIsInstance(t._lda, gensim.models.ldamulticore.LdaMulticore)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UserWarning)
+            t = fit(lda_mode='multicore', workers=2)
+        self.assertEqual(t._alpha, 'symmetric')
+        with self.assertRaises(ValueError):
+            fit(lda_mode='gpu')
+
+    def test_save_load_update(self):
+        t = fit(lda_mode='multicore', workers=2)
+        self.assertIsInstance(t._lda, gensim.models.ldamulticore.LdaMulticore)
+        path = tempfile.mkdtemp()
+        t.save(path)
+        loaded = ToolsNLP.TopicModelWrapper.load(path, mmap=True)
+        self.assertEqual(loaded._lda_mode, 'multicore')
+        self.assertIsInstance(loaded._lda, gensim.models.ldamulticore.LdaMulticore)
+        assert_sparse_equal(loaded._doc_topic, t._doc_topic)
+        loaded.update(NEW_DATA)
+        self.assertEqual(loaded._lda.num_terms, len(loaded._dictionary))
+        self.assertEqual(loaded._doc_topic.shape, (len(DATA) + len(NEW_DATA), 3))
+        loaded.save(path)
+        loaded = ToolsNLP.TopicModelWrapper.load(path)
+        self.assertEqual(loaded._doc_topic.shape, (len(DATA) + len(NEW_DATA), 3))
+        self.assertEqual(loaded.transform(SENTENCES).shape, (len(SENTENCES), 3))
+
+
+@requires_mecab
+class TestStageStats(unittest.TestCase):
+    def test_stages(self):
+        received = []
+        with self.assertLogs('ToolsNLP', level='INFO') as cm:
+            t = fit(dedup_threshold=0.9, callbacks=[received.append])
+        df = t.get_stage_stats()
+        self.assertEqual(df['stage'].tolist(), ['tokenize', 'dedup', 'corpus', 'train', 'output'])
+        self.assertEqual([stats.stage for stats in received], df['stage'].tolist())
+        self.assertEqual(sum('stage ' in line for line in cm.output), len(df))
+        self.assertTrue((df['wall_sec'] >= 0).all())
+        stats = df.set_index('stage')
+        self.assertEqual(stats.loc['tokenize', 'docs'], len(DATA))
+        self.assertEqual(stats.loc['dedup', 'extra']['duplicates'], len(t.get_duplicate_list()))
+        self.assertEqual(stats.loc['output', 'docs'], len(DATA))
+        # tokenizeのextraは形態素解析の時間（tokenize_workers=1の場合）
+        extra = stats.loc['tokenize', 'extra']
+        self.assertEqual(extra['sentences'], len(DATA))
+        self.assertEqual(extra['tokens'], stats.loc['tokenize', 'tokens'])
+        self.assertGreater(stats.loc['tokenize', 'docs_per_sec'], 0)
+        # updateのステージも追記する
+        t.update(DATA[:4])
+        self.assertEqual(t.get_stage_stats()['stage'].tolist()[5:], ['tokenize', 'train', 'output'])
+        self.assertEqual(t.get_stage_stats()['docs'].tolist()[5:], [4, 4, 4])
+
+
+@requires_mecab
+class TestTopDocs(unittest.TestCase):
+    def baseline(self, t, topic_count, top_n):
+        # 全件をソートした結果（同じスコアはドキュメントの番号順）
+        weight = t._doc_topic.toarray()
+        rows = []
+        for topic in t._topic_list[:topic_count]:
+            docs = sorted(np.flatnonzero(weight[:, topic]).tolist(), key=lambda d: (-weight[d, topic], d))
+            rows.extend((d, topic, t._urls[d], weight[d, topic]) for d in docs[:top_n])
+        return rows
+
+    def assert_baseline(self, t, topic_count, top_n):
+        df = t.get_topic2topdoc_list(topic_count=topic_count, top_n=top_n)
+        self.assertEqual(list(df.columns), ['topic', 'url', 'weight'])
+        self.assertEqual([(d, topic, url, weight) for d, (topic, url, weight) in zip(df.index, df.values.tolist())], self.baseline(t, topic_count, top_n))
+
+    def test_model(self):
+        t = fit()
+        for topic_count, top_n in ((20, 10), (2, 5), (3, 1), (3, 100), (3, 0)):
+            self.assert_baseline(t, topic_count, top_n)
+
+    def test_ties(self):
+        # 同じスコアが上位n件の境界にある場合と、ドキュメント数がtop_n未満のトピック
+        t = fit()
+        weight = np.zeros((len(DATA), 3))
+        weight[:, 0] = np.round(np.random.RandomState(0).rand(len(DATA)), 1)
+        weight[[5, 9, 40, 41, 59], 1] = [0.5, 0.5, 0.9, 0.5, 0.5]
+        weight[[3, 30], 2] = 0.7
+        t._doc_topic = scipy.sparse.csr_matrix(weight)
+        t._topic_list = [0, 1, 2]
+        for top_n in (1, 2, 3, 5, 10, 30):
+            self.assert_baseline(t, 3, top_n)
+        df = t.get_topic2topdoc_list(top_n=3)
+        self.assertEqual(df[df['topic'] == 1].index.tolist(), [40, 5, 9])
+        self.assertEqual(df[df['topic'] == 2].index.tolist(), [3, 30])
+
+
+if __name__ == '__main__':
+    unittest.main()